@@ -1,16 +1,47 @@
 import asyncio
+import contextlib
+import json
 import logging
 import os
 import traceback
 import uuid
+from urllib.parse import quote
 
-from fastapi import APIRouter, File, Form, UploadFile, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+import aiofiles
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
 
 from app.models.schemas import ExtractResponse, GenerateRequest, WordEntry, WorkbookGenerateRequest, HanjaGenerateRequest
-from app.services.ai_extractor import extract_words, extract_workbook, detect_workbook_type, detect_and_extract_workbook, extract_hanja
-from app.services.word_generator import generate_word, generate_hanja_word
-from app.services.workbook_generator import generate_workbook
+from app.services.ai_extractor import (
+    EXTRACT_BATCH_SIZE,
+    EXTRACT_HANJA_PROMPT,
+    EXTRACT_JSON_PROMPT,
+    EXTRACT_TSV_PROMPT,
+    WORKBOOK_COMBINED_JSON_PROMPT,
+    WORKBOOK_COMBINED_TSV_PROMPT,
+    extract_words,
+    extract_workbook,
+    detect_workbook_type,
+    detect_and_extract_workbook,
+    extract_hanja,
+    stream_words,
+    stream_workbook,
+    extraction_flight,
+    extract_words_batch,
+    extract_hanja_batch,
+    detect_and_extract_workbook_batch,
+)
+from app.services.artifact_cache import artifact_cache
+from app.services.extraction_cache import extraction_cache
+from app.services.provider_router import provider_router
+from app.services.rate_limiter import limiter_stats
+from app.services.usage_stats import usage_stats
+from app.services.image_preprocessor import MEDIA_TYPE_EXTENSIONS, preprocess_image, summarize_stats
+from app.services.generation_pool import generation_pool
+from app.services.job_manager import jobs
+from app.services.multipart_stream import UploadRejected, iter_image_parts
+from app.services.temp_janitor import janitor
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -18,60 +49,316 @@ router = APIRouter(prefix="/api")
 
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "temp")
 
+# Max pages extracted at the same time within one upload request
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+# Preprocessed pages of one upload kept in memory; pages past this are spilled to UPLOAD_DIR
+UPLOAD_MEMORY_LIMIT = int(float(os.getenv("UPLOAD_MEMORY_LIMIT_MB", "64")) * 1024 * 1024)
+# Limits enforced while a pipelined upload is still arriving
+UPLOAD_MAX_FILE_BYTES = int(float(os.getenv("UPLOAD_MAX_FILE_MB", "20")) * 1024 * 1024)
+UPLOAD_MAX_TOTAL_BYTES = int(float(os.getenv("UPLOAD_MAX_TOTAL_MB", "200")) * 1024 * 1024)
+
+
+def _validate_image_files(files: list[UploadFile]):
+    """Reject the whole upload before any work if one of the files is not an image."""
+    for file in files:
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"이미지 파일만 업로드 가능합니다: {file.filename}",
+            )
+
+
+async def _load_upload(file: UploadFile, log_prefix: str, spill: bool):
+    """Preprocess an uploaded image. Returns (page, ImageStats).
+
+    ``page`` is the preprocessed bytes, or with ``spill`` the path of a temp file
+    in UPLOAD_DIR written without blocking the event loop.
+    """
+    content = await file.read()
+    image = await asyncio.to_thread(preprocess_image, content)
+    if not spill:
+        logger.info(f"{log_prefix}Loaded: {file.filename} ({len(content)} -> {len(image.data)} bytes)")
+        return image.data, image.stats
+    ext = os.path.splitext(file.filename or "img.jpg")[1]
+    temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{MEDIA_TYPE_EXTENSIONS.get(image.media_type, ext)}")
+    async with aiofiles.open(temp_path, "wb") as f:
+        await f.write(image.data)
+    logger.info(f"{log_prefix}Spilled: {temp_path} ({len(content)} -> {len(image.data)} bytes)")
+    return temp_path, image.stats
+
+
+def _remove_temp_files(pages):
+    """Delete the spilled pages (paths); in-memory pages need no cleanup."""
+    for page in pages:
+        if isinstance(page, str):
+            # Already gone (or not removable) is no reason to fail the request or the job worker
+            with contextlib.suppress(OSError):
+                os.remove(page)
+
+
+async def _load_uploads(files: list[UploadFile], log_prefix: str):
+    """Preprocess every upload, keeping pages in memory up to UPLOAD_MEMORY_LIMIT and spilling the rest."""
+    loaded = []
+    in_memory = 0
+    try:
+        for file in files:
+            logger.info(f"{log_prefix}Processing file: {file.filename}, type: {file.content_type}")
+            page, stats = await _load_upload(file, log_prefix, spill=in_memory >= UPLOAD_MEMORY_LIMIT)
+            if isinstance(page, bytes):
+                in_memory += len(page)
+            loaded.append((page, stats))
+    except Exception:
+        _remove_temp_files(page for page, _ in loaded)
+        raise
+    return loaded
+
+
+async def _page_bytes(page) -> bytes:
+    if isinstance(page, bytes):
+        return page
+    async with aiofiles.open(page, "rb") as f:
+        return await f.read()
+
+
+def _submit_job(kind: str, loaded, extract, merge, extract_batch=None):
+    """Queue the loaded pages as a background job and answer 202 with its id."""
+    pages = [page for page, _ in loaded]
+    image_stats = summarize_stats([stats for _, stats in loaded])
+
+    async def extract_page(page):
+        return await extract(await _page_bytes(page))
+
+    async def extract_pages(batch):
+        return await extract_batch([await _page_bytes(page) for page in batch])
+
+    job = jobs.submit(
+        kind, pages, extract_page, merge, image_stats,
+        cleanup=lambda: _remove_temp_files(pages),
+        extract_batch=extract_pages if extract_batch is not None else None,
+        batch_size=EXTRACT_BATCH_SIZE,
+    )
+    return _job_accepted(job)
+
+
+def _job_accepted(job) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "total_pages": len(job.pages), "image_stats": job.image_stats},
+    )
+
+
+async def _pipelined_upload(request: Request, kind: str, extract, merge, log_prefix: str):
+    """Extract each page of a multipart upload as soon as it has arrived, then answer 202 with the job id.
+
+    By the time the last page is received the first ones are usually extracted
+    already. Size limits and image checks reject the upload before the rest of
+    the body has to be sent.
+    """
+    stats = []
+
+    async def incoming():
+        async for part in iter_image_parts(request, "files", UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_TOTAL_BYTES):
+            image = await asyncio.to_thread(preprocess_image, part.data)
+            logger.info(f"{log_prefix}Received: {part.filename} ({len(part.data)} -> {len(image.data)} bytes)")
+            stats.append(image.stats)
+            yield image.data
+        if not stats:
+            raise UploadRejected(400, "파일을 선택해주세요.")
+
+    try:
+        job = await jobs.run_incoming(kind, incoming(), extract, merge)
+    except UploadRejected as e:
+        logger.warning(f"{log_prefix}Upload rejected: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ClientDisconnect:
+        logger.warning(f"{log_prefix}Client disconnected after {len(stats)} pages")
+        raise HTTPException(status_code=400, detail="업로드가 중단되었습니다.")
+    job.set_image_stats(summarize_stats(stats))
+    return _job_accepted(job)
+
+
+def _merge_words(results: list[list[dict]]) -> dict:
+    all_words = []
+    seen = set()
+    for words in results:
+        for w in words:
+            key = (w["chinese"], w["pinyin"])
+            if key not in seen:
+                seen.add(key)
+                all_words.append(w)
+    return {"words": [{"chinese": w["chinese"], "pinyin": w["pinyin"], "korean": w["korean"]} for w in all_words]}
+
+
+def _merge_hanja(results: list[list[dict]]) -> dict:
+    all_words = []
+    seen = set()
+    for words in results:
+        for w in words:
+            key = (w.get("hanja", ""), w.get("eum", ""))
+            if key not in seen:
+                seen.add(key)
+                all_words.append(w)
+    return {"words": [{"hanja": w.get("hanja",""), "hun": w.get("hun",""), "eum": w.get("eum","")} for w in all_words]}
+
+
+def _merge_workbook(results: list[dict]) -> dict:
+    merged = {"type1_entries": [], "type2_entries": [], "type3_entries": [], "type4_entries": []}
+    for result in results:
+        if result["type"] == "type1":
+            merged["type1_entries"].extend(result["entries"])
+        elif result["type"] == "type3":
+            merged["type3_entries"].extend(result["entries"])
+        elif result["type"] == "type4":
+            merged["type4_entries"].extend(result["entries"])
+        else:
+            merged["type2_entries"].extend(result["entries"])
+    return merged
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_pages_in_order(pages: list, stream_fn):
+    """Stream every page concurrently (bounded) but yield ``(page, kind, item)`` in page order.
+
+    Page 0 is relayed live; later pages buffer in their queue until every earlier
+    page has finished, so merged results keep upload order. ``kind`` is "item",
+    "done" or "error" (item = error message).
+    """
+    semaphore = asyncio.Semaphore(EXTRACT_CONCURRENCY)
+    queues = [asyncio.Queue() for _ in pages]
+
+    async def pump(page, source):
+        try:
+            async with semaphore:
+                async for item in stream_fn(await _page_bytes(source)):
+                    await queues[page].put(("item", item))
+            await queues[page].put(("done", None))
+        except Exception as e:
+            logger.error(f"Stream error on page {page}: {traceback.format_exc()}")
+            await queues[page].put(("error", f"{type(e).__name__}: {str(e)}"))
+
+    tasks = [asyncio.create_task(pump(page, source)) for page, source in enumerate(pages)]
+    try:
+        for page, queue in enumerate(queues):
+            while True:
+                kind, item = await queue.get()
+                yield page, kind, item
+                if kind != "item":
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 # ===== 단어장 API =====
 
 @router.post("/upload")
 async def upload_images(files: list[UploadFile] = File(...)):
-    """Upload one or more images and extract Chinese words."""
+    """Upload one or more images and queue Chinese word extraction.
+
+    Returns 202 with a ``job_id`` right away; the words arrive in the job's
+    ``result`` (see ``GET /api/jobs/{job_id}``).
+    """
     try:
         if not files:
             raise HTTPException(status_code=400, detail="파일을 선택해주세요.")
 
-        job_id = str(uuid.uuid4())
         os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _validate_image_files(files)
+        loaded = await _load_uploads(files, "")
 
-        all_words = []
-        seen = set()
+        async def process_image(image):
+            words = await extract_words(image)
+            logger.info(f"Extracted {len(words)} words")
+            return words
 
-        for file in files:
-            logger.info(f"Processing file: {file.filename}, type: {file.content_type}")
+        return _submit_job("words", loaded, process_image, _merge_words, extract_words_batch)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Upload error: {traceback.format_exc()}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
+        )
+
+
+@router.post("/upload/pipelined")
+async def upload_images_pipelined(request: Request):
+    """Like /upload, but each page starts extracting while later pages are still uploading."""
+    try:
+        async def process_image(image):
+            words = await extract_words(image)
+            logger.info(f"[Pipelined] Extracted {len(words)} words")
+            return words
+
+        return await _pipelined_upload(request, "words", process_image, _merge_words, "[Pipelined] ")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Pipelined upload error: {traceback.format_exc()}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
+        )
 
-            if not file.content_type or not file.content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"이미지 파일만 업로드 가능합니다: {file.filename}",
-                )
 
-            ext = os.path.splitext(file.filename or "img.jpg")[1]
-            temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
-            content = await file.read()
-            with open(temp_path, "wb") as f:
-                f.write(content)
+@router.post("/upload/stream")
+async def upload_images_stream(files: list[UploadFile] = File(...)):
+    """Like /upload, but stream each extracted word as a server-sent event as soon as it is parsed.
 
-            logger.info(f"Saved temp file: {temp_path} ({len(content)} bytes)")
+    Events: ``word`` {page, word}, ``page_done`` {page}, ``page_error`` {page, detail},
+    then ``done`` {job_id, count, image_stats}.
+    """
+    try:
+        if not files:
+            raise HTTPException(status_code=400, detail="파일을 선택해주세요.")
 
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _validate_image_files(files)
+        loaded = await _load_uploads(files, "[Stream] ")
+        job = jobs.create("words", len(loaded), summarize_stats([stats for _, stats in loaded]))
+
+        async def events():
+            seen = set()
+            words = []
+            counts = [0] * len(loaded)
+            job.start()
             try:
-                words = await extract_words(temp_path)
-                logger.info(f"Extracted {len(words)} words")
-                for w in words:
-                    key = (w["chinese"], w["pinyin"])
-                    if key not in seen:
+                async for page, kind, item in _stream_pages_in_order([page for page, _ in loaded], stream_words):
+                    if kind == "item":
+                        job.start_page(page)
+                        key = (item.get("chinese", ""), item.get("pinyin", ""))
+                        if key in seen:
+                            continue
                         seen.add(key)
-                        all_words.append(w)
+                        counts[page] += 1
+                        word = {"chinese": item.get("chinese", ""), "pinyin": item.get("pinyin", ""), "korean": item.get("korean", "")}
+                        words.append(word)
+                        yield _sse("word", {"page": page, "word": word})
+                    elif kind == "done":
+                        job.finish_page(page, counts[page])
+                        yield _sse("page_done", {"page": page})
+                    else:
+                        job.fail_page(page, f"서버 오류: {item}")
+                        yield _sse("page_error", {"page": page, "detail": f"서버 오류: {item}"})
+                job.complete({"words": words})
+                yield _sse("done", {"job_id": job.id, "count": len(seen), "image_stats": job.image_stats})
             finally:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                if not job.finished:
+                    job.fail("스트림이 중단되었습니다.")
+                _remove_temp_files(page for page, _ in loaded)
 
-        return {
-            "job_id": job_id,
-            "words": [{"chinese": w["chinese"], "pinyin": w["pinyin"], "korean": w["korean"]} for w in all_words],
-        }
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Upload error: {traceback.format_exc()}")
+        logger.error(f"Stream upload error: {traceback.format_exc()}")
         return JSONResponse(
             status_code=500,
             content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
@@ -86,8 +373,7 @@ async def generate_docx(request: GenerateRequest):
         if not words:
             raise HTTPException(status_code=400, detail="단어 목록이 비어있습니다.")
 
-        output_path = generate_word(words, request.job_id)
-        file_id = os.path.splitext(os.path.basename(output_path))[0]
+        file_id = await artifact_cache.generate("word", request.job_id, words)
 
         return {"download_id": file_id}
     except HTTPException:
@@ -100,69 +386,79 @@ async def generate_docx(request: GenerateRequest):
         )
 
 
-@router.get("/download/{download_id}")
-async def download_file(download_id: str):
-    """Download the generated Word file."""
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def _download_response(download_id: str, filename: str):
+    """Stream the document from the in-memory artifact store, or send its file from UPLOAD_DIR."""
+    data = artifact_cache.read(download_id)
+    if data is not None:
+        def chunks():
+            for start in range(0, len(data), DOWNLOAD_CHUNK_BYTES):
+                yield data[start:start + DOWNLOAD_CHUNK_BYTES]
+
+        return StreamingResponse(chunks(), media_type=DOCX_MEDIA_TYPE, headers={
+            "Content-Length": str(len(data)),
+            # Same header FileResponse sends for a non-ASCII filename
+            "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        })
+
     file_path = os.path.join(UPLOAD_DIR, f"{download_id}.docx")
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="파일을 찾을 수 없습니다.")
+    janitor.touch(file_path)
+    return FileResponse(path=file_path, filename=filename, media_type=DOCX_MEDIA_TYPE)
 
-    return FileResponse(
-        path=file_path,
-        filename="중국어단어장.docx",
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-    )
+
+@router.get("/download/{download_id}")
+async def download_file(download_id: str):
+    """Download the generated Word file."""
+    return _download_response(download_id, "중국어단어장.docx")
 
 
 # ===== 한자 단어장 API =====
 
 @router.post("/hanja/upload")
 async def hanja_upload_images(files: list[UploadFile] = File(...)):
-    """Upload hanja textbook images and extract hanja/hun/eum."""
+    """Upload hanja textbook images and queue hanja/hun/eum extraction (202 + job_id)."""
     try:
         if not files:
             raise HTTPException(status_code=400, detail="파일을 선택해주세요.")
 
-        job_id = str(uuid.uuid4())
         os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _validate_image_files(files)
+        loaded = await _load_uploads(files, "[Hanja] ")
 
-        all_words = []
-        seen = set()
+        async def process_image(image):
+            words = await extract_hanja(image)
+            logger.info(f"[Hanja] Extracted {len(words)} entries")
+            return words
 
-        for file in files:
-            if not file.content_type or not file.content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"이미지 파일만 업로드 가능합니다: {file.filename}",
-                )
-            ext = os.path.splitext(file.filename or "img.jpg")[1]
-            temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
-            content = await file.read()
-            with open(temp_path, "wb") as f:
-                f.write(content)
-            logger.info(f"[Hanja] Saved: {temp_path} ({len(content)} bytes)")
+        return _submit_job("hanja", loaded, process_image, _merge_hanja, extract_hanja_batch)
 
-            try:
-                words = await extract_hanja(temp_path)
-                logger.info(f"[Hanja] Extracted {len(words)} entries")
-                for w in words:
-                    key = (w.get("hanja", ""), w.get("eum", ""))
-                    if key not in seen:
-                        seen.add(key)
-                        all_words.append(w)
-            finally:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Hanja upload error: {traceback.format_exc()}")
+        return JSONResponse(status_code=500, content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"})
 
-        return {
-            "job_id": job_id,
-            "words": [{"hanja": w.get("hanja",""), "hun": w.get("hun",""), "eum": w.get("eum","")} for w in all_words],
-        }
+
+@router.post("/hanja/upload/pipelined")
+async def hanja_upload_images_pipelined(request: Request):
+    """Like /hanja/upload, but each page starts extracting while later pages are still uploading."""
+    try:
+        async def process_image(image):
+            words = await extract_hanja(image)
+            logger.info(f"[Hanja Pipelined] Extracted {len(words)} entries")
+            return words
+
+        return await _pipelined_upload(request, "hanja", process_image, _merge_hanja, "[Hanja Pipelined] ")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Hanja upload error: {traceback.format_exc()}")
+        logger.error(f"Hanja pipelined upload error: {traceback.format_exc()}")
         return JSONResponse(status_code=500, content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"})
 
 
@@ -174,8 +470,7 @@ async def hanja_generate_docx(request: HanjaGenerateRequest):
         if not words:
             raise HTTPException(status_code=400, detail="단어 목록이 비어있습니다.")
 
-        output_path = generate_hanja_word(words, request.job_id)
-        file_id = os.path.splitext(os.path.basename(output_path))[0]
+        file_id = await artifact_cache.generate("hanja", request.job_id, words)
         return {"download_id": file_id}
 
     except HTTPException:
@@ -188,14 +483,7 @@ async def hanja_generate_docx(request: HanjaGenerateRequest):
 @router.get("/hanja/download/{download_id}")
 async def hanja_download_file(download_id: str):
     """Download the generated hanja Word file."""
-    file_path = os.path.join(UPLOAD_DIR, f"{download_id}.docx")
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="파일을 찾을 수 없습니다.")
-    return FileResponse(
-        path=file_path,
-        filename="한자단어장.docx",
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-    )
+    return _download_response(download_id, "한자단어장.docx")
 
 
 # ===== 워크북 API =====
@@ -204,74 +492,100 @@ async def hanja_download_file(download_id: str):
 async def workbook_upload_images(
     files: list[UploadFile] = File(...),
 ):
-    """Upload images, auto-detect type, and extract workbook content."""
+    """Upload images and queue type detection + workbook extraction (202 + job_id)."""
     try:
         if not files:
             raise HTTPException(status_code=400, detail="파일을 선택해주세요.")
 
-        job_id = str(uuid.uuid4())
         os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _validate_image_files(files)
+        loaded = await _load_uploads(files, "[Workbook] ")
 
-        all_entries_type1 = []
-        all_entries_type2 = []
-        all_entries_type3 = []
-        all_entries_type4 = []
+        # Single API call per image: type detection and extraction together
+        async def process_image(image):
+            result = await detect_and_extract_workbook(image)
+            logger.info(f"[Workbook] {result['type']}, {len(result['entries'])} entries")
+            return result
 
-        # Save all files first and validate
-        temp_paths = []
-        for file in files:
-            if not file.content_type or not file.content_type.startswith("image/"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"이미지 파일만 업로드 가능합니다: {file.filename}",
-                )
+        return _submit_job("workbook", loaded, process_image, _merge_workbook, detect_and_extract_workbook_batch)
 
-            ext = os.path.splitext(file.filename or "img.jpg")[1]
-            temp_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}{ext}")
-            content = await file.read()
-            with open(temp_path, "wb") as f:
-                f.write(content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Workbook upload error: {traceback.format_exc()}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
+        )
 
-            logger.info(f"[Workbook] Saved: {temp_path} ({len(content)} bytes)")
-            temp_paths.append((file.filename, temp_path))
 
-        try:
-            # Process all images in parallel (single API call per image)
-            async def process_image(filename, path):
-                result = await detect_and_extract_workbook(path)
-                logger.info(f"[Workbook] {filename} -> {result['type']}, {len(result['entries'])} entries")
-                return result
-
-            results = await asyncio.gather(
-                *[process_image(fn, tp) for fn, tp in temp_paths]
-            )
+@router.post("/workbook/upload/pipelined")
+async def workbook_upload_images_pipelined(request: Request):
+    """Like /workbook/upload, but each page starts extracting while later pages are still uploading."""
+    try:
+        async def process_image(image):
+            result = await detect_and_extract_workbook(image)
+            logger.info(f"[Workbook Pipelined] {result['type']}, {len(result['entries'])} entries")
+            return result
 
-            for result in results:
-                if result["type"] == "type1":
-                    all_entries_type1.extend(result["entries"])
-                elif result["type"] == "type3":
-                    all_entries_type3.extend(result["entries"])
-                elif result["type"] == "type4":
-                    all_entries_type4.extend(result["entries"])
-                else:
-                    all_entries_type2.extend(result["entries"])
-        finally:
-            for _, temp_path in temp_paths:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-
-        return {
-            "job_id": job_id,
-            "type1_entries": all_entries_type1,
-            "type2_entries": all_entries_type2,
-            "type3_entries": all_entries_type3,
-            "type4_entries": all_entries_type4,
-        }
+        return await _pipelined_upload(request, "workbook", process_image, _merge_workbook, "[Workbook Pipelined] ")
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Workbook upload error: {traceback.format_exc()}")
+        logger.error(f"Workbook pipelined upload error: {traceback.format_exc()}")
+        return JSONResponse(
+            status_code=500,
+            content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
+        )
+
+
+@router.post("/workbook/upload/stream")
+async def workbook_upload_images_stream(files: list[UploadFile] = File(...)):
+    """Like /workbook/upload, but stream each entry as a server-sent event as soon as it is parsed.
+
+    Events: ``entry`` {page, type, entry}, ``page_done`` {page}, ``page_error`` {page, detail},
+    then ``done`` {job_id, image_stats}.
+    """
+    try:
+        if not files:
+            raise HTTPException(status_code=400, detail="파일을 선택해주세요.")
+
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        _validate_image_files(files)
+        loaded = await _load_uploads(files, "[Workbook Stream] ")
+        job = jobs.create("workbook", len(loaded), summarize_stats([stats for _, stats in loaded]))
+
+        async def events():
+            pages = [{"type": None, "entries": []} for _ in loaded]
+            job.start()
+            try:
+                async for page, kind, item in _stream_pages_in_order([page for page, _ in loaded], stream_workbook):
+                    if kind == "item":
+                        job.start_page(page)
+                        wb_type, entry = item
+                        pages[page]["type"] = wb_type
+                        pages[page]["entries"].append(entry)
+                        yield _sse("entry", {"page": page, "type": wb_type, "entry": entry})
+                    elif kind == "done":
+                        job.finish_page(page, len(pages[page]["entries"]))
+                        yield _sse("page_done", {"page": page})
+                    else:
+                        job.fail_page(page, f"서버 오류: {item}")
+                        yield _sse("page_error", {"page": page, "detail": f"서버 오류: {item}"})
+                job.complete(_merge_workbook([p for p in pages if p["entries"]]))
+                yield _sse("done", {"job_id": job.id, "image_stats": job.image_stats})
+            finally:
+                if not job.finished:
+                    job.fail("스트림이 중단되었습니다.")
+                _remove_temp_files(page for page, _ in loaded)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Workbook stream upload error: {traceback.format_exc()}")
         return JSONResponse(
             status_code=500,
             content={"detail": f"서버 오류: {type(e).__name__}: {str(e)}"},
@@ -285,8 +599,7 @@ async def workbook_generate_docx(request: WorkbookGenerateRequest):
         if not request.entries:
             raise HTTPException(status_code=400, detail="데이터가 비어있습니다.")
 
-        output_path = generate_workbook(request.entries, request.workbook_type, request.job_id)
-        file_id = os.path.splitext(os.path.basename(output_path))[0]
+        file_id = await artifact_cache.generate("workbook", request.job_id, request.entries, request.workbook_type)
 
         return {"download_id": file_id}
     except HTTPException:
@@ -302,12 +615,106 @@ async def workbook_generate_docx(request: WorkbookGenerateRequest):
 @router.get("/workbook/download/{download_id}")
 async def workbook_download_file(download_id: str):
     """Download the generated workbook Word file."""
-    file_path = os.path.join(UPLOAD_DIR, f"{download_id}.docx")
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="파일을 찾을 수 없습니다.")
+    return _download_response(download_id, "중국어워크북.docx")
 
-    return FileResponse(
-        path=file_path,
-        filename="중국어워크북.docx",
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-    )
+
+# ===== 작업 (Job) API =====
+
+# Upper bound for one long-poll request, kept under common proxy timeouts
+JOB_POLL_MAX_WAIT = 25.0
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str, since: int = -1, wait: float = 0):
+    """Job state, per-page progress and (once finished) the result.
+
+    With ``wait`` > 0 this long-polls: it answers as soon as the job's ``version``
+    exceeds ``since`` or after ``wait`` seconds, whichever comes first.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+    if wait > 0:
+        await job.wait_for_change(since, min(wait, JOB_POLL_MAX_WAIT))
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent ``progress`` events on every job change, then one ``done`` event with the result."""
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="작업을 찾을 수 없습니다.")
+
+    async def events():
+        version = -1
+        while True:
+            await job.wait_for_change(version, JOB_POLL_MAX_WAIT)
+            if job.finished:
+                yield _sse("done", job.to_dict())
+                return
+            if job.version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = job.version
+            snapshot = job.to_dict()
+            snapshot.pop("result")
+            yield _sse("progress", snapshot)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/jobs")
+async def job_stats():
+    """Worker count, queue depth and job counts per state."""
+    return jobs.stats()
+
+
+# ===== 추출 캐시 API =====
+
+# Every prompt that can have produced a cache entry, whichever reply format made it
+CACHE_PROMPTS = {
+    "words": (EXTRACT_JSON_PROMPT, EXTRACT_TSV_PROMPT),
+    "hanja": (EXTRACT_HANJA_PROMPT,),
+    "workbook": (WORKBOOK_COMBINED_JSON_PROMPT, WORKBOOK_COMBINED_TSV_PROMPT),
+}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and sizes of the extraction cache, plus coalesced in-flight calls."""
+    return {**await asyncio.to_thread(extraction_cache.stats), "singleflight": extraction_flight.stats()}
+
+
+@router.delete("/cache")
+async def cache_invalidate(prompt: str | None = None):
+    """Invalidate cached extractions for one prompt (words/hanja/workbook) or all of them."""
+    if prompt is not None and prompt not in CACHE_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"알 수 없는 프롬프트입니다: {prompt}")
+    prompts = [None] if prompt is None else CACHE_PROMPTS[prompt]
+    removed = sum([await asyncio.to_thread(extraction_cache.invalidate, p) for p in prompts])
+    return {"removed": removed}
+
+
+@router.get("/generation/stats")
+async def generation_stats():
+    """Word generation worker processes, queue depth and completed/failed counts, plus the generated file cache."""
+    return {**generation_pool.stats(), "cache": artifact_cache.stats()}
+
+
+@router.get("/temp/stats")
+async def temp_stats():
+    """Files and bytes in temp/ and what the janitor has reclaimed."""
+    return janitor.stats()
+
+
+@router.get("/providers/stats")
+async def provider_stats():
+    """Adaptive concurrency limit, throttling counters, rate limit budgets, token usage and routing per provider."""
+    usage = usage_stats.stats()
+    limiters = limiter_stats()
+    routing = provider_router.stats()
+    return {
+        name: {**limiters[name], "usage": usage.get(name, {}), "router": routing[name]}
+        for name in limiters
+    }
@@ -1,5 +1,6 @@
 import os
 import traceback
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
@@ -7,10 +8,44 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
 
 from app.api.routes import router
+from app.services.ai_extractor import CACHED_PROMPTS
+from app.services.artifact_cache import artifact_cache
+from app.services.extraction_cache import extraction_cache
+from app.services.job_manager import jobs
+from app.services.provider_clients import clients
+from app.services.shared_store import shared_store
+from app.services.generation_pool import generation_pool
+from app.services.temp_janitor import janitor
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-app = FastAPI(title="중국어 단어장 생성기")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Provider clients (and their connection pools) live for the whole process
+    clients.startup()
+    # Cached results made with an older prompt text can never be hit again
+    extraction_cache.purge_stale_prompts(CACHED_PROMPTS)
+    # Upload endpoints queue extraction jobs for these workers and return at once
+    jobs.start()
+    # .docx generation runs in worker processes that each parse the Word templates once
+    generation_pool.start()
+    # Generated files from the last run can still be handed out for identical requests
+    artifact_cache.load()
+    # temp/ would otherwise only grow: expire and cap the generated files and upload leftovers
+    janitor.start()
+    try:
+        yield
+    finally:
+        await janitor.stop()
+        await jobs.stop()
+        generation_pool.stop()
+        await clients.aclose()
+        extraction_cache.close()
+        shared_store.close()
+
+
+app = FastAPI(title="중국어 단어장 생성기", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -32,6 +34,12 @@ class WorkbookType2Entry(BaseModel):
     chinese_text: str
 
 
+class WorkbookType3Entry(BaseModel):
+    """Row of a type3 (phrase examples) or type4 (textbook dialogue) page."""
+    chinese_text: str
+    korean: str
+
+
 class WorkbookExtractResponse(BaseModel):
     job_id: str
     entries: list[dict]
@@ -54,3 +62,33 @@ class HanjaEntry(BaseModel):
 class HanjaGenerateRequest(BaseModel):
     job_id: str
     words: list[HanjaEntry]
+
+
+# ===== Extraction Reply Models (structured outputs) =====
+
+class WordsReply(BaseModel):
+    words: list[WordEntry]
+
+
+class HanjaReply(BaseModel):
+    words: list[HanjaEntry]
+
+
+class WorkbookTypeReply(BaseModel):
+    type: Literal["type1", "type2", "type3", "type4"]
+
+
+class WorkbookReply(WorkbookTypeReply):
+    entries: list[WorkbookType1Entry | WorkbookType2Entry | WorkbookType3Entry]
+
+
+class WorkbookType1Reply(BaseModel):
+    entries: list[WorkbookType1Entry]
+
+
+class WorkbookType2Reply(BaseModel):
+    entries: list[WorkbookType2Entry]
+
+
+class WorkbookType3Reply(BaseModel):
+    entries: list[WorkbookType3Entry]
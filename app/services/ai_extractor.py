@@ -1,13 +1,47 @@
+import asyncio
 import base64
+import inspect
 import json
+import logging
 import os
 import re
+import statistics
+import time
+import unicodedata
+from collections import deque
+from functools import lru_cache
 
 from dotenv import load_dotenv
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from app.models.schemas import (
+    HanjaReply,
+    WordsReply,
+    WorkbookReply,
+    WorkbookType1Reply,
+    WorkbookType2Reply,
+    WorkbookType3Reply,
+    WorkbookTypeReply,
+)
+
+from app.services.extraction_cache import extraction_cache, prompt_hash
+from app.services.image_preprocessor import sniff_media_type
+from app.services.provider_clients import clients
+from app.services.provider_router import ProviderUnavailable, provider_router
+from app.services.rate_limiter import provider_limiter
+from app.services.singleflight import SingleFlight
+from app.services.stream_parser import IncrementalEntryParser, LineEntryParser
+from app.services.usage_stats import usage_stats
 
 load_dotenv()
 
-EXTRACT_PROMPT = """이미지에서 중국어 단어를 모두 추출하여 다음 JSON 형식으로만 응답하세요:
+logger = logging.getLogger("uvicorn.error")
+
+# "json": replies as JSON objects; "tsv": compact tab-separated rows, far fewer output tokens;
+# "structured": JSON constrained to the reply models in app/models/schemas.py (tool use / json_schema)
+EXTRACT_OUTPUT_FORMAT = os.getenv("EXTRACT_OUTPUT_FORMAT", "json").lower()
+
+EXTRACT_JSON_PROMPT = """이미지에서 중국어 단어를 모두 추출하여 다음 JSON 형식으로만 응답하세요:
 {"words": [{"chinese": "한자", "pinyin": "병음(성조 포함)", "korean": "한국어 뜻"}, ...]}
 
 규칙:
@@ -24,14 +58,60 @@ EXTRACT_PROMPT = """이미지에서 중국어 단어를 모두 추출하여 다
 7. 이미지에 중국어가 없으면 {"words": []}
 8. JSON 외 다른 텍스트는 절대 포함하지 마세요"""
 
+EXTRACT_TSV_PROMPT = """이미지에서 중국어 단어를 모두 추출하여 다음 형식으로만 응답하세요:
+#words
+한자\t병음(성조 포함)\t한국어 뜻
+...
+#end
+
+형식:
+- 첫 줄은 #words, 마지막 줄은 #end
+- 단어 하나당 한 줄, 세 칸을 탭 문자 하나로 구분합니다 (칸 안에는 탭과 줄바꿈을 쓰지 마세요)
+- 따옴표, JSON, 코드 블록 없이 값만 적으세요
+
+규칙:
+1. 병음 형식은 두 가지를 모두 지원합니다:
+   - 괄호 있음: "한자 [병음] 한국어 뜻" (예: 打扫 [dǎsǎo] 청소하다)
+   - 괄호 없음: "한자 pinyin 한국어 뜻" (예: 哪儿 nǎr 어디)
+   두 형식 모두 병음 칸에 성조 포함 병음을 적으세요
+2. 한자 앞의 * 기호는 제거하세요
+3. 한국어 뜻은 병음 뒤의 한글 텍스트 전체입니다
+4. "한자 [병음] / 한자 [병음] 한국어 뜻" 형식은 두 한자가 같은 뜻을 공유하는 것입니다. 각 한자를 같은 한국어 뜻으로 별도 줄에 적으세요
+   예시: "矮 [ǎi] / 低 [dī] 작다" →
+   矮\tǎi\t작다
+   低\tdī\t작다
+5. 반의어, 상위어, 하위어 등 섹션 제목(한국어만으로 된 텍스트)은 추출하지 마세요
+6. 여러 섹션이나 열에 걸쳐 배치된 단어도 빠짐없이 모두 추출하세요
+7. 이미지에 중국어가 없으면 #words 다음 줄에 바로 #end
+8. 이 형식 외 다른 텍스트는 절대 포함하지 마세요"""
+
+EXTRACT_PROMPT = EXTRACT_TSV_PROMPT if EXTRACT_OUTPUT_FORMAT == "tsv" else EXTRACT_JSON_PROMPT
+
+# Columns of a compact reply's rows, by the type named on its header line
+WORD_COLUMNS = {"words": ("chinese", "pinyin", "korean")}
+
+
+# Pages are passed around as in-memory bytes (uploads) or, for scripts, as file paths
+ImageInput = bytes | str
+
+
+def _read_image(image: ImageInput) -> bytes:
+    if isinstance(image, bytes):
+        return image
+    with open(image, "rb") as f:
+        return f.read()
+
 
-def _encode_image(file_path: str) -> str:
-    with open(file_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+def _encode_image(image: ImageInput) -> str:
+    return base64.b64encode(_read_image(image)).decode("utf-8")
 
 
-def _get_media_type(file_path: str) -> str:
-    ext = os.path.splitext(file_path)[1].lower()
+def _get_media_type(image: ImageInput) -> str:
+    # Trust the bytes over the name: preprocessing may re-encode e.g. a PNG upload as JPEG
+    sniffed = sniff_media_type(_read_image(image)[:16])
+    if sniffed or isinstance(image, bytes):
+        return sniffed or "image/jpeg"
+    ext = os.path.splitext(image)[1].lower()
     types = {
         ".jpg": "image/jpeg",
         ".jpeg": "image/jpeg",
@@ -42,62 +122,506 @@ def _get_media_type(file_path: str) -> str:
     return types.get(ext, "image/jpeg")
 
 
-async def extract_words_anthropic(file_path: str) -> list[dict]:
-    import anthropic
-
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    message = await client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": EXTRACT_PROMPT},
-                ],
-            }
+ANTHROPIC_MODEL = "claude-sonnet-4-5-20250929"
+OPENAI_MODEL = "gpt-4o"
+
+# Try a page on the smaller, faster model first and only send it to the model above
+# when its result fails the local checks (see "Model Tiers" below)
+EXTRACT_MODEL_TIERS = os.getenv("EXTRACT_MODEL_TIERS", "0") != "0"
+ANTHROPIC_FAST_MODEL = os.getenv("ANTHROPIC_FAST_MODEL", "claude-haiku-4-5-20251001")
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+
+extraction_flight = SingleFlight("extraction")
+
+# Reply budget of a single-page request; a reply cut off at it is continued in up to
+# EXTRACT_MAX_CONTINUATIONS further requests for the remaining entries
+EXTRACT_MAX_TOKENS = int(os.getenv("EXTRACT_MAX_TOKENS", "4096"))
+EXTRACT_MAX_CONTINUATIONS = max(0, int(os.getenv("EXTRACT_MAX_CONTINUATIONS", "2")))
+
+# Pages packed into one provider request by the *_batch functions (1 = one call per page)
+EXTRACT_BATCH_SIZE = max(1, int(os.getenv("EXTRACT_BATCH_SIZE", "1")))
+# Reply budget for a packed request; the per-page budget is EXTRACT_MAX_TOKENS
+BATCH_MAX_TOKENS = int(os.getenv("EXTRACT_BATCH_MAX_TOKENS", "16384"))
+
+
+def current_provider() -> str:
+    """The configured primary provider (AI_PROVIDER)."""
+    return os.getenv("AI_PROVIDER", "anthropic").lower()
+
+
+def model_for(provider: str) -> str:
+    return OPENAI_MODEL if provider == "openai" else ANTHROPIC_MODEL
+
+
+def _fast_model_for(provider: str) -> str:
+    return OPENAI_FAST_MODEL if provider == "openai" else ANTHROPIC_FAST_MODEL
+
+
+def _cache_keys(image: ImageInput, prompt: str, route: list[str], tiered: bool = False) -> dict[str, list[str]]:
+    """Extraction cache keys of the page for each provider of the route, the one to store under first.
+
+    A ``tiered`` result may come from the fast model, so it is stored under its
+    own key; results of the main model alone are still looked up after it.
+    """
+    data = _read_image(image)
+    keys = {}
+    for provider in route:
+        keys[provider] = [extraction_cache.make_key(data, prompt, provider, model_for(provider))]
+        if tiered:
+            model = f"{_fast_model_for(provider)}>{model_for(provider)}"
+            keys[provider].insert(0, extraction_cache.make_key(data, prompt, provider, model))
+    return keys
+
+
+async def _cached(keys: dict[str, list[str]]):
+    """The first cached result in route order (a page extracted during a failover counts too)."""
+    for provider_keys in keys.values():
+        for key in provider_keys:
+            cached = await extraction_cache.aget(key)
+            if cached is not None:
+                return cached
+    return None
+
+
+async def _run_extraction(image: ImageInput, prompt: str, anthropic_fn, openai_fn):
+    """Dispatch through the provider router, answering from the extraction cache when possible
+    and coalescing concurrent calls for the same image, prompt and model.
+
+    ``prompt`` is only used for the cache key; the provider functions embed it themselves.
+    A result is cached under the key of the provider that produced it.
+    """
+    route = provider_router.route()
+    keys = _cache_keys(image, prompt, route, tiered=EXTRACT_MODEL_TIERS)
+    cached = await _cached(keys)
+    if cached is not None:
+        return cached
+
+    calls = {"anthropic": lambda: anthropic_fn(image), "openai": lambda: openai_fn(image)}
+
+    async def extract_once():
+        provider, result = await provider_router.run(calls)
+        # Empty results are not cached so a flaky page can recover on the next upload
+        if isinstance(result, dict) and not result.get("entries"):
+            return result
+        if not result:
+            return result
+        await extraction_cache.aput(keys[provider][0], result, prompt)
+        return result
+
+    # Identical pages uploaded at the same time (a whole class, one worksheet) share one provider call
+    return await extraction_flight.do(keys[route[0]][0], extract_once)
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def _json_object(text: str):
+    """The JSON value starting at the first ``{`` of a reply, decoded in one linear pass.
+
+    Text before it (a code fence, a stray sentence) and after it is ignored.
+    Returns None when the reply has no ``{``; raises json.JSONDecodeError when
+    the value there does not decode (e.g. a reply cut off mid-object).
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    data, _ = _json_decoder.raw_decode(text, start)
+    return data
+
+
+async def _parse_raw(raw):
+    """Parse a with_raw_response result; parse() is a coroutine on some SDK versions."""
+    parsed = raw.parse()
+    if inspect.isawaitable(parsed):
+        parsed = await parsed
+    return parsed
+
+
+# The long static instructions go first (system), the page images last, so every page of
+# an upload shares the same cacheable prefix: Anthropic caches the system block marked with
+# cache_control, OpenAI caches matching prompt prefixes automatically (1024+ tokens).
+PAGE_INSTRUCTION = "위 지침에 따라 이 이미지를 분석하세요."
+
+BATCH_INSTRUCTION = """위 지침을 이미지마다 따로 적용하세요. 각 이미지 앞의 [페이지 N]이 페이지 번호입니다.
+이미지 {count}장의 결과를 다음 JSON 형식으로만 응답하세요:
+{{"pages": [{{"page": 0, ...페이지 0에 대한 지침의 JSON 필드...}}, {{"page": 1, ...}}, ...]}}
+모든 페이지를 빠짐없이 포함하고, 한 페이지의 내용을 다른 페이지에 섞지 마세요."""
+
+BATCH_TSV_INSTRUCTION = """위 지침을 이미지마다 따로 적용하세요. 각 이미지 앞의 [페이지 N]이 페이지 번호입니다.
+이미지 {count}장의 결과를 페이지 순서대로, 각 페이지의 출력 앞에 "#page N" 한 줄을 붙여 응답하세요:
+#page 0
+...페이지 0에 대한 지침의 출력 (#end 줄까지)...
+#page 1
+...
+모든 페이지를 빠짐없이 포함하고, 한 페이지의 내용을 다른 페이지에 섞지 마세요."""
+
+
+def _user_instruction(page_count: int, prompt: str) -> str:
+    if page_count == 1:
+        return PAGE_INSTRUCTION
+    instruction = BATCH_TSV_INSTRUCTION if prompt in _COMPACT_COLUMNS else BATCH_INSTRUCTION
+    return instruction.format(count=page_count)
+
+
+def anthropic_request(images: list[ImageInput], prompt: str) -> dict:
+    """Messages API arguments for ``images`` (several are labelled as pages), without model and max_tokens."""
+    content = []
+    for index, image in enumerate(images):
+        if len(images) > 1:
+            content.append({"type": "text", "text": f"[페이지 {index}]"})
+        content.append({
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": _get_media_type(image),
+                "data": _encode_image(image),
+            },
+        })
+    content.append({"type": "text", "text": _user_instruction(len(images), prompt)})
+    return {
+        "system": [
+            {"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}},
         ],
-    )
-    return _parse_response(message.content[0].text)
-
-
-async def extract_words_openai(file_path: str) -> list[dict]:
-    from openai import AsyncOpenAI
-
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{media_type};base64,{image_data}"
-                        },
-                    },
-                    {"type": "text", "text": EXTRACT_PROMPT},
-                ],
-            }
+        "messages": [{"role": "user", "content": content}],
+        **_structured_params("anthropic", prompt, len(images)),
+    }
+
+
+def openai_request(images: list[ImageInput], prompt: str) -> dict:
+    """Chat Completions arguments for ``images`` (several are labelled as pages), without model and max_tokens."""
+    content = []
+    for index, image in enumerate(images):
+        if len(images) > 1:
+            content.append({"type": "text", "text": f"[페이지 {index}]"})
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{_get_media_type(image)};base64,{_encode_image(image)}"
+            },
+        })
+    content.append({"type": "text", "text": _user_instruction(len(images), prompt)})
+    return {
+        "messages": [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": content},
         ],
-    )
-    return _parse_response(response.choices[0].message.content)
+        # Routes requests with the same prompt to the same cache shard
+        "prompt_cache_key": prompt_hash(prompt),
+        **_structured_params("openai", prompt, len(images)),
+    }
+
+
+async def _anthropic_complete(request: dict, max_tokens: int, model: str = ANTHROPIC_MODEL) -> tuple[str, bool]:
+    """The reply text, and whether it was cut off at ``max_tokens``."""
+    client = clients.anthropic()
+    raw = await provider_limiter("anthropic").call(lambda: client.messages.with_raw_response.create(
+        model=model,
+        max_tokens=max_tokens,
+        **request,
+    ))
+    message = await _parse_raw(raw)
+    usage_stats.record_anthropic(message.usage)
+    return anthropic_text(message), message.stop_reason == "max_tokens"
+
+
+async def _openai_complete(request: dict, max_tokens: int, model: str = OPENAI_MODEL) -> tuple[str, bool]:
+    """The reply text, and whether it was cut off at ``max_tokens``."""
+    client = clients.openai()
+    raw = await provider_limiter("openai").call(lambda: client.chat.completions.with_raw_response.create(
+        model=model,
+        max_tokens=max_tokens,
+        **request,
+    ))
+    response = await _parse_raw(raw)
+    usage_stats.record_openai(response.usage)
+    choice = response.choices[0]
+    return choice.message.content or "", choice.finish_reason == "length"
+
+
+async def _anthropic_vision(image: ImageInput, prompt: str, max_tokens: int = EXTRACT_MAX_TOKENS) -> str:
+    """Send one image + prompt to Anthropic on the pooled client and return the reply text."""
+    text, _ = await _anthropic_complete(anthropic_request([image], prompt), max_tokens)
+    return text
+
+
+async def _openai_vision(image: ImageInput, prompt: str, max_tokens: int = EXTRACT_MAX_TOKENS) -> str:
+    """Send one image + prompt to OpenAI on the pooled client and return the reply text."""
+    text, _ = await _openai_complete(openai_request([image], prompt), max_tokens)
+    return text
+
+
+CONTINUE_INSTRUCTION = """응답이 출력 길이 제한에 걸려 중간에 잘렸습니다. 지금까지 항목 {count}개를 받았고, 마지막으로 받은 항목은 다음과 같습니다:
+{last}
+그 다음 항목부터 남은 항목만, 위 지침과 같은 형식의 새 응답으로 처음부터 끝까지 작성하세요. 이미 받은 항목은 다시 쓰지 마세요."""
+
+
+def _entry_parser(prompt: str, array_key: str):
+    """Incremental parser for replies to ``prompt``: rows for the compact prompts, else JSON."""
+    columns = _COMPACT_COLUMNS.get(prompt)
+    return LineEntryParser(columns) if columns else IncrementalEntryParser(array_key)
+
+
+def _salvage(text: str, prompt: str, array_key: str) -> tuple[dict, list[dict]]:
+    """Top-level fields and every complete entry of a reply, even one cut off mid-entry."""
+    parser = _entry_parser(prompt, array_key)
+    entries = parser.feed(text)
+    model = _reply_model(prompt)
+    if model is not None:
+        # A structured reply cut off mid tool call can end in an incomplete entry
+        entries = [entry for entry in entries if _entry_valid(model, array_key, entry)]
+    return parser.fields, entries
+
+
+@lru_cache(maxsize=None)
+def _entry_adapter(model: type[BaseModel], array_key: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[array_key].annotation)
+
+
+def _entry_valid(model: type[BaseModel], array_key: str, entry: dict) -> bool:
+    try:
+        _entry_adapter(model, array_key).validate_python([entry])
+    except ValueError:
+        return False
+    return True
+
+
+async def _continue_reply(
+    provider: str, request: dict, prompt: str, array_key: str, text: str, model: str | None = None
+) -> tuple[dict, list[dict]]:
+    """Keep the complete entries of a page reply cut off at max_tokens and request the rest.
+
+    Each continuation sends the conversation so far (the page, the partial
+    reply as the assistant turn) and asks for only the entries after the last
+    one received, as a new reply in the same format, to the same ``model``
+    (the provider's main model by default). Returns the first reply's
+    top-level fields (e.g. the workbook ``type``) and all entries in order.
+    """
+    complete = _openai_complete if provider == "openai" else _anthropic_complete
+    fields, entries = _salvage(text, prompt, array_key)
+    continuations = 0
+    truncated = True
+    while truncated and continuations < EXTRACT_MAX_CONTINUATIONS:
+        last = json.dumps(entries[-1], ensure_ascii=False) if entries else "(없음)"
+        request = {**request, "messages": [
+            *request["messages"],
+            {"role": "assistant", "content": text.rstrip() or "..."},
+            {"role": "user", "content": CONTINUE_INSTRUCTION.format(count=len(entries), last=last)},
+        ]}
+        continuations += 1
+        text, truncated = await complete(request, EXTRACT_MAX_TOKENS, model or model_for(provider))
+        more_fields, more = _salvage(text, prompt, array_key)
+        # The model sometimes repeats the entry it was shown as the last one
+        if entries and more and more[0] == entries[-1]:
+            more = more[1:]
+        fields = {**more_fields, **fields}
+        entries.extend(more)
+        if truncated and not more:
+            break
+
+    usage_stats.record_truncation(provider, continuations, unfinished=truncated)
+    if truncated:
+        logger.warning(f"[Extract] Reply still cut off after {continuations} continuations, keeping {len(entries)} entries")
+    else:
+        logger.info(f"[Extract] Reply cut off at max_tokens, completed with {continuations} continuations ({len(entries)} entries)")
+    return fields, entries
+
+
+async def _extract_page(provider: str, image: ImageInput, prompt: str, parse, array_key: str):
+    """Extract one page with ``prompt`` and ``parse`` the reply; a reply cut off at
+    max_tokens is continued instead of failing or coming back short.
+
+    With EXTRACT_MODEL_TIERS the fast model goes first and the page is only
+    sent to the main model when that result fails _check_result.
+    """
+    if not EXTRACT_MODEL_TIERS:
+        return await _extract_page_with(provider, model_for(provider), image, prompt, parse, array_key)
+
+    start = time.monotonic()
+    try:
+        result = await _extract_page_with(provider, _fast_model_for(provider), image, prompt, parse, array_key)
+        problem = _check_result(prompt, result)
+    except Exception as e:
+        problem = "error", f"{type(e).__name__}: {e}"
+    usage_stats.record_tier(provider, "fast", time.monotonic() - start, escalated=problem and problem[0])
+    if problem is None:
+        _record_entry_count(prompt, result)
+        return result
+
+    logger.info(f"[Tier] Escalating page to {model_for(provider)} ({problem[0]}: {problem[1]})")
+    start = time.monotonic()
+    result = await _extract_page_with(provider, model_for(provider), image, prompt, parse, array_key)
+    usage_stats.record_tier(provider, "main", time.monotonic() - start)
+    _record_entry_count(prompt, result)
+    return result
+
+
+async def _extract_page_with(provider: str, model: str, image: ImageInput, prompt: str, parse, array_key: str):
+    build = openai_request if provider == "openai" else anthropic_request
+    complete = _openai_complete if provider == "openai" else _anthropic_complete
+    request = build([image], prompt)
+    text, truncated = await complete(request, EXTRACT_MAX_TOKENS, model)
+    if not truncated:
+        return parse(validate_reply(prompt, text))
+    fields, entries = await _continue_reply(provider, request, prompt, array_key, text, model)
+    # Every parser reads this JSON shape, whatever the reply format was
+    return parse(validate_reply(prompt, json.dumps({**fields, array_key: entries}, ensure_ascii=False)))
+
+
+async def _anthropic_vision_stream(image: ImageInput, prompt: str, max_tokens: int = EXTRACT_MAX_TOKENS, outcome: dict | None = None):
+    """Like _anthropic_vision, but yield reply text deltas as they arrive.
+
+    ``outcome["truncated"]`` is set when the reply was cut off at ``max_tokens``.
+    """
+    client = clients.anthropic()
+    request = anthropic_request([image], prompt)
+    async with provider_limiter("anthropic").hold(lambda: client.messages.with_raw_response.create(
+        model=ANTHROPIC_MODEL,
+        max_tokens=max_tokens,
+        stream=True,
+        **request,
+    )) as raw:
+        stream = await _parse_raw(raw)
+        usage = None
+        async for event in stream:
+            if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+            elif event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                # Structured output: the tool input arrives as JSON text
+                yield event.delta.partial_json
+            elif event.type == "message_start":
+                usage = event.message.usage
+            elif event.type == "message_delta":
+                if event.delta.stop_reason == "max_tokens" and outcome is not None:
+                    outcome["truncated"] = True
+                if usage is not None:
+                    usage = usage.model_copy(update={"output_tokens": event.usage.output_tokens})
+        usage_stats.record_anthropic(usage)
+
+
+async def _openai_vision_stream(image: ImageInput, prompt: str, max_tokens: int = EXTRACT_MAX_TOKENS, outcome: dict | None = None):
+    """Like _openai_vision, but yield reply text deltas as they arrive.
+
+    ``outcome["truncated"]`` is set when the reply was cut off at ``max_tokens``.
+    """
+    client = clients.openai()
+    request = openai_request([image], prompt)
+    async with provider_limiter("openai").hold(lambda: client.chat.completions.with_raw_response.create(
+        model=OPENAI_MODEL,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},
+        **request,
+    )) as raw:
+        stream = await _parse_raw(raw)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.choices and chunk.choices[0].finish_reason == "length" and outcome is not None:
+                outcome["truncated"] = True
+            if chunk.usage is not None:
+                usage_stats.record_openai(chunk.usage)
+
+
+async def _stream_extraction(image: ImageInput, prompt: str, parse, array_key: str, required_fields=()):
+    """Yield ``(fields, entry)`` for each entry object as soon as it closes in the streamed reply.
+
+    ``fields`` holds the reply's top-level string fields (e.g. the workbook ``type``);
+    entries are held back until every name in ``required_fields`` has been seen.
+    A cache hit replays the cached result; a complete reply is parsed with ``parse`` and cached.
+    A reply cut off at max_tokens is continued (without streaming) and the remaining entries follow.
+    A provider failing before the first entry was yielded fails over to the next one of the route.
+    """
+    route = provider_router.route()
+    keys = _cache_keys(image, prompt, route)
+    cached = await _cached(keys)
+    if cached is not None:
+        fields = {"type": cached["type"]} if isinstance(cached, dict) else {}
+        for entry in cached["entries"] if isinstance(cached, dict) else cached:
+            yield fields, entry
+        return
+
+    error = None
+    for provider in route:
+        if not provider_router.available(provider):
+            continue
+        if error is not None:
+            logger.warning(f"[Router] Failing over stream to {provider}: {type(error).__name__}: {error}")
+        yielded = False
+        start = time.monotonic()
+        try:
+            async for item in _stream_page(provider, image, prompt, parse, array_key, required_fields, keys[provider][0]):
+                yielded = True
+                yield item
+        except Exception as e:
+            provider_router.failed(provider, e)
+            # Entries already sent cannot be taken back; only a stream that produced nothing moves on
+            if yielded:
+                raise
+            error = e
+            continue
+        except BaseException:
+            provider_router.abandoned(provider)
+            raise
+        provider_router.succeeded(provider, time.monotonic() - start, failover=provider != route[0])
+        return
+    if error is not None:
+        raise error
+    raise ProviderUnavailable("AI 제공자를 일시적으로 사용할 수 없습니다 (연속 실패로 차단됨). 잠시 후 다시 시도하세요.")
+
+
+async def _stream_page(provider: str, image: ImageInput, prompt: str, parse, array_key: str, required_fields, key: str):
+    """The body of _stream_extraction for one provider; the result is cached under ``key``."""
+    stream = _openai_vision_stream if provider == "openai" else _anthropic_vision_stream
+    parser = _entry_parser(prompt, array_key)
+    outcome = {}
+    pending = []
+    received = 0
+    async for chunk in stream(image, prompt, outcome=outcome):
+        entries = parser.feed(chunk)
+        received += len(entries)
+        pending.extend(entries)
+        if pending and all(name in parser.fields for name in required_fields):
+            for entry in pending:
+                yield parser.fields, entry
+            pending.clear()
+
+    text = parser.text
+    if outcome.get("truncated"):
+        build = openai_request if provider == "openai" else anthropic_request
+        fields, entries = await _continue_reply(provider, build([image], prompt), prompt, array_key, text)
+        pending.extend(entries[received:])
+        text = json.dumps({**fields, array_key: entries}, ensure_ascii=False)
+
+    try:
+        result = parse(validate_reply(prompt, text))
+    except ValueError:
+        result = None
+    if isinstance(result, dict):
+        fields = {"type": result["type"]}
+        # Replay anything held back for a field that never arrived, with the parsed (normalized) type
+        for entry in pending:
+            yield fields, entry
+        if result["entries"]:
+            await extraction_cache.aput(key, result, prompt)
+    else:
+        for entry in pending:
+            yield parser.fields, entry
+        if result:
+            await extraction_cache.aput(key, result, prompt)
+
+
+async def stream_words(image: ImageInput):
+    """Streaming variant of extract_words: yield each word dict as soon as it is complete."""
+    async for _, word in _stream_extraction(image, EXTRACT_PROMPT, parse_response, "words"):
+        yield word
+
+
+async def extract_words_anthropic(image: ImageInput) -> list[dict]:
+    return await _extract_page("anthropic", image, EXTRACT_PROMPT, parse_response, "words")
+
+
+async def extract_words_openai(image: ImageInput) -> list[dict]:
+    return await _extract_page("openai", image, EXTRACT_PROMPT, parse_response, "words")
 
 
 EXTRACT_HANJA_PROMPT = """이미지는 한문(한자) 교재 페이지입니다. 이미지에 있는 한자를 모두 추출하여 다음 JSON 형식으로만 응답하세요:
@@ -114,106 +638,56 @@ EXTRACT_HANJA_PROMPT = """이미지는 한문(한자) 교재 페이지입니다.
 8. JSON 외 다른 텍스트는 절대 포함하지 마세요"""
 
 
-async def extract_hanja_anthropic(file_path: str) -> list[dict]:
-    import anthropic
-
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    message = await client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": EXTRACT_HANJA_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_hanja_response(message.content[0].text)
-
-
-async def extract_hanja_openai(file_path: str) -> list[dict]:
-    from openai import AsyncOpenAI
-
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{media_type};base64,{image_data}"
-                        },
-                    },
-                    {"type": "text", "text": EXTRACT_HANJA_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_hanja_response(response.choices[0].message.content)
+async def extract_hanja_anthropic(image: ImageInput) -> list[dict]:
+    return await _extract_page("anthropic", image, EXTRACT_HANJA_PROMPT, parse_hanja_response, "words")
 
 
-def _parse_hanja_response(text: str) -> list[dict]:
-    text = text.strip()
-    # Find the outermost JSON object by tracking brace depth
-    start = text.find("{")
-    if start == -1:
+async def extract_hanja_openai(image: ImageInput) -> list[dict]:
+    return await _extract_page("openai", image, EXTRACT_HANJA_PROMPT, parse_hanja_response, "words")
+
+
+def parse_hanja_response(text: str) -> list[dict]:
+    try:
+        data = _json_object(text)
+    except json.JSONDecodeError:
         return []
-    depth = 0
-    for i, ch in enumerate(text[start:], start):
-        if ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                try:
-                    data = json.loads(text[start:i + 1])
-                    return data.get("words", [])
-                except json.JSONDecodeError:
-                    return []
-    return []
-
-
-async def extract_hanja(file_path: str) -> list[dict]:
-    provider = os.getenv("AI_PROVIDER", "anthropic").lower()
-    if provider == "openai":
-        return await extract_hanja_openai(file_path)
-    return await extract_hanja_anthropic(file_path)
+    return data.get("words", []) if data is not None else []
 
 
-def _parse_response(text: str) -> list[dict]:
-    text = text.strip()
-    json_match = re.search(r"\{.*\}", text, re.DOTALL)
-    if json_match:
-        data = json.loads(json_match.group())
-        return data.get("words", [])
-    return []
+async def extract_hanja(image: ImageInput) -> list[dict]:
+    return await _run_extraction(image, EXTRACT_HANJA_PROMPT, extract_hanja_anthropic, extract_hanja_openai)
 
 
-async def extract_words(file_path: str) -> list[dict]:
-    provider = os.getenv("AI_PROVIDER", "anthropic").lower()
-    if provider == "openai":
-        return await extract_words_openai(file_path)
-    return await extract_words_anthropic(file_path)
+# A compact reply starts with its "#type" header line, possibly inside a code fence
+_COMPACT_RE = re.compile(r"\s*(?:```[^\n]*\n\s*)?#")
+
+
+def _is_compact(text: str) -> bool:
+    return _COMPACT_RE.match(text) is not None
+
+
+def _parse_compact(text: str, columns: dict) -> tuple[str | None, list[dict]]:
+    """Parse a compact reply in one pass into ``(header type, entries)``.
+
+    A reply cut off at max_tokens keeps every complete line; only the unfinished one is lost.
+    """
+    parser = LineEntryParser(columns)
+    entries = parser.feed(text)
+    parser.close()
+    if not parser.complete:
+        logger.warning(f"[Extract] Compact reply ended without #end, kept {len(entries)} complete rows")
+    return parser.fields.get("type"), entries
+
+
+def parse_response(text: str) -> list[dict]:
+    if _is_compact(text):
+        return _parse_compact(text, WORD_COLUMNS)[1]
+    data = _json_object(text)
+    return data.get("words", []) if data is not None else []
+
+
+async def extract_words(image: ImageInput) -> list[dict]:
+    return await _run_extraction(image, EXTRACT_PROMPT, extract_words_anthropic, extract_words_openai)
 
 
 # ===== Workbook Extraction =====
@@ -283,150 +757,47 @@ WORKBOOK_TYPE3_PROMPT = """이미지는 중국어 교재의 어구풀이 페이
 
 
 def _parse_workbook_response(text: str) -> list[dict]:
-    text = text.strip()
-    json_match = re.search(r"\{.*\}", text, re.DOTALL)
-    if json_match:
-        data = json.loads(json_match.group())
-        return data.get("entries", [])
-    return []
-
-
-async def _extract_workbook_anthropic(file_path: str, prompt: str) -> list[dict]:
-    import anthropic
-
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    message = await client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ],
-    )
-    return _parse_workbook_response(message.content[0].text)
-
-
-async def _extract_workbook_openai(file_path: str, prompt: str) -> list[dict]:
-    from openai import AsyncOpenAI
-
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{media_type};base64,{image_data}"
-                        },
-                    },
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ],
-    )
-    return _parse_workbook_response(response.choices[0].message.content)
-
-
-async def _detect_type_anthropic(file_path: str) -> str:
-    import anthropic
-
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    message = await client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=256,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": WORKBOOK_DETECT_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_type_response(message.content[0].text)
-
-
-async def _detect_type_openai(file_path: str) -> str:
-    from openai import AsyncOpenAI
-
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=256,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{media_type};base64,{image_data}"
-                        },
-                    },
-                    {"type": "text", "text": WORKBOOK_DETECT_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_type_response(response.choices[0].message.content)
+    data = _json_object(text)
+    return data.get("entries", []) if data is not None else []
+
+
+async def _extract_workbook_anthropic(image: ImageInput, prompt: str) -> list[dict]:
+    return await _extract_page("anthropic", image, prompt, _parse_workbook_response, "entries")
+
+
+async def _extract_workbook_openai(image: ImageInput, prompt: str) -> list[dict]:
+    return await _extract_page("openai", image, prompt, _parse_workbook_response, "entries")
+
+
+async def _detect_type_anthropic(image: ImageInput) -> str:
+    text = await _anthropic_vision(image, WORKBOOK_DETECT_PROMPT, max_tokens=256)
+    return _parse_type_response(text)
+
+
+async def _detect_type_openai(image: ImageInput) -> str:
+    text = await _openai_vision(image, WORKBOOK_DETECT_PROMPT, max_tokens=256)
+    return _parse_type_response(text)
 
 
 def _parse_type_response(text: str) -> str:
-    text = text.strip()
-    json_match = re.search(r"\{.*\}", text, re.DOTALL)
-    if json_match:
-        data = json.loads(json_match.group())
+    data = _json_object(text)
+    if data is not None:
         detected = data.get("type", "type1")
         if detected in ("type1", "type2", "type3", "type4"):
             return detected
     return "type1"
 
 
-async def detect_workbook_type(file_path: str) -> str:
+async def detect_workbook_type(image: ImageInput) -> str:
     """Auto-detect workbook type from image using AI."""
-    provider = os.getenv("AI_PROVIDER", "anthropic").lower()
-    if provider == "openai":
-        return await _detect_type_openai(file_path)
-    return await _detect_type_anthropic(file_path)
+    _, detected = await provider_router.run({
+        "anthropic": lambda: _detect_type_anthropic(image),
+        "openai": lambda: _detect_type_openai(image),
+    })
+    return detected
 
 
-async def extract_workbook(file_path: str, workbook_type: str) -> list[dict]:
+async def extract_workbook(image: ImageInput, workbook_type: str) -> list[dict]:
     if workbook_type == "type1":
         prompt = WORKBOOK_TYPE1_PROMPT
     elif workbook_type == "type3":
@@ -435,15 +806,16 @@ async def extract_workbook(file_path: str, workbook_type: str) -> list[dict]:
         prompt = WORKBOOK_TYPE4_PROMPT
     else:
         prompt = WORKBOOK_TYPE2_PROMPT
-    provider = os.getenv("AI_PROVIDER", "anthropic").lower()
-    if provider == "openai":
-        return await _extract_workbook_openai(file_path, prompt)
-    return await _extract_workbook_anthropic(file_path, prompt)
+    _, entries = await provider_router.run({
+        "anthropic": lambda: _extract_workbook_anthropic(image, prompt),
+        "openai": lambda: _extract_workbook_openai(image, prompt),
+    })
+    return entries
 
 
 # ===== Combined Detect + Extract (single API call) =====
 
-WORKBOOK_COMBINED_PROMPT = """이미지는 중국어 교재 페이지입니다. 유형을 판별하고 내용을 추출하세요.
+WORKBOOK_COMBINED_JSON_PROMPT = """이미지는 중국어 교재 페이지입니다. 유형을 판별하고 내용을 추출하세요.
 
 유형 1 (type1): 표(테이블) 형식으로 한자, 의미, 예문 등이 행으로 나열된 페이지
 유형 2 (type2): 대화문이 있는 유형학습 페이지 (A:, B: 등 화자별 대화 + 본문해석 섹션이 별도로 있음)
@@ -493,80 +865,410 @@ WORKBOOK_COMBINED_PROMPT = """이미지는 중국어 교재 페이지입니다.
 
 JSON 외 다른 텍스트는 절대 포함하지 마세요."""
 
+WORKBOOK_COMBINED_TSV_PROMPT = """이미지는 중국어 교재 페이지입니다. 유형을 판별하고 내용을 추출하세요.
+
+유형 1 (type1): 표(테이블) 형식으로 한자, 의미, 예문 등이 행으로 나열된 페이지
+유형 2 (type2): 대화문이 있는 유형학습 페이지 (A:, B: 등 화자별 대화 + 본문해석 섹션이 별도로 있음)
+유형 3 (type3): 어구풀이 페이지 - 번호+굵은 중국어 표현문장이 헤더이고, 불릿(•) 예문들이 중국어+한국어 쌍으로 나열됨
+유형 4 (type4): 교과서 본문 대화 페이지 - 한국어 번역 없이 중국어 대화문만 나열된 구조 (본문해석 섹션 없음)
+
+다음 형식으로만 응답하세요:
+#유형 (#type1, #type2, #type3, #type4 중 하나)
+항목마다 한 줄, 유형별 칸을 탭 문자 하나로 구분
+#end
+
+형식:
+- 첫 줄은 유형 줄, 마지막 줄은 #end
+- 칸 안에는 탭과 줄바꿈을 쓰지 마세요. 값이 없는 칸도 탭은 그대로 둡니다
+- 따옴표, JSON, 코드 블록 없이 값만 적으세요
+
+유형 1 칸: 한자\t병음(성조 포함)\t한국어 의미\t중국어 예문 원문
+
+유형 1 규칙:
+- 표의 각 행이 하나의 줄. 같은 한자라도 병음/의미가 다르면 별도 줄
+- 한자 앞의 * 기호 제거
+- **한자 칸에는 반드시 중국어 한자만 입력. 한국어/한글이 절대 들어가면 안 됨** (예: "从", "到", "离" 등 중국어 문자만)
+- **병음이 표에 명시되어 있지 않으면, 해당 한자의 정확한 병음을 직접 생성하세요** (예: 从→cóng, 离→lí, 当→dāng)
+- 의미는 표에 있는 한국어 뜻/용법을 추출 (예: "~(으)로부터", "~에게", "~보다" 등)
+- 예문은 중국어 원문만 (한국어 해석 제외)
+- 예문이 정말 없는 행만 예문 칸을 비움
+- 의미가 여러 개면 쉼표 구분
+- 한 행에 의미가 2개 이상이고 각각 다른 예문이 있으면 별도 줄로 분리
+
+유형 2 칸: 화자\t중국어 본문(한자만)\t한국어 해석
 
-def _parse_combined_response(text: str) -> dict:
-    text = text.strip()
-    json_match = re.search(r"\{.*\}", text, re.DOTALL)
-    if json_match:
-        data = json.loads(json_match.group())
-        wb_type = data.get("type", "type1")
-        if wb_type not in ("type1", "type2", "type3", "type4"):
-            wb_type = "type1"
+유형 2 규칙:
+- 화자는 원문 화자 레이블(A, B 등) 그대로
+- 중국어 본문은 한자 본문만 (병음 제외)
+- 한국어 해석은 본문해석에서 해당 화자의 한국어 번역
+- 어휘 섹션 제외
+
+유형 3 칸: 예문 중국어(한자만)\t한국어 해석
+
+유형 3 규칙:
+- 번호+굵은 헤더 문장은 제외
+- 불릿(•) 예문만 추출: 중국어는 한자 원문만(병음 제외), 한국어 해석과 함께
+- 섹션 순서와 예문 순서 유지
+- 어휘 섹션 제외
+
+유형 4 칸: 중국어 본문(한자만)\t한국어 번역
+
+유형 4 규칙:
+- 대화 줄마다 하나의 줄
+- 중국어 본문은 한자만 (병음, 화자 레이블 제외)
+- 한국어 번역은 해당 줄의 자연스러운 한국어 번역을 AI가 직접 생성
+- 대화 순서 유지
+
+이 형식 외 다른 텍스트는 절대 포함하지 마세요."""
+
+WORKBOOK_COMBINED_PROMPT = (
+    WORKBOOK_COMBINED_TSV_PROMPT if EXTRACT_OUTPUT_FORMAT == "tsv" else WORKBOOK_COMBINED_JSON_PROMPT
+)
+
+WORKBOOK_COLUMNS = {
+    "type1": ("chinese", "pinyin", "meaning", "example"),
+    "type2": ("speaker", "chinese_text", "korean"),
+    "type3": ("chinese_text", "korean"),
+    "type4": ("chinese_text", "korean"),
+}
+
+# Compact prompts and the row columns of their replies
+_COMPACT_COLUMNS = {
+    EXTRACT_TSV_PROMPT: WORD_COLUMNS,
+    WORKBOOK_COMBINED_TSV_PROMPT: WORKBOOK_COLUMNS,
+}
+
+
+WORKBOOK_TYPES = ("type1", "type2", "type3", "type4")
+
+
+def _normalize_workbook_type(wb_type) -> str:
+    return wb_type if wb_type in WORKBOOK_TYPES else "type1"
+
+
+def parse_combined_response(text: str) -> dict:
+    if _is_compact(text):
+        wb_type, entries = _parse_compact(text, WORKBOOK_COLUMNS)
+        return {"type": _normalize_workbook_type(wb_type), "entries": entries}
+    data = _json_object(text)
+    if data is not None:
+        wb_type = _normalize_workbook_type(data.get("type", "type1"))
         return {"type": wb_type, "entries": data.get("entries", [])}
     return {"type": "type1", "entries": []}
 
 
-async def _combined_extract_anthropic(file_path: str) -> dict:
-    import anthropic
-
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    message = await client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": media_type,
-                            "data": image_data,
-                        },
-                    },
-                    {"type": "text", "text": WORKBOOK_COMBINED_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_combined_response(message.content[0].text)
-
-
-async def _combined_extract_openai(file_path: str) -> dict:
-    from openai import AsyncOpenAI
-
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    image_data = _encode_image(file_path)
-    media_type = _get_media_type(file_path)
-
-    response = await client.chat.completions.create(
-        model="gpt-4o",
-        max_tokens=4096,
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{media_type};base64,{image_data}"
-                        },
-                    },
-                    {"type": "text", "text": WORKBOOK_COMBINED_PROMPT},
-                ],
-            }
-        ],
-    )
-    return _parse_combined_response(response.choices[0].message.content)
+async def _combined_extract_anthropic(image: ImageInput) -> dict:
+    return await _extract_page("anthropic", image, WORKBOOK_COMBINED_PROMPT, parse_combined_response, "entries")
+
+
+async def _combined_extract_openai(image: ImageInput) -> dict:
+    return await _extract_page("openai", image, WORKBOOK_COMBINED_PROMPT, parse_combined_response, "entries")
 
 
-async def detect_and_extract_workbook(file_path: str) -> dict:
+async def detect_and_extract_workbook(image: ImageInput) -> dict:
     """Detect type and extract workbook content in a single API call."""
-    provider = os.getenv("AI_PROVIDER", "anthropic").lower()
+    return await _run_extraction(
+        image, WORKBOOK_COMBINED_PROMPT, _combined_extract_anthropic, _combined_extract_openai
+    )
+
+
+async def stream_workbook(image: ImageInput):
+    """Streaming variant of detect_and_extract_workbook: yield ``(type, entry)`` as each entry completes."""
+    async for fields, entry in _stream_extraction(
+        image, WORKBOOK_COMBINED_PROMPT, parse_combined_response, "entries", required_fields=("type",)
+    ):
+        yield _normalize_workbook_type(fields.get("type")), entry
+
+
+# ===== Model Tiers =====
+
+# A page with fewer entries than this share of the usual count for its prompt goes to the main model
+EXTRACT_TIER_MIN_ENTRY_RATIO = float(os.getenv("EXTRACT_TIER_MIN_ENTRY_RATIO", "0.3"))
+# Accepted pages per prompt (and workbook type) needed before the entry count is checked, and kept
+_ENTRY_COUNT_MIN_PAGES = 10
+_ENTRY_COUNT_WINDOW = 50
+
+_HANZI = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\U00020000-\U0002fa1f"
+_HAS_HANZI_RE = re.compile(f"[{_HANZI}]")
+# Anything in a word field besides Hanzi and the placeholders of vocab lists (从…到…, ~的, A/B)
+_NOT_WORD_RE = re.compile(f"[^{_HANZI}…~～/（）()·\\s]")
+# Hangul in a Chinese sentence field (the Korean translation ended up in the wrong column);
+# Latin script is allowed there: textbook sentences carry names, brands, units and glosses
+_NOT_SENTENCE_RE = re.compile("[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]")
+_TONE_MARKS = "āáǎàēéěèīíǐìōóǒòūúǔùǖǘǚǜńňǹḿĀÁǍÀĒÉĚÈĪÍǏÌŌÓǑÒŪÚǓÙǕǗǙǛ"
+_PINYIN_RE = re.compile(f"[a-zA-ZüÜ{_TONE_MARKS}\\s'’·…~～/（）(),，-]+")
+_TONE_RE = re.compile(f"[{_TONE_MARKS}]")
+
+_entry_counts: dict[tuple, deque] = {}
+
+
+def _entries_of(result) -> list[dict]:
+    return result["entries"] if isinstance(result, dict) else result
+
+
+def _count_key(prompt: str, result) -> tuple:
+    return prompt, result.get("type") if isinstance(result, dict) else None
+
+
+def _check_result(prompt: str, result) -> tuple[str, str] | None:
+    """``(check, detail)`` of why a fast-model result should go to the main model, or None when it looks right.
+
+    Checks that the page has entries, that Chinese word fields are Hanzi and
+    sentence fields have Hanzi and no Hangul, that pinyin is tone-marked letters
+    (not tone numbers, at least half of it carrying a tone mark) and that the
+    entry count is not far below what pages of this prompt usually have.
+    """
+    entries = _entries_of(result)
+    if not entries:
+        return "empty", "no entries"
+    toned = pinyins = 0
+    for entry in entries:
+        for field in ("chinese", "hanja"):
+            value = entry.get(field)
+            if value is not None and (not _HAS_HANZI_RE.search(value) or _NOT_WORD_RE.search(value)):
+                return field, repr(value)
+        value = entry.get("chinese_text")
+        if value is not None and (not _HAS_HANZI_RE.search(value) or _NOT_SENTENCE_RE.search(value)):
+            return "chinese_text", repr(value)
+        value = entry.get("pinyin")
+        if value is not None:
+            value = unicodedata.normalize("NFC", value)
+            if not _PINYIN_RE.fullmatch(value):
+                return "pinyin", repr(value)
+            pinyins += 1
+            toned += _TONE_RE.search(value) is not None
+    if pinyins and toned * 2 < pinyins:
+        return "pinyin", f"{pinyins - toned}/{pinyins} without tone marks"
+
+    counts = _entry_counts.get(_count_key(prompt, result))
+    if counts is not None and len(counts) >= _ENTRY_COUNT_MIN_PAGES:
+        usual = statistics.median(counts)
+        if len(entries) < usual * EXTRACT_TIER_MIN_ENTRY_RATIO:
+            return "count", f"{len(entries)} entries, pages usually have {usual:g}"
+    return None
+
+
+def _record_entry_count(prompt: str, result):
+    """Remember the entry count of an accepted page for the count check of later pages."""
+    entries = _entries_of(result)
+    if entries:
+        counts = _entry_counts.setdefault(_count_key(prompt, result), deque(maxlen=_ENTRY_COUNT_WINDOW))
+        counts.append(len(entries))
+
+
+# ===== Structured Outputs =====
+
+STRUCTURED_TOOL = "record_extraction"
+
+# Reply model of each JSON prompt, used when EXTRACT_OUTPUT_FORMAT=structured
+_REPLY_MODELS = {
+    EXTRACT_JSON_PROMPT: WordsReply,
+    EXTRACT_HANJA_PROMPT: HanjaReply,
+    WORKBOOK_DETECT_PROMPT: WorkbookTypeReply,
+    WORKBOOK_COMBINED_JSON_PROMPT: WorkbookReply,
+    WORKBOOK_TYPE1_PROMPT: WorkbookType1Reply,
+    WORKBOOK_TYPE2_PROMPT: WorkbookType2Reply,
+    WORKBOOK_TYPE3_PROMPT: WorkbookType3Reply,
+    WORKBOOK_TYPE4_PROMPT: WorkbookType3Reply,
+}
+
+
+def _reply_model(prompt: str) -> type[BaseModel] | None:
+    return _REPLY_MODELS.get(prompt) if EXTRACT_OUTPUT_FORMAT == "structured" else None
+
+
+@lru_cache(maxsize=None)
+def _pages_model(model: type[BaseModel]) -> type[BaseModel]:
+    """Reply model of a packed request: ``{"pages": [{"page": N, ...model fields}]}``."""
+    page = create_model(f"{model.__name__}Page", __base__=model, page=(int, ...))
+    return create_model(f"{model.__name__}Pages", pages=(list[page], ...))
+
+
+@lru_cache(maxsize=None)
+def _strict_schema(model: type[BaseModel]) -> dict:
+    """JSON schema of ``model`` in the strict form both providers accept: references
+    inlined, every property required, no additional properties, no titles or defaults."""
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def strict(node):
+        if isinstance(node, list):
+            return [strict(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            return strict(defs[node["$ref"].rsplit("/", 1)[-1]])
+        result = {k: strict(v) for k, v in node.items() if k not in ("title", "default", "description", "properties")}
+        if "properties" in node:
+            # Property names are field names, not schema keywords
+            result["properties"] = {name: strict(prop) for name, prop in node["properties"].items()}
+        if result.get("type") == "object":
+            result["required"] = list(result.get("properties", {}))
+            result["additionalProperties"] = False
+        return result
+
+    return strict(schema)
+
+
+def _structured_params(provider: str, prompt: str, page_count: int) -> dict:
+    """Request parameters constraining the reply to the prompt's reply model ({} outside structured mode)."""
+    model = _reply_model(prompt)
+    if model is None:
+        return {}
+    if page_count > 1:
+        model = _pages_model(model)
+    schema = _strict_schema(model)
     if provider == "openai":
-        return await _combined_extract_openai(file_path)
-    return await _combined_extract_anthropic(file_path)
+        return {"response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": model.__name__, "strict": True, "schema": schema},
+        }}
+    return {
+        "tools": [{"name": STRUCTURED_TOOL, "description": "추출 결과를 기록합니다.", "input_schema": schema}],
+        "tool_choice": {"type": "tool", "name": STRUCTURED_TOOL},
+    }
+
+
+def anthropic_text(message) -> str:
+    """Reply text of an Anthropic message; a structured reply's tool input as JSON text."""
+    for block in message.content:
+        if block.type == "tool_use":
+            return json.dumps(block.input, ensure_ascii=False)
+    return message.content[0].text
+
+
+def validate_reply(prompt: str, text: str) -> str:
+    """Check a structured reply against its model and return it re-serialized with defaults
+    filled in; other replies are returned as-is. Raises ValueError when it does not match."""
+    model = _reply_model(prompt)
+    if model is None:
+        return text
+    return model.model_validate_json(text).model_dump_json()
+
+
+# ===== Multi-page Batching =====
+
+_PAGE_LINE_RE = re.compile(r"^[ \t]*#page[ \t]+(\d+)[ \t]*$", re.MULTILINE)
+_END_LINE_RE = re.compile(r"^[ \t]*#end[ \t]*$", re.MULTILINE)
+
+
+def _split_batch_reply(text: str) -> dict[int, str]:
+    """Split a packed reply into per-page texts keyed by page index; unparseable replies give {}.
+
+    Compact replies are split at their ``#page N`` lines; a page without its
+    ``#end`` line was cut off and is left out, so it is extracted on its own.
+    """
+    if _is_compact(text):
+        parts = _PAGE_LINE_RE.split(text)
+        return {
+            int(page): section
+            for page, section in zip(parts[1::2], parts[2::2])
+            if _END_LINE_RE.search(section)
+        }
+    try:
+        data = _json_object(text)
+    except json.JSONDecodeError:
+        return {}
+    sections = {}
+    for item in data.get("pages", []) if isinstance(data, dict) else []:
+        if isinstance(item, dict) and isinstance(item.get("page"), int):
+            page = item.pop("page")
+            sections[page] = json.dumps(item, ensure_ascii=False)
+    return sections
+
+
+def valid_result(result) -> bool:
+    """Shape check for a parsed page: a list of row dicts, or a workbook dict with an entries list."""
+    if isinstance(result, dict):
+        result = result.get("entries")
+    return isinstance(result, list) and all(isinstance(row, dict) for row in result)
+
+
+async def _run_batch_extraction(images: list[ImageInput], prompt: str, parse, extract_one) -> list:
+    """Extract several pages with up to EXTRACT_BATCH_SIZE images per provider request.
+
+    Cached pages are answered from the cache; each packed reply is split by page
+    index and parsed with ``parse`` (the single-page parser). Pages missing from
+    the reply or failing to parse fall back to ``extract_one`` (the single-page
+    path). Returns one result per input page, in order; a page whose fallback
+    raised gets the exception instead of a result.
+    """
+    if EXTRACT_BATCH_SIZE <= 1 or len(images) <= 1:
+        return await asyncio.gather(*[extract_one(p) for p in images], return_exceptions=True)
+
+    # Packed requests go to the first provider whose circuit is closed; single-page fallbacks use the router
+    provider = provider_router.preferred()
+    route = provider_router.route()
+    page_keys = [_cache_keys(p, prompt, route) for p in images]
+    keys = [page[provider][0] for page in page_keys]
+    results = list(await asyncio.gather(*[_cached(page) for page in page_keys]))
+    missing = [i for i, result in enumerate(results) if result is None]
+    complete = _openai_complete if provider == "openai" else _anthropic_complete
+    build = openai_request if provider == "openai" else anthropic_request
+
+    async def run_chunk(chunk):
+        if len(chunk) < 2:
+            return
+        pages = [images[i] for i in chunk]
+        try:
+            text, truncated = await complete(build(pages, prompt), min(EXTRACT_MAX_TOKENS * len(pages), BATCH_MAX_TOKENS))
+            sections = _split_batch_reply(text)
+        except Exception as e:
+            logger.warning(f"[Batch] {len(pages)}-page request failed, falling back to single pages: {type(e).__name__}: {e}")
+            return
+        if truncated:
+            logger.warning(f"[Batch] {len(pages)}-page reply cut off at max_tokens, unfinished pages fall back to single pages")
+        for offset, i in enumerate(chunk):
+            section = sections.get(offset)
+            if section is None:
+                continue
+            try:
+                result = parse(validate_reply(prompt, section))
+            except (ValueError, AttributeError, KeyError, TypeError):
+                continue
+            if not valid_result(result):
+                continue
+            results[i] = result
+            if isinstance(result, dict) and not result.get("entries"):
+                continue
+            if result:
+                await extraction_cache.aput(keys[i], result, prompt)
+
+    chunks = [missing[i:i + EXTRACT_BATCH_SIZE] for i in range(0, len(missing), EXTRACT_BATCH_SIZE)]
+    await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+
+    fallback = [i for i, result in enumerate(results) if result is None]
+    if len(fallback) < len(missing):
+        logger.info(f"[Batch] {len(missing) - len(fallback)}/{len(missing)} pages from packed requests")
+    outcomes = await asyncio.gather(*[extract_one(images[i]) for i in fallback], return_exceptions=True)
+    for i, outcome in zip(fallback, outcomes):
+        results[i] = outcome
+    return results
+
+
+async def extract_words_batch(images: list[ImageInput]) -> list:
+    """Batched extract_words: one result (or exception) per page, in order."""
+    return await _run_batch_extraction(images, EXTRACT_PROMPT, parse_response, extract_words)
+
+
+async def extract_hanja_batch(images: list[ImageInput]) -> list:
+    """Batched extract_hanja: one result (or exception) per page, in order."""
+    return await _run_batch_extraction(images, EXTRACT_HANJA_PROMPT, parse_hanja_response, extract_hanja)
+
+
+async def detect_and_extract_workbook_batch(images: list[ImageInput]) -> list:
+    """Batched detect_and_extract_workbook: one result (or exception) per page, in order."""
+    return await _run_batch_extraction(
+        images, WORKBOOK_COMBINED_PROMPT, parse_combined_response, detect_and_extract_workbook
+    )
+
+
+# Prompts whose results are cached; entries made with any other prompt text are stale.
+# Both output formats give the same results, so switching EXTRACT_OUTPUT_FORMAT keeps either cache.
+CACHED_PROMPTS = (
+    EXTRACT_JSON_PROMPT,
+    EXTRACT_TSV_PROMPT,
+    EXTRACT_HANJA_PROMPT,
+    WORKBOOK_COMBINED_JSON_PROMPT,
+    WORKBOOK_COMBINED_TSV_PROMPT,
+)
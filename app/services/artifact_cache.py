@@ -0,0 +1,321 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import docx
+from dotenv import load_dotenv
+
+from app.services import ooxml_writer, word_generator, workbook_generator
+from app.services.generation_pool import generation_pool
+from app.services.shared_store import shared_store
+from app.services.singleflight import SingleFlight
+from app.services.word_generator import render_hanja_word, render_word
+from app.services.workbook_generator import render_workbook
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+ARTIFACT_CACHE_ENABLED = os.getenv("ARTIFACT_CACHE_ENABLED", "1") != "0"
+ARTIFACT_CACHE_MAX_BYTES = int(float(os.getenv("ARTIFACT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+ARTIFACT_CACHE_TTL = float(os.getenv("ARTIFACT_CACHE_TTL", "86400"))
+# "disk": every document is written to temp/; "memory": kept in memory, spilled to temp/ only over ARTIFACT_MEMORY_MB
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "disk").lower()
+ARTIFACT_MEMORY_BYTES = int(float(os.getenv("ARTIFACT_MEMORY_MB", "128")) * 1024 * 1024)
+
+# File stems written for a key (older hanja files carry a "_hanja" suffix)
+_FILE_ID_RE = re.compile(r"([0-9a-f]{64})(?:_hanja)?")
+
+# kind -> generator returning the document bytes
+_RENDERERS = {
+    "word": render_word,
+    "hanja": render_hanja_word,
+    "workbook": render_workbook,
+}
+
+
+def _files_hash(*paths: str) -> str:
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+# Any change to the generator code or python-docx can change the output bytes
+GENERATOR_VERSION = hashlib.sha256(
+    (_files_hash(word_generator.__file__, workbook_generator.__file__, ooxml_writer.__file__) + docx.__version__).encode()
+).hexdigest()
+
+# Workbooks are built on python-docx's default template, covered by GENERATOR_VERSION
+TEMPLATE_VERSIONS = {
+    "word": _files_hash(word_generator.TEMPLATE_PATH),
+    "hanja": _files_hash(word_generator.HANJA_TEMPLATE_PATH),
+    "workbook": "default",
+}
+
+
+@dataclass
+class _Artifact:
+    file_id: str
+    size: int
+    created_at: float
+    data: bytes | None = None  # None while the document is a file in the directory
+
+
+class ArtifactCache:
+    """Generated .docx files shared by every request with the same content.
+
+    A file is keyed by the SHA-256 of its entries, workbook type, template
+    version and generator version, and is written atomically as
+    ``temp/<key>.docx``; the key is its download_id. Pressing "generate"
+    again, or another user generating the same list, gets the existing
+    download_id without rebuilding the file. Files are dropped once older
+    than the TTL, then least recently used first while the total size is over
+    budget. The index of files is also kept in the shared store, so a file
+    generated by one worker process is found by the others; index writes go
+    through the store's writer thread and lookups run in a thread.
+
+    With ``in_memory`` the documents are kept as bytes and downloads are served
+    from memory; the least recently used ones are only written to the
+    directory once the documents in memory take more than ``max_memory_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        ttl: float,
+        enabled: bool = True,
+        in_memory: bool = False,
+        max_memory_bytes: int = 0,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.in_memory = in_memory
+        self.max_memory_bytes = max_memory_bytes
+        self._entries: OrderedDict[str, _Artifact] = OrderedDict()
+        self._bytes = 0
+        self._memory_bytes = 0
+        self._flight = SingleFlight("artifact")
+        # Documents being written to the directory keep their bytes (and serve from memory) until it is done
+        self._spilling: dict[str, asyncio.Task] = {}
+        self._spilling_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.spilled = 0
+
+    @staticmethod
+    def make_key(kind: str, entries: list[dict], workbook_type: str | None = None) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps(entries, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        for part in (kind, workbook_type or "", TEMPLATE_VERSIONS[kind], GENERATOR_VERSION):
+            h.update(b"\0")
+            h.update(part.encode())
+        return h.hexdigest()
+
+    def load(self):
+        """Index cached files left in the directory by a previous run (oldest first)."""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return
+        found = []
+        for name in os.listdir(self.directory):
+            file_id, ext = os.path.splitext(name)
+            match = _FILE_ID_RE.fullmatch(file_id)
+            if ext == ".docx" and match:
+                st = os.stat(os.path.join(self.directory, name))
+                found.append((st.st_mtime, match.group(1), file_id, st.st_size))
+        for created_at, key, file_id, size in sorted(found):
+            self._entries[key] = _Artifact(file_id, size, created_at)
+            self._bytes += size
+        self._evict()
+        if self._entries:
+            logger.info(f"[Artifact] Loaded {len(self._entries)} cached files ({self._bytes // 1024}KB)")
+
+    async def generate(self, kind: str, job_id: str, *args) -> str:
+        """Return the download_id of the ``kind`` document for the generator arguments ``args``.
+
+        The document is only generated (in the generation pool) on a miss.
+        With the cache disabled it is generated as ``job_id`` every time.
+        """
+        if not self.enabled:
+            return await self._generate(kind, job_id or str(uuid.uuid4()), None, args)
+
+        key = self.make_key(kind, *args)
+        file_id = await self._lookup(key)
+        if file_id is not None:
+            self.hits += 1
+            logger.info(f"[Artifact] Hit {key[:12]}")
+            return file_id
+        self.misses += 1
+        # Identical requests racing each other (double clicks) share one render
+        return await self._flight.do(key, lambda: self._generate(kind, key, key, args))
+
+    def read(self, download_id: str) -> bytes | None:
+        """The document bytes when ``download_id`` is held in memory, else None (look for the file)."""
+        artifact = self._entries.get(download_id)
+        if artifact is None or artifact.data is None:
+            return None
+        if time.time() - artifact.created_at > self.ttl:
+            self._drop(download_id)
+            return None
+        self._entries.move_to_end(download_id)
+        return artifact.data
+
+    def owns(self, name: str) -> bool:
+        """Whether the file ``name`` in the directory is indexed here or by another worker process.
+
+        Reads the shared store, so call it from a thread.
+        """
+        file_id, ext = os.path.splitext(name)
+        if ext != ".docx":
+            return False
+        match = _FILE_ID_RE.fullmatch(file_id)
+        # Uncached documents spilled from memory are indexed under their download_id
+        key = match.group(1) if match else file_id
+        return key in self._entries or shared_store.get_artifact(key) is not None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "store": "memory" if self.in_memory else "disk",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "memory_bytes": self._memory_bytes,
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+            "singleflight": self._flight.stats(),
+        }
+
+    async def _generate(self, kind: str, file_id: str, key: str | None, args: tuple) -> str:
+        """Generate the document as ``file_id`` and index it under ``key`` (untracked files when None)."""
+        data = await generation_pool.run(_RENDERERS[kind], *args)
+        if self.in_memory:
+            # Documents only in memory are always tracked, under their download_id when uncached
+            self._add(key or file_id, _Artifact(file_id, len(data), time.time(), data))
+            return file_id
+        # Through the writer thread, so a pending removal of an older file with this name cannot follow it
+        await shared_store.write(shared_store.write_blob, f"{file_id}.docx", data)
+        if key is not None:
+            self._add(key, _Artifact(file_id, len(data), time.time()))
+        return file_id
+
+    def _path(self, file_id: str) -> str:
+        return os.path.join(self.directory, f"{file_id}.docx")
+
+    async def _lookup(self, key: str) -> str | None:
+        artifact = self._entries.get(key)
+        if artifact is None:
+            # Generated by another worker process?
+            shared = await asyncio.to_thread(shared_store.get_artifact, key)
+            if shared is None:
+                return None
+            # Indexed here meanwhile (a render of this process finished)?
+            artifact = self._entries.get(key)
+            if artifact is None:
+                artifact = _Artifact(*shared)
+                self._entries[key] = artifact
+                self._bytes += artifact.size
+        if time.time() - artifact.created_at > self.ttl or (
+            artifact.data is None and not await asyncio.to_thread(os.path.exists, self._path(artifact.file_id))
+        ):
+            if self._entries.get(key) is artifact:
+                self._drop(key)
+            return None
+        if self._entries.get(key) is not artifact:
+            # Dropped or replaced while the file was looked for
+            return None
+        self._entries.move_to_end(key)
+        return artifact.file_id
+
+    def _add(self, key: str, artifact: _Artifact):
+        if key in self._entries:
+            # Replaced in place (an uncached job generated again); its file, if any, is overwritten or stale
+            self._forget(key)
+        self._entries[key] = artifact
+        self._bytes += artifact.size
+        if artifact.data is not None:
+            self._memory_bytes += artifact.size
+        else:
+            shared_store.defer(shared_store.put_artifact, key, artifact.file_id, artifact.size, artifact.created_at)
+        self._evict()
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, artifact in self._entries.items() if artifact.created_at < cutoff]:
+            self._drop(key)
+        # Always keep the newest file, even when it alone is over budget; it was just handed out
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+        if self._memory_bytes - self._spilling_bytes > self.max_memory_bytes:
+            for key in [k for k, artifact in self._entries.items() if artifact.data is not None]:
+                if self._memory_bytes - self._spilling_bytes <= self.max_memory_bytes:
+                    break
+                if key not in self._spilling:
+                    self._spilling_bytes += self._entries[key].size
+                    self._spilling[key] = asyncio.create_task(self._spill(key, self._entries[key]))
+
+    async def _spill(self, key: str, artifact: _Artifact):
+        """Move a document from memory to the directory; drop it when the directory is not writable."""
+        try:
+            await shared_store.write(shared_store.write_blob, f"{artifact.file_id}.docx", artifact.data)
+        except OSError as e:
+            logger.warning(f"[Artifact] Could not spill {artifact.file_id[:12]} to disk, dropping it: {e}")
+            if self._entries.get(key) is artifact:
+                self._drop(key)
+            return
+        finally:
+            del self._spilling[key]
+            self._spilling_bytes -= artifact.size
+        if self._entries.get(key) is not artifact:
+            # Dropped or replaced while it was written: nothing indexes the file
+            shared_store.defer(_remove_file, self._path(artifact.file_id))
+            return
+        self._memory_bytes -= artifact.size
+        artifact.data = None
+        shared_store.defer(shared_store.put_artifact, key, artifact.file_id, artifact.size, artifact.created_at)
+        self.spilled += 1
+
+    def _forget(self, key: str) -> _Artifact:
+        artifact = self._entries.pop(key)
+        self._bytes -= artifact.size
+        if artifact.data is not None:
+            self._memory_bytes -= artifact.size
+        return artifact
+
+    def _drop(self, key: str):
+        artifact = self._forget(key)
+        self.evicted += 1
+        if artifact.data is None:
+            shared_store.defer(shared_store.delete_artifact, key)
+            shared_store.defer(_remove_file, self._path(artifact.file_id))
+
+
+def _remove_file(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+artifact_cache = ArtifactCache(
+    os.path.abspath(word_generator.TEMP_DIR),
+    ARTIFACT_CACHE_MAX_BYTES,
+    ARTIFACT_CACHE_TTL,
+    ARTIFACT_CACHE_ENABLED,
+    in_memory=ARTIFACT_STORE == "memory",
+    max_memory_bytes=ARTIFACT_MEMORY_BYTES,
+)
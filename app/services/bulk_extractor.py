@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from app.services.ai_extractor import (
+    ANTHROPIC_MODEL,
+    EXTRACT_HANJA_PROMPT,
+    EXTRACT_MAX_TOKENS,
+    EXTRACT_PROMPT,
+    OPENAI_MODEL,
+    WORKBOOK_COMBINED_PROMPT,
+    anthropic_request,
+    anthropic_text,
+    current_provider,
+    model_for,
+    openai_request,
+    parse_combined_response,
+    parse_hanja_response,
+    parse_response,
+    valid_result,
+    validate_reply,
+)
+from app.services.extraction_cache import extraction_cache
+from app.services.image_preprocessor import preprocess_image
+from app.services.provider_clients import clients
+from app.services.usage_stats import usage_stats
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+# Manifests of submitted batches, so a long poll can be resumed after a restart
+BULK_DIR = os.getenv(
+    "BULK_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "temp", "bulk"),
+)
+BULK_POLL_INTERVAL = float(os.getenv("BULK_POLL_INTERVAL", "30"))
+
+# Same prompts and parsers as the interactive extract_words / extract_hanja / detect_and_extract_workbook
+BULK_KINDS = {
+    "words": (EXTRACT_PROMPT, parse_response),
+    "hanja": (EXTRACT_HANJA_PROMPT, parse_hanja_response),
+    "workbook": (WORKBOOK_COMBINED_PROMPT, parse_combined_response),
+}
+
+OPENAI_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+# A reply cut off at max_tokens is not stored: the page would stay short in the cache.
+# Uploading it later extracts it interactively, where the reply is continued.
+TRUNCATED_ERROR = "reply cut off at max_tokens"
+
+
+def prepare_pages(image_paths: list[str], kind: str, provider: str) -> tuple[list[dict], int]:
+    """Preprocess pages exactly like an upload and key them like _run_extraction.
+
+    Pages already in the extraction store are skipped. Returns the pages to
+    submit (with their preprocessed bytes) and the number skipped.
+    """
+    prompt, _ = BULK_KINDS[kind]
+    pages = []
+    skipped = 0
+    for index, source in enumerate(image_paths):
+        with open(source, "rb") as f:
+            image = preprocess_image(f.read(), provider)
+        key = extraction_cache.make_key(image.data, prompt, provider, model_for(provider))
+        if extraction_cache.get(key) is not None:
+            skipped += 1
+            continue
+        pages.append({"custom_id": f"page-{index}", "source": source, "image": image.data, "key": key})
+    return pages, skipped
+
+
+async def _anthropic_submit(pages: list[dict], prompt: str) -> str:
+    batch = await clients.anthropic().messages.batches.create(requests=[
+        {
+            "custom_id": page["custom_id"],
+            "params": {"model": ANTHROPIC_MODEL, "max_tokens": EXTRACT_MAX_TOKENS, **anthropic_request([page["image"]], prompt)},
+        }
+        for page in pages
+    ])
+    return batch.id
+
+
+async def _anthropic_finished(batch_id: str) -> bool:
+    batch = await clients.anthropic().messages.batches.retrieve(batch_id)
+    logger.info(f"[Bulk] {batch_id} {batch.processing_status} {batch.request_counts}")
+    return batch.processing_status == "ended"
+
+
+async def _anthropic_results(batch_id: str):
+    """Yield ``(custom_id, reply_text, error)`` per request."""
+    async for entry in await clients.anthropic().messages.batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            message = entry.result.message
+            usage_stats.record_anthropic(message.usage)
+            if message.stop_reason == "max_tokens":
+                yield entry.custom_id, None, TRUNCATED_ERROR
+                continue
+            yield entry.custom_id, anthropic_text(message), None
+        else:
+            error = getattr(entry.result, "error", None)
+            yield entry.custom_id, None, f"{entry.result.type}: {error}" if error else entry.result.type
+
+
+async def _openai_submit(pages: list[dict], prompt: str) -> str:
+    lines = [
+        json.dumps({
+            "custom_id": page["custom_id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": OPENAI_MODEL, "max_tokens": EXTRACT_MAX_TOKENS, **openai_request([page["image"]], prompt)},
+        }, ensure_ascii=False)
+        for page in pages
+    ]
+    client = clients.openai()
+    input_file = await client.files.create(file=("bulk.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+
+async def _openai_finished(batch_id: str) -> bool:
+    batch = await clients.openai().batches.retrieve(batch_id)
+    logger.info(f"[Bulk] {batch_id} {batch.status} {batch.request_counts}")
+    return batch.status in OPENAI_FINAL_STATES
+
+
+async def _openai_results(batch_id: str):
+    """Yield ``(custom_id, reply_text, error)`` per request."""
+    client = clients.openai()
+    batch = await client.batches.retrieve(batch_id)
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200 and body.get("choices"):
+                usage = body.get("usage") or {}
+                usage_stats.record(
+                    "openai",
+                    input_tokens=usage.get("prompt_tokens", 0),
+                    cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+                    output_tokens=usage.get("completion_tokens", 0),
+                )
+                choice = body["choices"][0]
+                if choice.get("finish_reason") == "length":
+                    yield item["custom_id"], None, TRUNCATED_ERROR
+                    continue
+                yield item["custom_id"], choice["message"]["content"], None
+            else:
+                yield item["custom_id"], None, json.dumps(item.get("error") or body.get("error") or response, ensure_ascii=False)
+
+
+_PROVIDERS = {
+    "anthropic": (_anthropic_submit, _anthropic_finished, _anthropic_results),
+    "openai": (_openai_submit, _openai_finished, _openai_results),
+}
+
+
+def _manifest_path(batch_id: str) -> str:
+    return os.path.join(BULK_DIR, f"{batch_id}.json")
+
+
+async def submit(image_paths: list[str], kind: str, provider: str | None = None) -> dict | None:
+    """Submit every page not yet in the extraction store as one provider batch.
+
+    Returns the saved manifest, or None when every page was already stored.
+    """
+    provider = (provider or current_provider()).lower()
+    prompt, _ = BULK_KINDS[kind]
+    submit_batch, _, _ = _PROVIDERS[provider]
+    pages, skipped = prepare_pages(image_paths, kind, provider)
+    if skipped:
+        logger.info(f"[Bulk] {skipped} pages already stored, skipping")
+    if not pages:
+        return None
+    batch_id = await submit_batch(pages, prompt)
+
+    manifest = {
+        "batch_id": batch_id,
+        "provider": provider,
+        "kind": kind,
+        "model": model_for(provider),
+        "submitted_at": time.time(),
+        "pages": [{"custom_id": p["custom_id"], "source": p["source"], "key": p["key"]} for p in pages],
+    }
+    os.makedirs(BULK_DIR, exist_ok=True)
+    with open(_manifest_path(batch_id), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"[Bulk] Submitted {len(pages)} {kind} pages to {provider} as {batch_id}")
+    return manifest
+
+
+def load_manifest(batch_id_or_path: str) -> dict:
+    path = batch_id_or_path if os.path.exists(batch_id_or_path) else _manifest_path(batch_id_or_path)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def wait(manifest: dict, poll_interval: float = BULK_POLL_INTERVAL):
+    """Poll the provider until the batch has ended; transient polling errors are retried."""
+    _, finished, _ = _PROVIDERS[manifest["provider"]]
+    while True:
+        try:
+            if await finished(manifest["batch_id"]):
+                return
+        except Exception as e:
+            logger.warning(f"[Bulk] Polling {manifest['batch_id']} failed, retrying: {type(e).__name__}: {e}")
+        await asyncio.sleep(poll_interval)
+
+
+async def collect(manifest: dict) -> dict:
+    """Parse every result with the interactive parser and store it under the page's cache key."""
+    prompt, parse = BULK_KINDS[manifest["kind"]]
+    _, _, results = _PROVIDERS[manifest["provider"]]
+    pages = {p["custom_id"]: p for p in manifest["pages"]}
+    stored = 0
+    empty = 0
+    errors = {}
+    async for custom_id, text, error in results(manifest["batch_id"]):
+        page = pages.get(custom_id)
+        if page is None:
+            continue
+        if error is not None:
+            errors[page["source"]] = error
+            continue
+        try:
+            result = parse(validate_reply(prompt, text))
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            errors[page["source"]] = f"{type(e).__name__}: {e}"
+            continue
+        if not valid_result(result):
+            errors[page["source"]] = "unexpected result shape"
+            continue
+        # Empty pages are left out, as in _run_extraction, so an upload can retry them
+        if not (result.get("entries") if isinstance(result, dict) else result):
+            empty += 1
+            continue
+        await extraction_cache.aput(page["key"], result, prompt)
+        stored += 1
+
+    summary = {
+        "batch_id": manifest["batch_id"],
+        "pages": len(pages),
+        "stored": stored,
+        "empty": empty,
+        "failed": len(errors),
+        "errors": errors,
+    }
+    received = stored + empty + len(errors)
+    if received < len(pages):
+        summary["missing_results"] = len(pages) - received
+    return summary
+
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+CACHE_DIR = os.getenv(
+    "EXTRACTION_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "temp", "cache"),
+)
+CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "1") != "0"
+CACHE_MEMORY_BYTES = int(float(os.getenv("EXTRACTION_CACHE_MEMORY_MB", "32")) * 1024 * 1024)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompt_hash(prompt: str) -> str:
+    return _sha256(prompt.encode("utf-8"))
+
+
+class ExtractionCache:
+    """Two-tier cache of parsed extraction results.
+
+    Tier 1 is an in-memory LRU bounded by the total size of the serialized
+    results; tier 2 is a SQLite file that survives restarts. Values are kept
+    as JSON text, so every hit hands back a fresh copy the caller may mutate.
+    Async callers use ``aget``/``aput``, which only touch the memory tier on
+    the event loop and run the SQLite tier in a worker thread.
+    """
+
+    def __init__(self, db_path: str | None, max_memory_bytes: int):
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # SQLite has its own lock so a slow disk read or commit never holds up a memory lookup
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            # Several worker processes share the file: readers must not block on a writer
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                " key TEXT PRIMARY KEY,"
+                " prompt_hash TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_extraction_cache_prompt ON extraction_cache (prompt_hash)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, prompt: str, provider: str, model: str) -> str:
+        """SHA-256 over the image bytes, prompt text, provider and model name."""
+        h = hashlib.sha256()
+        h.update(_sha256(image_bytes).encode())
+        h.update(b"\0")
+        h.update(prompt_hash(prompt).encode())
+        h.update(b"\0")
+        h.update(provider.encode())
+        h.update(b"\0")
+        h.update(model.encode())
+        return h.hexdigest()
+
+    def get(self, key: str):
+        """Return a fresh copy of the cached result, or None on a miss."""
+        value = self._memory_get(key)
+        if value is None:
+            value = self._disk_get(key)
+        return None if value is None else json.loads(value)
+
+    async def aget(self, key: str):
+        """``get`` for the event loop: the memory tier inline, the SQLite tier in a thread."""
+        value = self._memory_get(key)
+        if value is None:
+            value = await asyncio.to_thread(self._disk_get, key)
+        return None if value is None else json.loads(value)
+
+    def put(self, key: str, result, prompt: str):
+        value = json.dumps(result, ensure_ascii=False)
+        self._memory_put(key, value)
+        self._disk_put(key, value, prompt)
+
+    async def aput(self, key: str, result, prompt: str):
+        """``put`` for the event loop: the memory tier inline, the SQLite write in a thread."""
+        value = json.dumps(result, ensure_ascii=False)
+        self._memory_put(key, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, value, prompt)
+
+    def _memory_get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return value
+
+    def _memory_put(self, key: str, value: str):
+        with self._lock:
+            self._remember(key, value)
+
+    def _disk_get(self, key: str) -> str | None:
+        """Look ``key`` up in SQLite (after a memory miss), promoting a hit to the memory tier."""
+        row = None
+        with self._db_lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._remember(key, row[0])
+            self.disk_hits += 1
+            return row[0]
+
+    def _disk_put(self, key: str, value: str, prompt: str):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache (key, prompt_hash, value, created_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, prompt_hash(prompt), value, time.time()),
+                )
+                self._db.commit()
+
+    def invalidate(self, prompt: str | None = None) -> int:
+        """Drop entries made with ``prompt`` (or everything when None). Returns rows removed."""
+        with self._lock:
+            # Memory keys do not carry the prompt, so clear the (cheap) memory tier entirely
+            self._memory.clear()
+            self._memory_bytes = 0
+        with self._db_lock:
+            if self._db is None:
+                return 0
+            if prompt is None:
+                cur = self._db.execute("DELETE FROM extraction_cache")
+            else:
+                cur = self._db.execute(
+                    "DELETE FROM extraction_cache WHERE prompt_hash = ?", (prompt_hash(prompt),)
+                )
+            self._db.commit()
+            return cur.rowcount
+
+    def purge_stale_prompts(self, current_prompts) -> int:
+        """Remove disk entries whose prompt is no longer one of ``current_prompts``."""
+        if self._db is None:
+            return 0
+        hashes = [prompt_hash(p) for p in current_prompts]
+        placeholders = ",".join("?" for _ in hashes)
+        with self._db_lock:
+            cur = self._db.execute(
+                f"DELETE FROM extraction_cache WHERE prompt_hash NOT IN ({placeholders})", hashes
+            )
+            self._db.commit()
+        if cur.rowcount:
+            logger.info(f"[Cache] Purged {cur.rowcount} entries from changed prompts")
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        disk_entries = 0
+        with self._db_lock:
+            if self._db is not None:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM extraction_cache").fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": disk_entries,
+            }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key: str, value: str):
+        """Insert into the memory tier, evicting least recently used entries over budget."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old.encode("utf-8"))
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode("utf-8"))
+
+
+extraction_cache = ExtractionCache(
+    os.path.join(CACHE_DIR, "extraction.sqlite3") if CACHE_ENABLED else None,
+    CACHE_MEMORY_BYTES if CACHE_ENABLED else 0,
+)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from app.services.word_generator import preload_templates
+from app.services.workbook_generator import preload_layouts
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+# Processes building .docx files; 0 builds them in a thread of the app process instead
+GENERATE_WORKERS = int(os.getenv("GENERATE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _preload():
+    preload_templates()
+    preload_layouts()
+
+
+class GenerationPool:
+    """Runs the CPU-bound Word generators in a fixed pool of worker processes.
+
+    python-docx XML building and zip compression hold the GIL, so running them
+    in the app process stalls every upload and poll on the event loop. Workers
+    parse the Word templates and build the streaming layouts once when they
+    start. Generators are called with
+    picklable arguments and return the document as bytes; the artifact cache
+    decides whether it is kept in memory or written to temp/.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._seconds = 0.0
+
+    def start(self, workers: int = GENERATE_WORKERS):
+        self.workers = max(0, workers)
+        if self.workers:
+            # spawn: forking a process that runs an event loop and client threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_preload,
+            )
+        else:
+            _preload()
+        logger.info(f"[Generate] Started {self.workers or 'no'} worker processes")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        """Await ``fn(*args)`` in a worker process (or a thread when the pool is disabled)."""
+        executor = self._executor
+        self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            if executor is None:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            self._failed += 1
+            # A worker died (e.g. killed for memory); replace the pool once so later requests work
+            if self._executor is executor:
+                logger.error("[Generate] Worker process died, restarting the pool")
+                self.stop()
+                self.start(self.workers)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        self._completed += 1
+        self._seconds += time.perf_counter() - start
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": min(self._in_flight, self.workers) if self.workers else self._in_flight,
+            "queued": max(0, self._in_flight - self.workers) if self.workers else 0,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_seconds": round(self._seconds / self._completed, 3) if self._completed else 0.0,
+        }
+
+
+generation_pool = GenerationPool()
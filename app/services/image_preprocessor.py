@@ -0,0 +1,202 @@
+import io
+import logging
+import math
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+from PIL import Image, ImageChops, ImageOps, ImageStat, UnidentifiedImageError
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "1") != "0"
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "1") != "0"
+# Mean per-pixel RGB channel spread (0-255) below which a page is treated as black & white
+IMAGE_GRAYSCALE_MAX_SPREAD = float(os.getenv("IMAGE_GRAYSCALE_MAX_SPREAD", "12"))
+
+# Longest-edge / pixel limits matched to each provider's vision resizing.
+# Anthropic downsizes anything over 1568px or ~1.15MP; OpenAI (detail=high)
+# fits the image in 2048x2048 and then scales the short side to 768px (512px tiles).
+PROVIDER_IMAGE_LIMITS = {
+    "anthropic": {
+        "max_edge": int(os.getenv("IMAGE_MAX_EDGE_ANTHROPIC", "1568")),
+        "max_short_edge": None,
+        "max_pixels": int(os.getenv("IMAGE_MAX_PIXELS_ANTHROPIC", "1150000")),
+    },
+    "openai": {
+        "max_edge": int(os.getenv("IMAGE_MAX_EDGE_OPENAI", "2048")),
+        "max_short_edge": int(os.getenv("IMAGE_MAX_SHORT_EDGE_OPENAI", "768")),
+        "max_pixels": None,
+    },
+}
+
+_MAGIC_MEDIA_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def sniff_media_type(data: bytes) -> str | None:
+    """Detect the image media type from magic bytes."""
+    for magic, media_type in _MAGIC_MEDIA_TYPES:
+        if data.startswith(magic):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+MEDIA_TYPE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+@dataclass
+class ImageStats:
+    original_bytes: int
+    processed_bytes: int
+    original_size: tuple[int, int] | None = None
+    processed_size: tuple[int, int] | None = None
+    grayscale: bool = False
+    original_tokens: int | None = None
+    processed_tokens: int | None = None
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    media_type: str
+    stats: ImageStats
+
+
+def estimate_image_tokens(width: int, height: int, provider: str) -> int:
+    """Rough input-token cost of an image after the provider's own server-side resizing."""
+    if provider == "openai":
+        w, h = _fit(width, height, 2048, 768, None)
+        tiles = math.ceil(w / 512) * math.ceil(h / 512)
+        return 85 + 170 * tiles
+    w, h = _fit(width, height, 1568, None, 1_150_000)
+    return int(w * h / 750)
+
+
+def _fit(width: int, height: int, max_edge: int | None, max_short_edge: int | None, max_pixels: int | None):
+    scale = 1.0
+    if max_edge:
+        scale = min(scale, max_edge / max(width, height))
+    if max_short_edge:
+        scale = min(scale, max_short_edge / min(width, height))
+    if max_pixels:
+        scale = min(scale, math.sqrt(max_pixels / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _is_effectively_gray(img: Image.Image) -> bool:
+    """True when the page has no meaningful color (black text on white/cream paper)."""
+    thumb = img.copy()
+    thumb.thumbnail((256, 256))
+    r, g, b = thumb.split()
+    spread = max(
+        ImageStat.Stat(ImageChops.difference(r, g)).mean[0],
+        ImageStat.Stat(ImageChops.difference(g, b)).mean[0],
+        ImageStat.Stat(ImageChops.difference(r, b)).mean[0],
+    )
+    return spread < IMAGE_GRAYSCALE_MAX_SPREAD
+
+
+def preprocess_image(data: bytes, provider: str | None = None) -> PreprocessedImage:
+    """Orient, downscale and re-encode an uploaded page before it is sent to the AI.
+
+    Falls back to the original bytes when Pillow cannot read the image (or
+    refuses it as a decompression bomb) or when re-encoding would not make it smaller.
+    """
+    provider = (provider or os.getenv("AI_PROVIDER", "anthropic")).lower()
+    original_type = sniff_media_type(data) or "image/jpeg"
+    passthrough = PreprocessedImage(data, original_type, ImageStats(len(data), len(data)))
+    if not IMAGE_PREPROCESS_ENABLED:
+        return passthrough
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        # A huge scan over Pillow's pixel limit is still a valid page for the provider
+        logger.warning(f"[Preprocess] Could not decode image, sending as-is: {e}")
+        return passthrough
+
+    original_size = img.size
+    original_tokens = estimate_image_tokens(*original_size, provider)
+
+    oriented = img.getexif().get(0x0112, 1) != 1  # EXIF Orientation tag
+    img = ImageOps.exif_transpose(img)
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    grayscale = img.mode == "L"
+    if IMAGE_GRAYSCALE and not grayscale and _is_effectively_gray(img):
+        img = img.convert("L")
+        grayscale = True
+
+    limits = PROVIDER_IMAGE_LIMITS.get(provider, PROVIDER_IMAGE_LIMITS["anthropic"])
+    target = _fit(*img.size, limits["max_edge"], limits["max_short_edge"], limits["max_pixels"])
+    resized = target != img.size
+    if resized:
+        img = img.resize(target, Image.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    processed = out.getvalue()
+
+    if len(processed) >= len(data) and not resized and not oriented:
+        return PreprocessedImage(
+            data,
+            original_type,
+            ImageStats(len(data), len(data), original_size, original_size, False, original_tokens, original_tokens),
+        )
+
+    stats = ImageStats(
+        original_bytes=len(data),
+        processed_bytes=len(processed),
+        original_size=original_size,
+        processed_size=img.size,
+        grayscale=grayscale,
+        original_tokens=original_tokens,
+        processed_tokens=estimate_image_tokens(*img.size, provider),
+    )
+    return PreprocessedImage(processed, "image/jpeg", stats)
+
+
+def summarize_stats(stats: list[ImageStats]) -> dict:
+    """Aggregate per-page stats into the per-request summary returned by upload endpoints."""
+    original = sum(s.original_bytes for s in stats)
+    processed = sum(s.processed_bytes for s in stats)
+    summary = {
+        "pages": len(stats),
+        "original_bytes": original,
+        "processed_bytes": processed,
+        "saved_bytes": original - processed,
+        "saved_ratio": round((original - processed) / original, 3) if original else 0.0,
+    }
+    if all(s.original_tokens is not None for s in stats):
+        summary["original_image_tokens"] = sum(s.original_tokens for s in stats)
+        summary["processed_image_tokens"] = sum(s.processed_tokens for s in stats)
+    return summary
@@ -0,0 +1,400 @@
+import asyncio
+import logging
+import os
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from app.services.shared_store import SHARED_POLL_INTERVAL, shared_store
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+# Jobs extracted at the same time; pages within one job are bounded separately
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_PAGE_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+# Finished jobs (and their results) stay pollable this long
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# Progress changes within this many seconds share one snapshot write to the shared store
+JOB_PUBLISH_INTERVAL = float(os.getenv("JOB_PUBLISH_INTERVAL", "0.25"))
+
+QUEUED = "queued"
+RUNNING = "running"
+PARTIAL = "partial"  # finished, but some pages failed
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (PARTIAL, DONE, FAILED)
+
+
+def _new_page() -> dict:
+    return {"status": QUEUED, "count": None, "error": None}
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    pages: list[dict]
+    status: str = QUEUED
+    result: dict | None = None
+    error: str | None = None
+    image_stats: dict | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    version: int = 0
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    # Called after every change, e.g. to publish the job to the other workers
+    _on_change: object = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def _touch(self):
+        # Wake every long-poll / SSE waiter, then arm a fresh event for the next change
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def start(self):
+        self.status = RUNNING
+        self._touch()
+
+    def add_page(self) -> int:
+        """Append a page to a job whose pages are still arriving; returns its index."""
+        self.pages.append(_new_page())
+        self._touch()
+        return len(self.pages) - 1
+
+    def set_image_stats(self, image_stats: dict):
+        self.image_stats = image_stats
+        self._touch()
+
+    def start_page(self, page: int):
+        if self.pages[page]["status"] == QUEUED:
+            self.pages[page]["status"] = RUNNING
+            self._touch()
+
+    def finish_page(self, page: int, count: int):
+        self.pages[page].update(status=DONE, count=count)
+        self._touch()
+
+    def fail_page(self, page: int, error: str):
+        self.pages[page].update(status=FAILED, error=error)
+        self._touch()
+
+    def complete(self, result: dict):
+        failed = sum(1 for p in self.pages if p["status"] == FAILED)
+        if failed == 0:
+            self.status = DONE
+        elif failed < len(self.pages):
+            self.status = PARTIAL
+        else:
+            self.status = FAILED
+            self.error = self.pages[0]["error"]
+        self.result = result
+        self.finished_at = time.time()
+        self._touch()
+
+    def fail(self, error: str):
+        self.status = FAILED
+        self.error = error
+        self.finished_at = time.time()
+        self._touch()
+
+    async def wait_for_change(self, since: int, timeout: float):
+        """Return once ``version`` has moved past ``since``, the job finished, or ``timeout`` elapsed."""
+        if self.version > since or self.finished:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "version": self.version,
+            "total_pages": len(self.pages),
+            "completed_pages": sum(1 for p in self.pages if p["status"] == DONE),
+            "failed_pages": sum(1 for p in self.pages if p["status"] == FAILED),
+            # Copied: the snapshot may be serialized for the shared store after further changes
+            "pages": [dict(p) for p in self.pages],
+            "image_stats": self.image_stats,
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class SharedJob:
+    """Read-only view of a job owned by another worker process, read from the shared store.
+
+    Offers what the job endpoints use from Job; waiting re-reads the store
+    every SHARED_POLL_INTERVAL seconds instead of awaiting an event.
+    """
+
+    def __init__(self, snapshot: dict):
+        self._snapshot = snapshot
+
+    @property
+    def id(self) -> str:
+        return self._snapshot["job_id"]
+
+    @property
+    def version(self) -> int:
+        return self._snapshot["version"]
+
+    @property
+    def finished(self) -> bool:
+        return self._snapshot["status"] in FINISHED_STATES
+
+    async def wait_for_change(self, since: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while self.version <= since and not self.finished and time.monotonic() < deadline:
+            await asyncio.sleep(min(SHARED_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            snapshot = await asyncio.to_thread(shared_store.get_job, self.id)
+            if snapshot is not None:
+                self._snapshot = snapshot
+
+    def to_dict(self) -> dict:
+        return dict(self._snapshot)
+
+
+class JobManager:
+    """In-process job queue drained by a fixed pool of async workers.
+
+    Upload endpoints save the pages, ``submit`` them and return the job id at
+    once; clients follow progress through ``GET /api/jobs/{job_id}``. Every
+    change is written to the shared store, so with several worker processes
+    the poll may land on any of them. Store writes run on the store's writer
+    thread; progress changes are coalesced into one write per
+    JOB_PUBLISH_INTERVAL, while new and finished jobs are written at once.
+    """
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        # Jobs with a delayed snapshot write pending -> its timer
+        self._unpublished: dict[str, asyncio.TimerHandle] = {}
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        # Background completions of jobs fed by run_incoming
+        self._incoming: set[asyncio.Task] = set()
+
+    def start(self, workers: int = JOB_WORKERS):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(max(1, workers))]
+        logger.info(f"[Jobs] Started {len(self._workers)} workers")
+
+    async def stop(self):
+        tasks = self._workers + list(self._incoming)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._incoming.clear()
+        for job_id in list(self._unpublished):
+            self._cancel_publish(job_id)
+            self._write(self.jobs[job_id])
+
+    def create(self, kind: str, page_count: int, image_stats: dict | None = None) -> Job:
+        """Register a tracked job without queueing it (used by the streaming endpoints)."""
+        self._prune()
+        job = Job(
+            id=str(uuid.uuid4()),
+            kind=kind,
+            pages=[_new_page() for _ in range(page_count)],
+            image_stats=image_stats,
+            _on_change=self._publish,
+        )
+        self.jobs[job.id] = job
+        self._publish(job)
+        return job
+
+    def submit(
+        self,
+        kind: str,
+        paths: list[str],
+        extract,
+        merge,
+        image_stats: dict | None = None,
+        cleanup=None,
+        extract_batch=None,
+        batch_size: int = 1,
+    ) -> Job:
+        """Queue a multi-page extraction.
+
+        ``extract(path)`` is awaited per page; ``merge(results)`` gets the successful
+        page results in page order and returns the job result. With ``extract_batch``
+        and ``batch_size`` > 1, pages go in groups through ``extract_batch(paths)``,
+        which returns one result or exception per page. ``cleanup()`` runs once the
+        job has finished either way.
+        """
+        if not self._workers:
+            self.start()
+        job = self.create(kind, len(paths), image_stats)
+        size = batch_size if extract_batch is not None else 1
+        self._queue.put_nowait((job, paths, extract, extract_batch, size, merge, cleanup))
+        logger.info(f"[Jobs] Queued {kind} job {job.id} ({len(paths)} pages)")
+        return job
+
+    async def run_incoming(self, kind: str, incoming, extract, merge) -> Job:
+        """Extract pages while they are still arriving.
+
+        Every page the async iterator ``incoming`` yields is handed to ``extract``
+        at once (bounded like the pages of a queued job). Returns when ``incoming``
+        is exhausted; the job then finishes in the background. If ``incoming``
+        raises, the pages already started are cancelled, the job fails and the
+        error propagates.
+        """
+        job = self.create(kind, 0)
+        job.start()
+        semaphore = asyncio.Semaphore(JOB_PAGE_CONCURRENCY)
+        results = []
+        tasks = []
+
+        async def run_page(page, source):
+            async with semaphore:
+                job.start_page(page)
+                try:
+                    outcome = await extract(source)
+                except Exception as e:
+                    outcome = e
+            self._record(job, page, outcome, results)
+
+        try:
+            async for source in incoming:
+                page = job.add_page()
+                results.append(None)
+                tasks.append(asyncio.create_task(run_page(page, source)))
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                job.fail(str(e) or "업로드가 중단되었습니다.")
+            else:
+                # Rejected before the first page: nobody has the job id yet
+                del self.jobs[job.id]
+                self._cancel_publish(job.id)
+                shared_store.defer(shared_store.delete_job, job.id)
+            raise
+        logger.info(f"[Jobs] Received all {len(tasks)} pages of {kind} job {job.id}")
+
+        finisher = asyncio.create_task(self._finish_incoming(job, tasks, results, merge))
+        self._incoming.add(finisher)
+        finisher.add_done_callback(self._incoming.discard)
+        return job
+
+    async def _finish_incoming(self, job: Job, tasks: list[asyncio.Task], results: list, merge):
+        try:
+            await asyncio.gather(*tasks)
+            job.complete(merge([r for r in results if r is not None]))
+            logger.info(f"[Jobs] {job.kind} job {job.id} {job.status}")
+        except Exception as e:
+            logger.error(f"[Jobs] {job.id} failed: {traceback.format_exc()}")
+            job.fail(f"서버 오류: {type(e).__name__}: {str(e)}")
+
+    async def get(self, job_id: str) -> Job | SharedJob | None:
+        """The job, or a view of it from the shared store when another worker runs it."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        snapshot = await asyncio.to_thread(shared_store.get_job, job_id)
+        return SharedJob(snapshot) if snapshot is not None else None
+
+    def _publish(self, job: Job):
+        """Write the job to the shared store: at once when new or finished, else after JOB_PUBLISH_INTERVAL."""
+        if job.version == 0 or job.finished or JOB_PUBLISH_INTERVAL <= 0:
+            self._cancel_publish(job.id)
+            self._write(job)
+        elif job.id not in self._unpublished:
+            loop = asyncio.get_running_loop()
+            self._unpublished[job.id] = loop.call_later(JOB_PUBLISH_INTERVAL, self._write, job)
+
+    def _write(self, job: Job):
+        # Snapshot taken on the loop; serializing and the SQLite write happen on the writer thread
+        self._unpublished.pop(job.id, None)
+        shared_store.defer(shared_store.put_job, job.id, job.to_dict(), job.finished_at)
+
+    def _cancel_publish(self, job_id: str):
+        handle = self._unpublished.pop(job_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    async def _worker(self):
+        while True:
+            job, paths, extract, extract_batch, batch_size, merge, cleanup = await self._queue.get()
+            try:
+                await self._run(job, paths, extract, extract_batch, batch_size, merge)
+            except Exception as e:
+                logger.error(f"[Jobs] {job.id} failed: {traceback.format_exc()}")
+                job.fail(f"서버 오류: {type(e).__name__}: {str(e)}")
+            finally:
+                if cleanup is not None:
+                    try:
+                        cleanup()
+                    except Exception:
+                        # The worker must survive to run the jobs queued behind this one
+                        logger.error(f"[Jobs] {job.id} cleanup failed: {traceback.format_exc()}")
+                self._queue.task_done()
+
+    async def _run(self, job: Job, paths: list[str], extract, extract_batch, batch_size: int, merge):
+        job.start()
+        semaphore = asyncio.Semaphore(JOB_PAGE_CONCURRENCY)
+        results = [None] * len(paths)
+
+        async def run_pages(pages):
+            async with semaphore:
+                for page in pages:
+                    job.start_page(page)
+                try:
+                    if len(pages) > 1:
+                        outcomes = await extract_batch([paths[page] for page in pages])
+                    else:
+                        outcomes = [await extract(paths[pages[0]])]
+                except Exception as e:
+                    outcomes = [e] * len(pages)
+            for page, outcome in zip(pages, outcomes):
+                self._record(job, page, outcome, results)
+
+        groups = [list(range(i, min(i + batch_size, len(paths)))) for i in range(0, len(paths), batch_size)]
+        await asyncio.gather(*[run_pages(pages) for pages in groups])
+        job.complete(merge([r for r in results if r is not None]))
+        logger.info(f"[Jobs] {job.kind} job {job.id} {job.status}")
+
+    @staticmethod
+    def _record(job: Job, page: int, outcome, results: list):
+        """Store one page's result, or mark the page failed when ``outcome`` is an exception."""
+        if isinstance(outcome, Exception):
+            logger.error(f"[Jobs] {job.id} page {page} failed", exc_info=outcome)
+            job.fail_page(page, f"서버 오류: {type(outcome).__name__}: {str(outcome)}")
+            return
+        results[page] = outcome
+        # Word lists count their rows; workbook results carry an "entries" list
+        job.finish_page(page, len(outcome["entries"]) if isinstance(outcome, dict) else len(outcome))
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RESULT_TTL
+        for job_id in [j.id for j in self.jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+        shared_store.defer(shared_store.prune_jobs, cutoff)
+
+    def stats(self) -> dict:
+        counts: dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": counts,
+        }
+
+
+jobs = JobManager()
@@ -0,0 +1,144 @@
+from dataclasses import dataclass
+
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.image_preprocessor import sniff_media_type
+
+# Leading bytes needed by every signature sniff_media_type knows (WEBP is the longest)
+MAGIC_BYTES = 12
+
+
+class UploadRejected(Exception):
+    """The upload was refused mid-stream; carries the HTTP status and the user-facing message."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class UploadedImage:
+    filename: str
+    content_type: str
+    data: bytes
+
+
+class _Part:
+    def __init__(self):
+        self.headers: dict[str, str] = {}
+        self.name: str | None = None
+        self.filename: str | None = None
+        self.content_type = ""
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.checked = False
+
+    @property
+    def is_file(self) -> bool:
+        return self.filename is not None
+
+
+async def iter_image_parts(request: Request, field: str, max_file_bytes: int, max_total_bytes: int):
+    """Parse a multipart/form-data body while it is still arriving and yield each image in ``field``.
+
+    Every image is yielded as soon as its part ends, so page 1 can be processed
+    while the rest of the body is in flight. Raises UploadRejected as early as
+    possible: 413 once a file or the body grows past its limit (or a declared
+    Content-Length already does), 400 for a non-image part, judged by its
+    content type and then its magic bytes. Other form fields are ignored.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(400, "multipart/form-data 형식으로 업로드해주세요.")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_total_bytes:
+        raise UploadRejected(413, f"업로드 전체 크기가 {max_total_bytes // (1024 * 1024)}MB를 넘습니다.")
+
+    finished: list[UploadedImage] = []
+    state = {"part": None, "field": b"", "value": b"", "error": None}
+
+    def reject(status_code: int, detail: str):
+        if state["error"] is None:
+            state["error"] = UploadRejected(status_code, detail)
+
+    def check_magic(part: _Part):
+        part.checked = True
+        if sniff_media_type(b"".join(part.chunks)[:MAGIC_BYTES]) is None:
+            reject(400, f"이미지 파일만 업로드 가능합니다: {part.filename}")
+
+    def on_part_begin():
+        state["part"] = _Part()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["part"].headers[state["field"].decode("latin-1").lower()] = state["value"].decode("utf-8", "replace")
+        state["field"] = state["value"] = b""
+
+    def on_headers_finished():
+        part = state["part"]
+        _, options = parse_options_header(part.headers.get("content-disposition", ""))
+        part.name = options.get(b"name", b"").decode("utf-8", "replace")
+        if part.name != field or b"filename" not in options:
+            return
+        part.filename = options[b"filename"].decode("utf-8", "replace")
+        part.content_type = part.headers.get("content-type", "")
+        if not part.content_type.startswith("image/"):
+            reject(400, f"이미지 파일만 업로드 가능합니다: {part.filename}")
+
+    def on_part_data(data: bytes, start: int, end: int):
+        part = state["part"]
+        if not part.is_file or state["error"] is not None:
+            return
+        part.chunks.append(data[start:end])
+        part.size += end - start
+        if part.size > max_file_bytes:
+            reject(413, f"파일 크기가 {max_file_bytes // (1024 * 1024)}MB를 넘습니다: {part.filename}")
+        elif not part.checked and part.size >= MAGIC_BYTES:
+            check_magic(part)
+
+    def on_part_end():
+        part = state["part"]
+        if not part.is_file or state["error"] is not None:
+            return
+        if not part.checked:
+            check_magic(part)
+        if state["error"] is None:
+            finished.append(UploadedImage(part.filename, part.content_type, b"".join(part.chunks)))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_total_bytes:
+            raise UploadRejected(413, f"업로드 전체 크기가 {max_total_bytes // (1024 * 1024)}MB를 넘습니다.")
+        try:
+            parser.write(chunk)
+        except MultipartParseError as e:
+            raise UploadRejected(400, f"잘못된 multipart 요청입니다: {e}")
+        if state["error"] is not None:
+            raise state["error"]
+        while finished:
+            yield finished.pop(0)
+    parser.finalize()
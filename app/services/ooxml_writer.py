@@ -0,0 +1,147 @@
+"""Streaming .docx writer built from fragments of python-docx output.
+
+The generators first build small *probe* documents with python-docx, where
+every piece of user text (and every per-document value such as a column
+width) is a marker. ``<?cut ?>`` processing instructions mark where the probe
+is split into head, repeated row / paragraph and tail fragments. Each
+fragment is serialized exactly the way python-docx serializes a part, then
+compiled once into literal strings and slots. A large document is then
+written by streaming fragments with the real values straight into the
+``word/document.xml`` entry of the zip. The element tree is never built, so
+memory stays flat however many rows there are. The other parts of the
+package are copied byte for byte from the saved probe.
+"""
+import io
+import os
+import re
+import time
+import zipfile
+from xml.sax.saxutils import escape, unescape
+
+from docx.opc.oxml import serialize_part_xml
+from dotenv import load_dotenv
+from lxml import etree
+
+load_dotenv()
+
+# Documents with at least this many entries are streamed instead of built with python-docx
+DOCX_STREAM_MIN_ENTRIES = int(os.getenv("DOCX_STREAM_MIN_ENTRIES", "200"))
+
+DOCUMENT_PART = "word/document.xml"
+
+_MARK = "\ue000"  # private-use character, never produced by extraction
+_CUT = "<?cut ?>"
+# A run's text element holding markers, or a bare marker (e.g. in an attribute value)
+_SLOT_RE = re.compile(rf'<w:t(?: xml:space="preserve")?>([^<]*{_MARK}[^<]*)</w:t>|{_MARK}(\w+){_MARK}')
+_MARK_RE = re.compile(rf"{_MARK}(\w+){_MARK}")
+# Characters lxml refuses in text; python-docx would fail on them the same way
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_RUN_CONTENT_RE = re.compile("([\t\r\n])")
+
+_BUFFER_CHARS = 1 << 16
+
+
+def mark(name: str) -> str:
+    """Placeholder text for the value ``name``; probes use it wherever real text would go."""
+    return f"{_MARK}{name}{_MARK}"
+
+
+def cut_before(element):
+    element.addprevious(etree.ProcessingInstruction("cut"))
+
+
+def cut_after(element):
+    element.addnext(etree.ProcessingInstruction("cut"))
+
+
+def cut_end(parent):
+    """Cut after the last child of ``parent`` (e.g. before ``</w:body>``)."""
+    parent.append(etree.ProcessingInstruction("cut"))
+
+
+def split_part(element) -> list[str]:
+    """Serialize a part the way python-docx saves it and split it at its cuts."""
+    return serialize_part_xml(element).decode("utf-8").split(_CUT)
+
+
+def package_members(document) -> list[tuple[str, bytes]]:
+    """Every zip member of ``document`` as python-docx would save it, in the same order."""
+    buffer = io.BytesIO()
+    document.save(buffer)
+    with zipfile.ZipFile(buffer) as zf:
+        return [(info.filename, zf.read(info)) for info in zf.infolist()]
+
+
+def text_xml(text: str) -> str:
+    """The run content python-docx writes for ``text``: w:t runs, w:tab for tabs, w:br for line breaks."""
+    if _INVALID_XML_RE.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    parts = []
+    for piece in _RUN_CONTENT_RE.split(text):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ""
+            parts.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return "".join(parts)
+
+
+class Fragment:
+    """A serialized XML fragment compiled into literal strings and value slots."""
+
+    def __init__(self, xml: str):
+        self._parts: list = []
+        pos = 0
+        for match in _SLOT_RE.finditer(xml):
+            self._parts.append(xml[pos:match.start()])
+            if match.group(1) is not None:
+                # Text run: python-docx picks w:t / xml:space from the final text, so keep a template
+                pieces = _MARK_RE.split(unescape(match.group(1)))
+                self._parts.append(("text", tuple(pieces)))
+            else:
+                self._parts.append(("value", match.group(2)))
+            pos = match.end()
+        self._parts.append(xml[pos:])
+
+    def render(self, values: dict) -> str:
+        out = []
+        for part in self._parts:
+            if isinstance(part, str):
+                out.append(part)
+            elif part[0] == "text":
+                # pieces alternate literal text and value names
+                pieces = part[1]
+                out.append(text_xml("".join(values[p] if i % 2 else p for i, p in enumerate(pieces))))
+            else:
+                out.append(escape(values[part[1]], {'"': "&quot;"}))
+        return "".join(out)
+
+
+def write_docx(output, members: list[tuple[str, bytes]], document_chunks):
+    """Write a .docx to ``output`` (a path or binary file) with ``members`` copied as-is and
+    ``word/document.xml`` streamed from ``document_chunks``.
+
+    Entries are written like python-docx writes them (same order, deflate,
+    permissions), so only the timestamps differ from a python-docx save.
+    """
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members:
+            if name != DOCUMENT_PART:
+                zf.writestr(name, data)
+                continue
+            info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o600 << 16
+            with zf.open(info, "w") as f:
+                buffer = []
+                size = 0
+                for chunk in document_chunks:
+                    buffer.append(chunk)
+                    size += len(chunk)
+                    if size >= _BUFFER_CHARS:
+                        f.write("".join(buffer).encode("utf-8"))
+                        buffer.clear()
+                        size = 0
+                f.write("".join(buffer).encode("utf-8"))
@@ -0,0 +1,91 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+# Connection pool tuning shared by every call to the same provider.
+# A batch upload of 20-40 pages fans out concurrently, so keep enough
+# keep-alive sockets around to avoid re-handshaking TLS between pages.
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "50"))
+PROVIDER_MAX_KEEPALIVE = int(os.getenv("PROVIDER_MAX_KEEPALIVE", "20"))
+PROVIDER_KEEPALIVE_EXPIRY = float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", "120"))
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "180"))
+
+
+class ProviderClientRegistry:
+    """Long-lived AsyncAnthropic / AsyncOpenAI clients, one pooled client per provider.
+
+    Clients are created lazily on first use (or eagerly by ``startup``) and
+    closed together by ``aclose`` when the app shuts down.
+    """
+
+    def __init__(self):
+        self._clients: dict[str, object] = {}
+
+    def startup(self):
+        """Create clients for every provider that has an API key configured."""
+        if os.getenv("ANTHROPIC_API_KEY"):
+            self.anthropic()
+        if os.getenv("OPENAI_API_KEY"):
+            self.openai()
+
+    def anthropic(self):
+        client = self._clients.get("anthropic")
+        if client is None:
+            import anthropic
+
+            client = anthropic.AsyncAnthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                timeout=PROVIDER_TIMEOUT,
+                max_retries=0,  # retries are driven by rate_limiter so 429s reach the AIMD controller
+                http_client=anthropic.DefaultAsyncHttpxClient(
+                    limits=_pool_limits(anthropic.DEFAULT_CONNECTION_LIMITS),
+                    timeout=PROVIDER_TIMEOUT,
+                ),
+            )
+            self._clients["anthropic"] = client
+            logger.info("[Clients] Anthropic client created")
+        return client
+
+    def openai(self):
+        client = self._clients.get("openai")
+        if client is None:
+            import openai
+
+            client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=PROVIDER_TIMEOUT,
+                max_retries=0,  # retries are driven by rate_limiter so 429s reach the AIMD controller
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=_pool_limits(openai.DEFAULT_CONNECTION_LIMITS),
+                    timeout=PROVIDER_TIMEOUT,
+                ),
+            )
+            self._clients["openai"] = client
+            logger.info("[Clients] OpenAI client created")
+        return client
+
+    async def aclose(self):
+        """Close every pooled client and drop it from the registry."""
+        clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"[Clients] Failed to close {name} client: {e}")
+
+
+def _pool_limits(sdk_default_limits):
+    """Build pool limits with the same Limits class the SDK's httpx uses."""
+    return type(sdk_default_limits)(
+        max_connections=PROVIDER_MAX_CONNECTIONS,
+        max_keepalive_connections=PROVIDER_MAX_KEEPALIVE,
+        keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY,
+    )
+
+
+clients = ProviderClientRegistry()
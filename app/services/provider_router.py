@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from app.services.rate_limiter import is_retryable
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+PROVIDERS = ("anthropic", "openai")
+
+# Fail a page over to the other provider (when its API key is set) after the primary gave up
+PROVIDER_FAILOVER = os.getenv("PROVIDER_FAILOVER", "1") != "0"
+# Also send a page to the other provider when the primary is slower than its usual PROVIDER_HEDGE_PERCENTILE latency
+PROVIDER_HEDGE = os.getenv("PROVIDER_HEDGE", "0") != "0"
+PROVIDER_HEDGE_PERCENTILE = float(os.getenv("PROVIDER_HEDGE_PERCENTILE", "90"))
+PROVIDER_HEDGE_MIN_SAMPLES = int(os.getenv("PROVIDER_HEDGE_MIN_SAMPLES", "20"))
+# Extra rounds over the providers once all of them failed a page with throttling, transient or
+# connection errors (each call already retries those in rate_limiter), after a jittered exponential backoff
+PROVIDER_ROUTER_RETRIES = max(0, int(os.getenv("PROVIDER_ROUTER_RETRIES", "1")))
+PROVIDER_ROUTER_BACKOFF = float(os.getenv("PROVIDER_ROUTER_BACKOFF", "2"))
+# Consecutive failures that open a provider's circuit, and how long it stays open before a probe
+CIRCUIT_FAILURE_THRESHOLD = max(1, int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Recent successful page latencies kept per provider for the hedging percentile
+LATENCY_WINDOW = 200
+
+
+class ProviderUnavailable(RuntimeError):
+    """Every provider of the route has its circuit open."""
+
+
+def _percentile(values, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class _Circuit:
+    """Per-provider circuit breaker: closed -> open after repeated failures -> half-open probe."""
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= CIRCUIT_RESET_SECONDS:
+            self.state = "half_open"
+        if self.state == "half_open" and not self.probing:
+            # One call at a time finds out whether the provider is back
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def failure(self) -> bool:
+        """Count a failure; True when it opened the circuit."""
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= CIRCUIT_FAILURE_THRESHOLD):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            return True
+        return False
+
+
+class ProviderRouter:
+    """Send each page to the configured provider, failing over to (and hedging with) the other one.
+
+    The primary is AI_PROVIDER; the other provider joins the route when
+    failover is enabled and its API key is set. A call that fails moves the
+    page to the next provider of the route; when all of them failed, the
+    route is tried again after a jittered backoff. Providers failing
+    repeatedly are skipped by their circuit breaker for CIRCUIT_RESET_SECONDS.
+    With hedging, a primary that has not answered within its observed p90
+    latency gets the same page sent to the next provider, and the first
+    answer wins.
+    """
+
+    def __init__(self):
+        self._circuits = {name: _Circuit() for name in PROVIDERS}
+        self._latencies = {name: deque(maxlen=LATENCY_WINDOW) for name in PROVIDERS}
+        self._counters = {name: {"calls": 0, "failures": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0} for name in PROVIDERS}
+
+    def route(self) -> list[str]:
+        """Providers in the order a page tries them."""
+        primary = "openai" if os.getenv("AI_PROVIDER", "anthropic").lower() == "openai" else "anthropic"
+        route = [primary]
+        if PROVIDER_FAILOVER:
+            route += [name for name in PROVIDERS if name != primary and os.getenv(f"{name.upper()}_API_KEY")]
+        return route
+
+    def preferred(self) -> str:
+        """The first provider of the route whose circuit is closed (the primary when none is)."""
+        route = self.route()
+        return next((name for name in route if self._circuits[name].state == "closed"), route[0])
+
+    def available(self, provider: str) -> bool:
+        """Whether ``provider`` may take a call now; a True for a half-open circuit reserves its probe."""
+        return self._circuits[provider].allow()
+
+    def succeeded(self, provider: str, elapsed: float, failover: bool = False):
+        """Record a successful call; ``failover`` when it served a page another provider could not."""
+        self._counters[provider]["calls"] += 1
+        if failover:
+            self._counters[provider]["failovers"] += 1
+        self._circuits[provider].success()
+        self._latencies[provider].append(elapsed)
+
+    def failed(self, provider: str, error: BaseException):
+        self._counters[provider]["calls"] += 1
+        self._counters[provider]["failures"] += 1
+        # A reply that does not parse says nothing about the provider's health
+        if isinstance(error, ValueError):
+            self._circuits[provider].probing = False
+            return
+        if self._circuits[provider].failure():
+            logger.warning(
+                f"[Router] {provider} circuit open for {CIRCUIT_RESET_SECONDS:.0f}s "
+                f"after {self._circuits[provider].failures} failures ({type(error).__name__}: {error})"
+            )
+
+    def abandoned(self, provider: str, elapsed: float | None = None):
+        """A call given up on (a hedge that lost) releases a half-open probe without a verdict.
+
+        ``elapsed`` (how long it had run, a lower bound of its latency) is kept so
+        that the slow calls hedging cuts short still count towards the percentile.
+        """
+        self._counters[provider]["calls"] += 1
+        self._circuits[provider].probing = False
+        if elapsed is not None:
+            self._latencies[provider].append(elapsed)
+
+    def hedge_delay(self, provider: str) -> float | None:
+        """Seconds to wait on ``provider`` before hedging, or None until enough latencies were seen."""
+        latencies = self._latencies[provider]
+        if not PROVIDER_HEDGE or len(latencies) < PROVIDER_HEDGE_MIN_SAMPLES:
+            return None
+        return _percentile(latencies, PROVIDER_HEDGE_PERCENTILE)
+
+    async def run(self, calls: dict):
+        """Run a page through the route; ``calls`` maps provider name -> zero-argument coroutine factory.
+
+        Returns ``(provider, result)`` of the first call that succeeded; raises
+        the last error when every round failed, or ProviderUnavailable when
+        every circuit was open. A round only runs again after retryable errors;
+        a bad request, rejected key or unparsable reply is raised at once.
+        """
+        error = None
+        for attempt in range(PROVIDER_ROUTER_RETRIES + 1):
+            if attempt:
+                delay = PROVIDER_ROUTER_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning(f"[Router] Every provider failed ({type(error).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            try:
+                return await self._run_once(calls)
+            except ProviderUnavailable:
+                if error is not None:
+                    raise error
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                error = e
+        raise error
+
+    async def _run_once(self, calls: dict):
+        queue = self.route()
+        primary = queue[0]
+        pending: dict[asyncio.Task, str] = {}
+        started: list[str] = []
+        began = time.monotonic()
+        hedged = False
+
+        def launch() -> str | None:
+            while queue:
+                provider = queue.pop(0)
+                if self.available(provider):
+                    pending[asyncio.ensure_future(self._call(provider, calls[provider]))] = provider
+                    started.append(provider)
+                    return provider
+            return None
+
+        try:
+            if launch() is None:
+                raise ProviderUnavailable("AI 제공자를 일시적으로 사용할 수 없습니다 (연속 실패로 차단됨). 잠시 후 다시 시도하세요.")
+            error = None
+            while pending:
+                timeout = None
+                if not hedged and queue and len(pending) == 1:
+                    timeout = self.hedge_delay(started[0])
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    hedge = launch()
+                    if hedge is not None:
+                        self._counters[hedge]["hedges"] += 1
+                        logger.info(f"[Router] {started[0]} slower than {timeout:.1f}s, hedging with {hedge}")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if hedged and provider != started[0]:
+                        self._counters[provider]["hedge_wins"] += 1
+                    elif provider != primary:
+                        self._counters[provider]["failovers"] += 1
+                    return provider, result
+                if not pending:
+                    fallback = launch()
+                    if fallback is not None:
+                        logger.warning(f"[Router] Failing over to {fallback}: {type(error).__name__}: {error}")
+            raise error
+        finally:
+            for task, provider in pending.items():
+                task.cancel()
+                self.abandoned(provider, time.monotonic() - began if provider == started[0] else None)
+
+    async def _call(self, provider: str, fn):
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed(provider, e)
+            raise
+        self.succeeded(provider, time.monotonic() - start)
+        return result
+
+    def stats(self) -> dict:
+        out = {}
+        for name in PROVIDERS:
+            circuit = self._circuits[name]
+            latencies = self._latencies[name]
+            out[name] = {
+                **self._counters[name],
+                "circuit": circuit.state,
+                "consecutive_failures": circuit.failures,
+                "circuit_opened": circuit.opened,
+                "latency_p50": round(_percentile(latencies, 50), 3) if latencies else None,
+                "latency_p90": round(_percentile(latencies, 90), 3) if latencies else None,
+                "latency_p99": round(_percentile(latencies, 99), 3) if latencies else None,
+                "hedge_after": round(self.hedge_delay(name), 3) if self.hedge_delay(name) is not None else None,
+            }
+        return out
+
+
+provider_router = ProviderRouter()
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+PROVIDER_INITIAL_CONCURRENCY = float(os.getenv("PROVIDER_INITIAL_CONCURRENCY", "4"))
+PROVIDER_MIN_CONCURRENCY = float(os.getenv("PROVIDER_MIN_CONCURRENCY", "1"))
+PROVIDER_MAX_CONCURRENCY = float(os.getenv("PROVIDER_MAX_CONCURRENCY", "32"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "6"))
+# Shrink the window once any header-reported budget drops below this fraction
+RATE_LIMIT_LOW_WATERMARK = float(os.getenv("RATE_LIMIT_LOW_WATERMARK", "0.1"))
+
+THROTTLE_STATUSES = (429, 529)
+TRANSIENT_STATUSES = (408, 409, 500, 502, 503, 504)
+
+# Header name -> budget name, for both providers' rate limit headers
+_LIMIT_HEADERS = {
+    "anthropic-ratelimit-requests-limit": "requests",
+    "anthropic-ratelimit-input-tokens-limit": "input_tokens",
+    "anthropic-ratelimit-output-tokens-limit": "output_tokens",
+    "anthropic-ratelimit-tokens-limit": "tokens",
+    "x-ratelimit-limit-requests": "requests",
+    "x-ratelimit-limit-tokens": "tokens",
+}
+_REMAINING_HEADERS = {
+    "anthropic-ratelimit-requests-remaining": "requests",
+    "anthropic-ratelimit-input-tokens-remaining": "input_tokens",
+    "anthropic-ratelimit-output-tokens-remaining": "output_tokens",
+    "anthropic-ratelimit-tokens-remaining": "tokens",
+    "x-ratelimit-remaining-requests": "requests",
+    "x-ratelimit-remaining-tokens": "tokens",
+}
+_RESET_HEADERS = {
+    "anthropic-ratelimit-requests-reset": "requests",
+    "anthropic-ratelimit-input-tokens-reset": "input_tokens",
+    "anthropic-ratelimit-output-tokens-reset": "output_tokens",
+    "anthropic-ratelimit-tokens-reset": "tokens",
+    "x-ratelimit-reset-requests": "requests",
+    "x-ratelimit-reset-tokens": "tokens",
+}
+
+
+def _parse_reset(value: str) -> float | None:
+    """Seconds until reset from an RFC 3339 timestamp (Anthropic) or a '1m30s' duration (OpenAI)."""
+    value = value.strip()
+    if "T" in value:
+        try:
+            reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    seconds = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+
+def _retry_after(headers) -> float | None:
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD admission control for one provider.
+
+    The number of calls allowed in flight grows by roughly one per window of
+    successful calls and halves on a 429/529 or when the rate limit headers
+    say a budget is almost spent. A 429 pauses new admissions until the
+    provider's retry-after instead of failing the caller.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = PROVIDER_INITIAL_CONCURRENCY
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.budgets: dict[str, dict] = {}
+        self.throttled = 0
+        self.retries = 0
+        self._completions: deque[float] = deque()
+        self._last_decrease = 0.0
+        self._cond: asyncio.Condition | None = None
+        self._loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+        return self._cond
+
+    async def _acquire(self):
+        cond = self._condition()
+        while True:
+            async with cond:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    if self.in_flight < max(1, int(self.limit)):
+                        self.in_flight += 1
+                        return
+                    await cond.wait()
+                    continue
+            await asyncio.sleep(wait)
+
+    async def _release(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def _decrease(self):
+        # One multiplicative decrease per congestion event, not one per failed call in the burst
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(PROVIDER_MIN_CONCURRENCY, self.limit / 2)
+
+    def _increase(self):
+        self.limit = min(PROVIDER_MAX_CONCURRENCY, self.limit + 1 / max(self.limit, 1))
+
+    def _observe_headers(self, headers):
+        if headers is None:
+            return
+        for header, budget in _LIMIT_HEADERS.items():
+            if headers.get(header, "").isdigit():
+                self.budgets.setdefault(budget, {})["limit"] = int(headers[header])
+        for header, budget in _REMAINING_HEADERS.items():
+            if headers.get(header, "").isdigit():
+                self.budgets.setdefault(budget, {})["remaining"] = int(headers[header])
+        for header, budget in _RESET_HEADERS.items():
+            if header in headers:
+                reset = _parse_reset(headers[header])
+                if reset is not None:
+                    self.budgets.setdefault(budget, {})["reset_in"] = reset
+
+    def _on_success(self, headers):
+        self._observe_headers(headers)
+        now = time.monotonic()
+        self._completions.append(now)
+        while self._completions and self._completions[0] < now - 60:
+            self._completions.popleft()
+
+        low = False
+        for budget in self.budgets.values():
+            limit, remaining = budget.get("limit"), budget.get("remaining")
+            if not limit or remaining is None:
+                continue
+            if remaining <= 0 and budget.get("reset_in"):
+                self.paused_until = max(self.paused_until, now + budget["reset_in"])
+            if remaining / limit < RATE_LIMIT_LOW_WATERMARK:
+                low = True
+        if low:
+            self._decrease()
+        else:
+            self._increase()
+
+    def _on_throttle(self, headers, attempt: int) -> float:
+        self.throttled += 1
+        self._observe_headers(headers)
+        self._decrease()
+        delay = _retry_after(headers) or min(60.0, 2 ** attempt)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.warning(f"[RateLimit] {self.name} throttled, limit -> {self.limit:.1f}, pausing {delay:.1f}s")
+        return delay
+
+    async def _admit(self, request):
+        """Acquire a slot and run ``request``, retrying throttles and transient errors.
+
+        Returns the raw response with the slot still held; raises (slot released) otherwise.
+        """
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                return await request()
+            except BaseException as e:
+                await self._release()
+                if not isinstance(e, Exception):
+                    # Cancelled (e.g. a hedged call that lost the race): give the slot back and stop
+                    raise
+                status = getattr(e, "status_code", None)
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                if attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                if status in THROTTLE_STATUSES:
+                    self._on_throttle(headers, attempt)
+                elif status in TRANSIENT_STATUSES or _is_connection_error(e):
+                    delay = _retry_after(headers) or min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                    logger.warning(f"[RateLimit] {self.name} transient error ({type(e).__name__}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                else:
+                    raise
+                attempt += 1
+                self.retries += 1
+
+    async def call(self, request):
+        """Run ``request`` (a zero-argument coroutine factory returning a raw SDK response) under admission control.
+
+        Throttling responses and transient errors are retried; anything else is raised.
+        """
+        raw = await self._admit(request)
+        await self._release()
+        self._on_success(raw.headers)
+        return raw
+
+    @asynccontextmanager
+    async def hold(self, request):
+        """Like ``call``, but keep the slot until the block exits (for streamed responses)."""
+        raw = await self._admit(request)
+        try:
+            yield raw
+            self._on_success(raw.headers)
+        finally:
+            await self._release()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self.paused_until - now), 2),
+            "requests_last_minute": sum(1 for t in self._completions if t >= now - 60),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "budgets": self.budgets,
+        }
+
+
+def is_retryable(e: Exception) -> bool:
+    """Whether ``e`` is throttling, a transient server error or a connection failure, i.e. worth another try."""
+    return getattr(e, "status_code", None) in THROTTLE_STATUSES + TRANSIENT_STATUSES or _is_connection_error(e)
+
+
+def _is_connection_error(e: Exception) -> bool:
+    # APIConnectionError / APITimeoutError in both SDKs; matched by name to keep the SDKs optional
+    return any(cls.__name__ in ("APIConnectionError", "APITimeoutError") for cls in type(e).__mro__)
+
+
+_limiters: dict[str, AdaptiveConcurrencyLimiter] = {}
+
+
+def provider_limiter(provider: str) -> AdaptiveConcurrencyLimiter:
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        limiter = _limiters[provider] = AdaptiveConcurrencyLimiter(provider)
+    return limiter
+
+
+def limiter_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
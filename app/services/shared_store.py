@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+TEMP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "temp"))
+# "sqlite": shared by every worker process (and instances on the same volume); "memory": this process only
+SHARED_STORE = os.getenv("SHARED_STORE", "sqlite").lower()
+SHARED_STORE_DIR = os.getenv("SHARED_STORE_DIR", os.path.join(TEMP_DIR, "shared"))
+# How often a worker that does not own a job re-reads it while long-polling
+SHARED_POLL_INTERVAL = float(os.getenv("SHARED_POLL_INTERVAL", "0.25"))
+
+
+class SharedStore(ABC):
+    """Job snapshots and the generated-artifact index, plus the blob directory holding the documents.
+
+    Blobs are plain files in ``blob_dir`` (temp/, where the download endpoints
+    look), written under a temporary name and renamed into place, so another
+    process never sees half a document. Subclasses keep the metadata.
+
+    The metadata and blob calls block; code on the event loop hands writes to
+    ``defer`` (or awaits them through ``write``) and runs reads in a thread.
+    """
+
+    def __init__(self, blob_dir: str):
+        self.blob_dir = blob_dir
+        # One writer thread keeps the deferred writes in the order they were made
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-store")
+
+    def defer(self, fn, *args):
+        """Run the write ``fn(*args)`` on the writer thread, after every write deferred before it."""
+
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                # Only other workers lose sight of the change; this one carries on
+                logger.warning(f"[Store] {fn.__name__} failed: {type(e).__name__}: {e}")
+
+        self._writer.submit(run)
+
+    async def write(self, fn, *args):
+        """Await ``fn(*args)`` on the writer thread, after every write deferred before it; errors propagate."""
+        return await asyncio.wrap_future(self._writer.submit(fn, *args))
+
+    def blob_path(self, name: str) -> str:
+        return os.path.join(self.blob_dir, name)
+
+    def write_blob(self, name: str, data: bytes) -> str:
+        """Atomically create or replace ``name`` in the blob directory; returns its path."""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        path = self.blob_path(name)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path
+
+    @abstractmethod
+    def put_job(self, job_id: str, snapshot: dict, finished_at: float | None):
+        ...
+
+    @abstractmethod
+    def get_job(self, job_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def delete_job(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def prune_jobs(self, cutoff: float) -> int:
+        """Delete jobs that finished before ``cutoff``; returns how many."""
+
+    @abstractmethod
+    def put_artifact(self, key: str, file_id: str, size: int, created_at: float):
+        ...
+
+    @abstractmethod
+    def get_artifact(self, key: str) -> tuple[str, int, float] | None:
+        """``(file_id, size, created_at)`` of the document generated for ``key``."""
+
+    @abstractmethod
+    def delete_artifact(self, key: str):
+        ...
+
+    def close(self):
+        """Finish the deferred writes."""
+        self._writer.shutdown(wait=True)
+
+
+class MemorySharedStore(SharedStore):
+    """Keeps the metadata in this process; for a single worker."""
+
+    def __init__(self, blob_dir: str):
+        super().__init__(blob_dir)
+        self._jobs: dict[str, tuple[str, float | None]] = {}
+        self._artifacts: dict[str, tuple[str, int, float]] = {}
+
+    def put_job(self, job_id: str, snapshot: dict, finished_at: float | None):
+        self._jobs[job_id] = (json.dumps(snapshot, ensure_ascii=False), finished_at)
+
+    def get_job(self, job_id: str) -> dict | None:
+        row = self._jobs.get(job_id)
+        return json.loads(row[0]) if row else None
+
+    def delete_job(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+    def prune_jobs(self, cutoff: float) -> int:
+        expired = [j for j, (_, finished_at) in self._jobs.items() if finished_at and finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        return len(expired)
+
+    def put_artifact(self, key: str, file_id: str, size: int, created_at: float):
+        self._artifacts[key] = (file_id, size, created_at)
+
+    def get_artifact(self, key: str) -> tuple[str, int, float] | None:
+        return self._artifacts.get(key)
+
+    def delete_artifact(self, key: str):
+        self._artifacts.pop(key, None)
+
+
+class SQLiteSharedStore(SharedStore):
+    """Metadata in a SQLite database in WAL mode, so every worker reads while one writes.
+
+    Each statement is its own transaction; readers always see the last
+    committed snapshot of a job.
+    """
+
+    def __init__(self, db_path: str, blob_dir: str):
+        super().__init__(blob_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL stays consistent with NORMAL; a power loss may only drop the latest commits
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " snapshot TEXT NOT NULL,"
+            " finished_at REAL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " key TEXT PRIMARY KEY,"
+            " file_id TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            cur = self._db.execute(sql, params)
+            self._db.commit()
+            return cur.rowcount
+
+    def _read(self, sql: str, params: tuple):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    def put_job(self, job_id: str, snapshot: dict, finished_at: float | None):
+        self._write(
+            "INSERT OR REPLACE INTO jobs (id, snapshot, finished_at, updated_at) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(snapshot, ensure_ascii=False), finished_at, time.time()),
+        )
+
+    def get_job(self, job_id: str) -> dict | None:
+        row = self._read("SELECT snapshot FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(row[0]) if row else None
+
+    def delete_job(self, job_id: str):
+        self._write("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def prune_jobs(self, cutoff: float) -> int:
+        return self._write("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+
+    def put_artifact(self, key: str, file_id: str, size: int, created_at: float):
+        self._write(
+            "INSERT OR REPLACE INTO artifacts (key, file_id, size, created_at) VALUES (?, ?, ?, ?)",
+            (key, file_id, size, created_at),
+        )
+
+    def get_artifact(self, key: str) -> tuple[str, int, float] | None:
+        row = self._read("SELECT file_id, size, created_at FROM artifacts WHERE key = ?", (key,))
+        return tuple(row) if row else None
+
+    def delete_artifact(self, key: str):
+        self._write("DELETE FROM artifacts WHERE key = ?", (key,))
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._db.close()
+
+
+def create_store(kind: str = SHARED_STORE) -> SharedStore:
+    if kind == "memory":
+        return MemorySharedStore(TEMP_DIR)
+    if kind == "sqlite":
+        return SQLiteSharedStore(os.path.join(SHARED_STORE_DIR, "store.sqlite3"), TEMP_DIR)
+    raise ValueError(f"Unknown SHARED_STORE: {kind}")
+
+
+shared_store = create_store()
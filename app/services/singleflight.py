@@ -0,0 +1,45 @@
+import asyncio
+import copy
+import logging
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is still running await the same task and get a deep copy
+    of its result (or the same exception). Cancelling one waiter does not
+    cancel the shared call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn):
+        """Await ``fn()`` (a zero-argument coroutine factory), sharing it with concurrent callers of ``key``."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"[SingleFlight] {self.name}: joined in-flight call {key[:12]}")
+            return copy.deepcopy(await asyncio.shield(task))
+
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Every waiter may have been cancelled; mark the exception as retrieved either way
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
@@ -0,0 +1,159 @@
+import json
+
+
+class IncrementalEntryParser:
+    """Incremental parser for streamed extraction replies.
+
+    Feed text chunks as they arrive; ``feed`` returns every object of the
+    top-level ``array_key`` array (``words`` / ``entries``) that closed in
+    the new text. Top-level string fields such as ``"type"`` are collected
+    in ``fields``. Text before the first ``{`` (e.g. a ```json fence) is
+    ignored. Each character is scanned exactly once.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_key = array_key
+        self.fields: dict[str, str] = {}
+        self._text = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = True
+        self._key = None
+        self._in_array = False
+        self._obj_start = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> list[dict]:
+        self._text += chunk
+        completed = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._on_top_level_string(text[self._string_start:i + 1])
+                continue
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                continue
+            if not self._stack:
+                continue  # trailing text after the top-level object
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "{" and self._in_array and self._stack == ["{", "["]:
+                    self._obj_start = i
+                if ch == "[" and len(self._stack) == 1 and self._key == self.array_key:
+                    self._in_array = True
+                self._stack.append(ch)
+            elif ch in "}]":
+                self._stack.pop()
+                if ch == "}" and self._in_array and self._stack == ["{", "["] and self._obj_start is not None:
+                    try:
+                        completed.append(json.loads(text[self._obj_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._obj_start = None
+                elif ch == "]" and len(self._stack) == 1:
+                    self._in_array = False
+            elif len(self._stack) == 1:
+                if ch == ":":
+                    self._expect_key = False
+                elif ch == ",":
+                    self._expect_key = True
+
+        self._pos = len(text)
+        return completed
+
+    def _on_top_level_string(self, quoted: str):
+        try:
+            value = json.loads(quoted)
+        except json.JSONDecodeError:
+            return
+        if self._expect_key:
+            self._key = value
+        elif self._key is not None:
+            self.fields[self._key] = value
+
+
+class LineEntryParser:
+    """Incremental parser for compact (tab-separated) extraction replies.
+
+    The reply is a header line naming the type (``#words``, ``#type2`` ...),
+    one entry per line with the values of ``columns[type]`` separated by tabs,
+    and a closing ``#end`` line. ``feed`` returns the entries of every line
+    completed by the new text; the header's type is kept in ``fields["type"]``.
+    A line is only used once its newline has arrived, so a reply cut off at
+    ``max_tokens`` loses just the unfinished line; ``complete`` tells whether
+    ``#end`` was seen. Rows before any header use the first layout in
+    ``columns``. Each character is scanned exactly once.
+    """
+
+    def __init__(self, columns: dict[str, tuple[str, ...]]):
+        self.columns = columns
+        self.fields: dict[str, str] = {}
+        self.complete = False
+        self._layout = next(iter(columns.values()))
+        self._text = ""
+        self._pos = 0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> list[dict]:
+        start = len(self._text)
+        self._text += chunk
+        completed = []
+        end = self._text.find("\n", start)
+        while end != -1:
+            entry = self._on_line(self._text[self._pos:end])
+            if entry is not None:
+                completed.append(entry)
+            self._pos = end + 1
+            end = self._text.find("\n", self._pos)
+        return completed
+
+    def close(self):
+        """End of the reply: a last line without newline only counts when it is ``#end``."""
+        if self._text[self._pos:].strip() == "#end":
+            self.complete = True
+        self._pos = len(self._text)
+
+    def _on_line(self, line: str) -> dict | None:
+        line = line.strip()
+        if self.complete or not line or line.startswith("```"):
+            return None
+        if line.startswith("#"):
+            name = line[1:].strip()
+            if name == "end":
+                self.complete = True
+            else:
+                self.fields["type"] = name
+                self._layout = self.columns.get(name, self._layout)
+            return None
+        values = [value.strip() for value in line.split("\t")]
+        # A stray tab inside the last value: keep the extra pieces in it
+        if len(values) > len(self._layout):
+            values[len(self._layout) - 1:] = [" ".join(values[len(self._layout) - 1:])]
+        values += [""] * (len(self._layout) - len(values))
+        return dict(zip(self._layout, values))
@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from app.services.artifact_cache import artifact_cache
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn.error")
+
+TEMP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "temp"))
+# Files in temp/ untouched (not created or downloaded) for this long are deleted
+TEMP_FILE_TTL = float(os.getenv("TEMP_FILE_TTL", "86400"))
+# Total size of the files in temp/ outside the artifact cache; least recently used documents are deleted past it
+TEMP_MAX_BYTES = int(float(os.getenv("TEMP_MAX_MB", "2048")) * 1024 * 1024)
+TEMP_SWEEP_INTERVAL = float(os.getenv("TEMP_SWEEP_INTERVAL", "600"))
+
+# Files used this recently may still be written or served and are never evicted for the quota
+_GRACE_SECONDS = 60
+# Upload spills and .tmp files belong to a job or write in progress; only ones this old are leftovers
+_ORPHAN_SECONDS = 3600
+
+
+@dataclass
+class _TempFile:
+    size: int
+    created_at: float
+    accessed_at: float
+
+
+class TempJanitor:
+    """Background task that keeps temp/ bounded.
+
+    Every sweep lists the directory once and updates an index of its files
+    (size, creation time, last access). Documents the artifact cache (or
+    another worker's) indexes are left to its own TTL and budget; of the rest,
+    files past the TTL are deleted, then least recently used documents while
+    the total is over the quota. Upload spills and ``.tmp`` files are never
+    evicted for the quota, only removed as leftovers once past the TTL and
+    an hour old. Downloads ``touch`` their file so documents still being
+    fetched stay. Only regular files directly in temp/ are managed;
+    subdirectories (extraction cache, bulk manifests) are left alone.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_bytes: int, interval: float):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._files: dict[str, _TempFile] = {}
+        self._task: asyncio.Task | None = None
+        self.sweeps = 0
+        self.removed_files = 0
+        self.reclaimed_bytes = 0
+        self.last_sweep: dict = {}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"[Janitor] Sweeping {self.directory} every {self.interval:g}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def touch(self, path: str):
+        """Record an access to ``path`` (a file in the directory)."""
+        entry = self._files.get(os.path.basename(path))
+        if entry is not None:
+            entry.accessed_at = time.time()
+
+    def sweep(self) -> dict:
+        """Scan the directory, delete expired and over-quota files and return what was reclaimed."""
+        start = time.perf_counter()
+        now = time.time()
+        # Built here and published with one assignment at the end: stats() and touch() read the index on the loop
+        files = self._scan(now)
+        removed = 0
+        reclaimed = 0
+
+        # Indexed documents are the artifact cache's to expire and evict
+        unowned = {name: f for name, f in files.items() if not artifact_cache.owns(name)}
+        for name, f in unowned.items():
+            age = now - f.accessed_at
+            if age > self.ttl and (name.endswith(".docx") or age > _ORPHAN_SECONDS):
+                reclaimed += self._remove(files, name)
+                removed += 1
+
+        total = sum(f.size for name, f in unowned.items() if name in files)
+        if total > self.max_bytes:
+            documents = [name for name in unowned if name in files and name.endswith(".docx")]
+            for name in sorted(documents, key=lambda n: files[n].accessed_at):
+                if total <= self.max_bytes:
+                    break
+                if now - files[name].accessed_at < _GRACE_SECONDS:
+                    break
+                size = self._remove(files, name)
+                total -= size
+                reclaimed += size
+                removed += 1
+
+        self._files = files
+        self.sweeps += 1
+        self.removed_files += removed
+        self.reclaimed_bytes += reclaimed
+        self.last_sweep = {
+            "at": now,
+            "seconds": round(time.perf_counter() - start, 3),
+            "removed_files": removed,
+            "reclaimed_bytes": reclaimed,
+        }
+        if removed:
+            logger.info(f"[Janitor] Removed {removed} files, reclaimed {reclaimed // 1024}KB ({total // 1024}KB left)")
+        return self.last_sweep
+
+    def stats(self) -> dict:
+        files = self._files
+        return {
+            "files": len(files),
+            "bytes": sum(f.size for f in files.values()),
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "sweeps": self.sweeps,
+            "removed_files": self.removed_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "last_sweep": self.last_sweep,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                # Listing and deleting are blocking filesystem calls; keep them off the event loop
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"[Janitor] Sweep failed: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _scan(self, now: float) -> dict[str, _TempFile]:
+        """A new index of the directory; new files count as accessed when last modified."""
+        seen = {}
+        with contextlib.suppress(FileNotFoundError), os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                known = self._files.get(entry.name)
+                if known is not None and known.size == st.st_size:
+                    seen[entry.name] = known
+                    continue
+                # New, or rewritten under the same name (e.g. a job generated again)
+                modified = min(st.st_mtime, now)
+                seen[entry.name] = _TempFile(st.st_size, modified, max(modified, known.accessed_at if known else 0))
+        return seen
+
+    def _remove(self, files: dict[str, _TempFile], name: str) -> int:
+        entry = files.pop(name)
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"[Janitor] Could not remove {name}: {e}")
+            return 0
+        return entry.size
+
+
+janitor = TempJanitor(TEMP_DIR, TEMP_FILE_TTL, TEMP_MAX_BYTES, TEMP_SWEEP_INTERVAL)
@@ -0,0 +1,129 @@
+from collections import deque
+
+# Recent page latencies kept per model tier for the p90
+_TIER_LATENCY_WINDOW = 200
+
+
+class UsageStats:
+    """Running token totals per provider, including prompt-cache reads and writes.
+
+    ``input_tokens`` is the full prompt size (cached + uncached) for both
+    providers, so ``cached_ratio`` is the share of prompt tokens billed at the
+    cache-read rate. Replies cut off at max_tokens and their continuation
+    requests are counted too, as are the pages each model tier handled and how
+    many the fast tier passed on to the main model.
+    """
+
+    def __init__(self):
+        self._totals: dict[str, dict] = {}
+        self._tiers: dict[str, dict] = {}
+
+    def _provider_totals(self, provider: str) -> dict:
+        return self._totals.setdefault(provider, {
+            "requests": 0,
+            "input_tokens": 0,
+            "cached_input_tokens": 0,
+            "cache_write_tokens": 0,
+            "output_tokens": 0,
+            "truncated_replies": 0,
+            "continuations": 0,
+            "unfinished_replies": 0,
+        })
+
+    def record(self, provider: str, input_tokens: int, cached_tokens: int = 0, cache_write_tokens: int = 0, output_tokens: int = 0):
+        totals = self._provider_totals(provider)
+        totals["requests"] += 1
+        totals["input_tokens"] += input_tokens
+        totals["cached_input_tokens"] += cached_tokens
+        totals["cache_write_tokens"] += cache_write_tokens
+        totals["output_tokens"] += output_tokens
+
+    def record_anthropic(self, usage):
+        # Anthropic's input_tokens excludes the tokens read from or written to the prompt cache
+        if usage is None:
+            return
+        cached = getattr(usage, "cache_read_input_tokens", None) or 0
+        written = getattr(usage, "cache_creation_input_tokens", None) or 0
+        self.record(
+            "anthropic",
+            input_tokens=(usage.input_tokens or 0) + cached + written,
+            cached_tokens=cached,
+            cache_write_tokens=written,
+            output_tokens=usage.output_tokens or 0,
+        )
+
+    def record_openai(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.record(
+            "openai",
+            input_tokens=usage.prompt_tokens or 0,
+            cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0,
+            output_tokens=usage.completion_tokens or 0,
+        )
+
+    def record_truncation(self, provider: str, continuations: int, unfinished: bool):
+        """A page reply cut off at max_tokens, the continuation requests it took and
+        whether it was still cut off after the last one."""
+        totals = self._provider_totals(provider)
+        totals["truncated_replies"] += 1
+        totals["continuations"] += continuations
+        totals["unfinished_replies"] += int(unfinished)
+
+    def record_tier(self, provider: str, tier: str, seconds: float, escalated: str | None = None):
+        """A page handled by a model ``tier`` ("fast" or "main") in ``seconds``; ``escalated``
+        is the check a fast-tier result failed (e.g. "pinyin") when it was passed on to the main model."""
+        totals = self._tiers.setdefault(provider, {}).setdefault(tier, {
+            "pages": 0,
+            "escalated": 0,
+            "escalated_by": {},
+            "seconds": 0.0,
+            "latencies": deque(maxlen=_TIER_LATENCY_WINDOW),
+        })
+        totals["pages"] += 1
+        totals["seconds"] += seconds
+        totals["latencies"].append(seconds)
+        if escalated is not None:
+            totals["escalated"] += 1
+            totals["escalated_by"][escalated] = totals["escalated_by"].get(escalated, 0) + 1
+
+    def reset(self):
+        self._totals.clear()
+        self._tiers.clear()
+
+    def _tier_stats(self, provider: str) -> dict:
+        stats = {}
+        for tier, totals in self._tiers.get(provider, {}).items():
+            latencies = sorted(totals["latencies"])
+            stats[tier] = {
+                "pages": totals["pages"],
+                "latency_avg": round(totals["seconds"] / totals["pages"], 3),
+                "latency_p90": round(latencies[min(len(latencies) - 1, len(latencies) * 9 // 10)], 3),
+            }
+            if tier == "fast":
+                stats[tier].update({
+                    "escalated": totals["escalated"],
+                    "escalation_rate": round(totals["escalated"] / totals["pages"], 3),
+                    "escalated_by": dict(totals["escalated_by"]),
+                })
+        return stats
+
+    def stats(self) -> dict:
+        stats = {}
+        for provider in self._tiers:
+            self._provider_totals(provider)
+        for provider, totals in self._totals.items():
+            # Page replies, continuation requests not counted
+            pages = totals["requests"] - totals["continuations"]
+            stats[provider] = {
+                **totals,
+                "cached_ratio": round(totals["cached_input_tokens"] / totals["input_tokens"], 3) if totals["input_tokens"] else 0.0,
+                "truncated_ratio": round(totals["truncated_replies"] / pages, 3) if pages else 0.0,
+            }
+            if provider in self._tiers:
+                stats[provider]["tiers"] = self._tier_stats(provider)
+        return stats
+
+
+usage_stats = UsageStats()
@@ -1,10 +1,29 @@
 import copy
+import io
 import os
+import threading
 import uuid
+from dataclasses import dataclass, field
+from functools import lru_cache
 
 from docx import Document
+from docx.document import Document as DocumentObject
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.shared import Pt, RGBColor
+from docx.text.paragraph import Paragraph
+
+from app.services.ooxml_writer import (
+    DOCX_STREAM_MIN_ENTRIES,
+    Fragment,
+    cut_after,
+    cut_before,
+    cut_end,
+    mark,
+    package_members,
+    split_part,
+    write_docx,
+)
 
 GRAY_COLOR = RGBColor(0xEA, 0xEA, 0xEA)
 
@@ -14,6 +33,32 @@ TEMP_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "temp")
 
 MIN_FONT_SIZE = 7
 
+# Column whose font shrinks to fit its width, per template (None: fixed sizes only)
+KOREAN_COLUMNS = {TEMPLATE_PATH: 5, HANJA_TEMPLATE_PATH: None}
+
+
+@dataclass(frozen=True)
+class _Template:
+    """A Word template parsed once and shared by every request.
+
+    ``table_xml`` is the pristine page table and stays in ``document``'s body
+    between requests; requests fill deep copies of it and never edit it.
+    ``cell_map[row][col]`` locates python-docx's ``rows[row].cells[col]`` as
+    (w:tr index, w:tc index), so copies skip the merged-cell resolution.
+    """
+
+    document: DocumentObject
+    table_xml: object
+    rows_per_page: int
+    usable_width: float
+    cell_map: tuple
+    # Held while a request's tables are swapped into the shared document for saving
+    lock: threading.Lock = field(default_factory=threading.Lock, compare=False)
+
+
+_templates: dict[str, _Template] = {}
+_templates_lock = threading.Lock()
+
 
 def _get_cell_width_pt(cell) -> float:
     """Read cell width from XML (dxa -> pt)."""
@@ -63,33 +108,204 @@ def _sum_lr_margin(margin_element) -> float:
     return total_dxa / 20.0
 
 
-def _calc_font_size(text: str, usable_width_pt: float, base_size: int) -> int:
-    """Calculate font size to fit text in one line.
+def _load_template(path: str) -> _Template:
+    doc = Document(os.path.abspath(path))
 
-    Full-width chars (Korean, Chinese) count as 1.0 width unit.
-    Half-width chars (ASCII, spaces, punctuation) count as 0.5 width unit.
+    # Remove any document protection inherited from template
+    settings = doc.settings.element
+    doc_prot = settings.find(qn("w:documentProtection"))
+    if doc_prot is not None:
+        settings.remove(doc_prot)
+
+    # Read template dimensions dynamically
+    table = doc.tables[0]
+    usable_width = 0.0
+    if KOREAN_COLUMNS[path] is not None:
+        korean_cell = table.rows[0].cells[KOREAN_COLUMNS[path]]
+        usable_width = _get_cell_width_pt(korean_cell) - _get_cell_padding_pt(table, korean_cell)
+    trs = table._tbl.findall(qn("w:tr"))
+    cell_map = tuple(
+        tuple((trs.index(cell._tc.getparent()), cell._tc.getparent().findall(qn("w:tc")).index(cell._tc)) for cell in row.cells)
+        for row in table.rows
+    )
+    return _Template(doc, table._tbl, len(table.rows), usable_width, cell_map)
+
+
+def _template(path: str) -> _Template:
+    template = _templates.get(path)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(path)
+            if template is None:
+                template = _templates[path] = _load_template(path)
+    return template
+
+
+def preload_templates():
+    """Parse the Word templates (and their streaming layouts) now rather than on the first generate request."""
+    for path in KOREAN_COLUMNS:
+        _template(path)
+        _stream_layout(path)
+
+
+def _render(template: _Template, words: list[dict], fill, output):
+    """Fill one copy of the template table per page of words and save them as a document.
+
+    The first page takes the template table's place and later pages are appended
+    to the body, as if the template had been opened for this request alone.
+    """
+    # Split words into pages
+    pages = [words[i : i + template.rows_per_page] for i in range(0, len(words), template.rows_per_page)] or [[]]
+
+    tables = []
+    for page in pages:
+        table = _PageTable(template)
+        fill(table, page)
+        tables.append(table.element)
+
+    body = template.document.element.body
+    with template.lock:
+        body.replace(template.table_xml, tables[0])
+        for tbl in tables[1:]:
+            body.append(tbl)
+        try:
+            template.document.save(output)
+        finally:
+            for tbl in tables[1:]:
+                body.remove(tbl)
+            body.replace(tables[0], template.table_xml)
+
+
+class _PageTable:
+    """A fresh copy of a template's table, addressed like ``table.rows[row].cells[col]``."""
+
+    def __init__(self, template: _Template):
+        self.element = copy.deepcopy(template.table_xml)
+        self._cell_map = template.cell_map
+        self._tcs = [tr.findall(qn("w:tc")) for tr in self.element.iterchildren(qn("w:tr"))]
+
+    def paragraph(self, row: int, col: int):
+        """The cell's first w:p, i.e. ``cell.paragraphs[0]``."""
+        tr, tc = self._cell_map[row][col]
+        return self._tcs[tr][tc].find(qn("w:p"))
+
+
+@dataclass(frozen=True)
+class _StreamLayout:
+    """A template's document.xml split into serialized pieces for ooxml_writer.
+
+    A document is ``head``, the first page's table, ``middle`` (the rest of the
+    body, section properties included), the remaining pages' tables and ``tail``,
+    the same layout _render produces. A page table is ``table_open``, one row
+    per template row (``filled_rows`` rendered with a word's values, or the
+    pristine ``rows`` past the last word) and ``table_close``.
     """
-    width_units = 0
-    for ch in text:
-        if ord(ch) > 0x7F:
-            width_units += 1.0
-        else:
-            width_units += 0.5
 
-    if width_units == 0:
-        return base_size
+    members: list
+    head: str
+    table_open: str
+    rows: tuple
+    filled_rows: tuple
+    table_close: str
+    middle: str
+    tail: str
 
-    max_size = usable_width_pt / width_units
-    font_size = min(base_size, int(max_size))
-    return max(font_size, MIN_FONT_SIZE)
+
+_PROBE_WORD = {"chinese": mark("chinese"), "pinyin": mark("pinyin"), "korean": mark("korean")}
+_PROBE_HANJA = {"hanja": mark("hanja"), "hun": mark("hun"), "eum": mark("eum")}
+
+
+def _fill_word_probe(table, template: _Template):
+    _fill_table(table, [_PROBE_WORD] * template.rows_per_page, template.usable_width)
+    # The Korean font size depends on the text, so it is a value of its own
+    for row in range(template.rows_per_page):
+        sz = table.paragraph(row, 5).find(qn("w:r")).find(qn("w:rPr")).find(qn("w:sz"))
+        sz.set(qn("w:val"), mark("korean_sz"))
+
+
+def _fill_hanja_probe(table, template: _Template):
+    _fill_hanja_table(table, [_PROBE_HANJA] * template.rows_per_page)
+
+
+_STREAM_PROBES = {TEMPLATE_PATH: _fill_word_probe, HANJA_TEMPLATE_PATH: _fill_hanja_probe}
 
 
-def _set_cell_text(cell, text: str, font_name: str, font_size: int, east_asia_font: str | None = None):
-    """Set cell text with specified font and size."""
-    para = cell.paragraphs[0]
-    para.clear()
-    run = para.add_run(text)
+@lru_cache(maxsize=None)
+def _stream_layout(path: str) -> _StreamLayout | None:
+    """Build the streaming layout from a private copy of the template.
+
+    Returns None when a cell of the table belongs to another row (vertical
+    merges), which the row-by-row writer cannot express; such templates are
+    always rendered with python-docx.
+    """
+    template = _load_template(path)
+    if any(tr != row for row, cells in enumerate(template.cell_map) for tr, _ in cells):
+        return None
+    members = package_members(template.document)
+    body = template.document.element.body
+    probe = _PageTable(template)
+    _STREAM_PROBES[path](probe, template)
+
+    def split(table):
+        trs = table.findall(qn("w:tr"))
+        cut_before(trs[0])
+        for tr in trs:
+            cut_after(tr)
+        return split_part(template.document.element)
+
+    cut_before(template.table_xml)
+    cut_after(template.table_xml)
+    cut_end(body)
+    head, table_open, *rows, table_close, middle, tail = split(template.table_xml)
+    body.replace(template.table_xml, probe.element)
+    filled_rows = split(probe.element)[2:-3]
+    return _StreamLayout(
+        members, head, table_open, tuple(rows), tuple(Fragment(row) for row in filled_rows), table_close, middle, tail
+    )
+
+
+def _stream_document(layout: _StreamLayout, words: list[dict], values):
+    """Yield document.xml for ``words`` piece by piece; ``values(word)`` fills a row's slots."""
+    rows_per_page = len(layout.rows)
+    yield layout.head
+    for index, start in enumerate(range(0, max(len(words), 1), rows_per_page)):
+        page = words[start : start + rows_per_page]
+        yield layout.table_open
+        for row, pristine in enumerate(layout.rows):
+            yield layout.filled_rows[row].render(values(page[row])) if row < len(page) else pristine
+        yield layout.table_close
+        if index == 0:
+            yield layout.middle
+    yield layout.tail
+
+
+def _save(path: str, words: list[dict], output, fill, values):
+    """Write the document for ``words`` to ``output`` (a path or binary file).
+
+    Long lists are streamed, shorter ones are built by filling python-docx tables.
+    """
+    layout = _stream_layout(path) if len(words) >= DOCX_STREAM_MIN_ENTRIES else None
+    if layout is not None:
+        write_docx(output, layout.members, _stream_document(layout, words, values))
+    else:
+        _render(_template(path), words, fill, output)
+
+
+def _to_bytes(write, words: list[dict]) -> bytes:
+    buffer = io.BytesIO()
+    write(words, buffer)
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=None)
+def _run_prototype(font_name: str, font_size: int, east_asia_font: str | None = None, bold: bool = False, color: RGBColor | None = None):
+    """Build an empty w:r with the formatting for a run style once; runs start as deep copies of it."""
+    run = Paragraph(OxmlElement("w:p"), None).add_run()
+    if bold:
+        run.bold = True
     run.font.size = Pt(font_size)
+    if color is not None:
+        run.font.color.rgb = color
     rPr = run._r.get_or_add_rPr()
     rFonts = rPr.find(qn("w:rFonts"))
     if rFonts is None:
@@ -99,116 +315,106 @@ def _set_cell_text(cell, text: str, font_name: str, font_size: int, east_asia_fo
     rFonts.set(qn("w:hAnsi"), font_name)
     ea = east_asia_font or font_name
     rFonts.set(qn("w:eastAsia"), ea)
+    return run._r
 
 
-def generate_word(words: list[dict], job_id: str | None = None) -> str:
-    """Generate a Word file from extracted words using the template."""
-    doc = Document(os.path.abspath(TEMPLATE_PATH))
+def _add_run(p, text: str, prototype):
+    """Append a run to paragraph element ``p``, with the same XML as python-docx's ``add_run(text)``."""
+    r = copy.deepcopy(prototype)
+    if "\t" in text or "\r" in text or "\n" in text:
+        r.text = text
+    elif text:
+        t = OxmlElement("w:t")
+        t.text = text
+        if len(text.strip()) < len(text):
+            t.set(qn("xml:space"), "preserve")
+        r.append(t)
+    p.append(r)
 
-    # Remove any document protection inherited from template
-    settings = doc.settings.element
-    doc_prot = settings.find(qn("w:documentProtection"))
-    if doc_prot is not None:
-        settings.remove(doc_prot)
 
-    body = doc.element.body
-    table = doc.tables[0]
+def _calc_font_size(text: str, usable_width_pt: float, base_size: int) -> int:
+    """Calculate font size to fit text in one line.
 
-    # Read template dimensions dynamically
-    rows_per_page = len(table.rows)
-    korean_cell = table.rows[0].cells[5]
-    cell_width = _get_cell_width_pt(korean_cell)
-    cell_padding = _get_cell_padding_pt(table, korean_cell)
-    usable_width = cell_width - cell_padding
+    Full-width chars (Korean, Chinese) count as 1.0 width unit.
+    Half-width chars (ASCII, spaces, punctuation) count as 0.5 width unit.
+    """
+    width_units = 0
+    for ch in text:
+        if ord(ch) > 0x7F:
+            width_units += 1.0
+        else:
+            width_units += 0.5
 
-    # Save original table XML for cloning
-    template_tbl_xml = copy.deepcopy(table._tbl)
+    if width_units == 0:
+        return base_size
 
-    # Split words into pages
-    pages = []
-    for i in range(0, len(words), rows_per_page):
-        pages.append(words[i : i + rows_per_page])
+    max_size = usable_width_pt / width_units
+    font_size = min(base_size, int(max_size))
+    return max(font_size, MIN_FONT_SIZE)
 
-    if not pages:
-        pages = [[]]
 
-    # Fill first page (existing table)
-    _fill_table(doc.tables[0], pages[0], usable_width)
+def _set_cell_text(para, text: str, font_name: str, font_size: int, east_asia_font: str | None = None):
+    """Set a cell's (first paragraph's) text with specified font and size."""
+    para.clear_content()
+    _add_run(para, text, _run_prototype(font_name, font_size, east_asia_font))
 
-    # Add additional pages by cloning the template table
-    for page_idx in range(1, len(pages)):
-        new_tbl = copy.deepcopy(template_tbl_xml)
-        body.append(new_tbl)
-        new_table = doc.tables[page_idx]
-        _fill_table(new_table, pages[page_idx], usable_width)
 
+def generate_word(words: list[dict], job_id: str | None = None) -> str:
+    """Generate a Word file from extracted words using the template."""
     # Save to temp directory
     os.makedirs(TEMP_DIR, exist_ok=True)
     file_id = job_id or str(uuid.uuid4())
     output_path = os.path.join(TEMP_DIR, f"{file_id}.docx")
-    doc.save(output_path)
-
+    _write_word(words, output_path)
     return output_path
 
 
+def render_word(words: list[dict]) -> bytes:
+    """The same document as generate_word, returned as bytes instead of written to temp/."""
+    return _to_bytes(_write_word, words)
+
+
+def _write_word(words: list[dict], output):
+    template = _template(TEMPLATE_PATH)
+    _save(
+        TEMPLATE_PATH, words, output,
+        lambda table, page: _fill_table(table, page, template.usable_width),
+        lambda word: _word_values(word, template.usable_width),
+    )
+
+
 def _fill_table(table, words: list[dict], usable_width: float):
     """Fill a table's rows with word data."""
     for i, word in enumerate(words):
-        if i >= len(table.rows):
-            break
-        row = table.rows[i]
-        cells = row.cells
-        _set_cell_text(cells[0], word.get("chinese", ""), "Microsoft YaHei", 12)
-        _set_cell_text(cells[3], word.get("pinyin", ""), "맑은 고딕", 12)
+        _set_cell_text(table.paragraph(i, 0), word.get("chinese", ""), "Microsoft YaHei", 12)
+        _set_cell_text(table.paragraph(i, 3), word.get("pinyin", ""), "맑은 고딕", 12)
         korean_text = word.get("korean", "")
         korean_size = _calc_font_size(korean_text, usable_width, 11)
-        _set_cell_text(cells[5], korean_text, "맑은 고딕", korean_size)
+        _set_cell_text(table.paragraph(i, 5), korean_text, "맑은 고딕", korean_size)
 
 
-def _set_cell_hanja_hun_eum(cell, hun: str, eum: str, font_name: str, font_size: int):
+def _word_values(word: dict, usable_width: float) -> dict:
+    korean_text = word.get("korean", "")
+    return {
+        "chinese": word.get("chinese", ""),
+        "pinyin": word.get("pinyin", ""),
+        "korean": korean_text,
+        # w:sz is in half-points
+        "korean_sz": str(_calc_font_size(korean_text, usable_width, 11) * 2),
+    }
+
+
+def _set_cell_hanja_hun_eum(para, hun: str, eum: str, font_name: str, font_size: int):
     """Set cell text as 'hun / eum' with eum in bold."""
-    para = cell.paragraphs[0]
-    para.clear()
-
-    run1 = para.add_run(f"{hun} / ")
-    run1.font.size = Pt(font_size)
-    rPr1 = run1._r.get_or_add_rPr()
-    rFonts1 = rPr1.find(qn("w:rFonts"))
-    if rFonts1 is None:
-        rFonts1 = run1._r.makeelement(qn("w:rFonts"), {})
-        rPr1.insert(0, rFonts1)
-    rFonts1.set(qn("w:ascii"), font_name)
-    rFonts1.set(qn("w:hAnsi"), font_name)
-    rFonts1.set(qn("w:eastAsia"), font_name)
-
-    run2 = para.add_run(eum)
-    run2.bold = True
-    run2.font.size = Pt(font_size)
-    rPr2 = run2._r.get_or_add_rPr()
-    rFonts2 = rPr2.find(qn("w:rFonts"))
-    if rFonts2 is None:
-        rFonts2 = run2._r.makeelement(qn("w:rFonts"), {})
-        rPr2.insert(0, rFonts2)
-    rFonts2.set(qn("w:ascii"), font_name)
-    rFonts2.set(qn("w:hAnsi"), font_name)
-    rFonts2.set(qn("w:eastAsia"), font_name)
-
-
-def _set_cell_gray_text(cell, text: str, font_name: str, font_size: int):
+    para.clear_content()
+    _add_run(para, f"{hun} / ", _run_prototype(font_name, font_size))
+    _add_run(para, eum, _run_prototype(font_name, font_size, bold=True))
+
+
+def _set_cell_gray_text(para, text: str, font_name: str, font_size: int):
     """Set cell text with gray color."""
-    para = cell.paragraphs[0]
-    para.clear()
-    run = para.add_run(text)
-    run.font.size = Pt(font_size)
-    run.font.color.rgb = GRAY_COLOR
-    rPr = run._r.get_or_add_rPr()
-    rFonts = rPr.find(qn("w:rFonts"))
-    if rFonts is None:
-        rFonts = run._r.makeelement(qn("w:rFonts"), {})
-        rPr.insert(0, rFonts)
-    rFonts.set(qn("w:ascii"), font_name)
-    rFonts.set(qn("w:hAnsi"), font_name)
-    rFonts.set(qn("w:eastAsia"), font_name)
+    para.clear_content()
+    _add_run(para, text, _run_prototype(font_name, font_size, color=GRAY_COLOR))
 
 
 def generate_hanja_word(words: list[dict], job_id: str | None = None) -> str:
@@ -216,44 +422,30 @@ def generate_hanja_word(words: list[dict], job_id: str | None = None) -> str:
 
     cells[0] = hanja (black), cells[1] = hanja (gray, for tracing), cells[2] = hun / eum (eum bold)
     """
-    doc = Document(os.path.abspath(HANJA_TEMPLATE_PATH))
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    file_id = job_id or str(uuid.uuid4())
+    output_path = os.path.join(TEMP_DIR, f"{file_id}_hanja.docx")
+    _write_hanja_word(words, output_path)
+    return output_path
 
-    settings = doc.settings.element
-    doc_prot = settings.find(qn("w:documentProtection"))
-    if doc_prot is not None:
-        settings.remove(doc_prot)
 
-    body = doc.element.body
-    table = doc.tables[0]
-    rows_per_page = len(table.rows)
-    template_tbl_xml = copy.deepcopy(table._tbl)
+def render_hanja_word(words: list[dict]) -> bytes:
+    """The same document as generate_hanja_word, returned as bytes instead of written to temp/."""
+    return _to_bytes(_write_hanja_word, words)
 
-    pages = []
-    for i in range(0, len(words), rows_per_page):
-        pages.append(words[i : i + rows_per_page])
-    if not pages:
-        pages = [[]]
 
-    _fill_hanja_table(doc.tables[0], pages[0])
-    for page_idx in range(1, len(pages)):
-        new_tbl = copy.deepcopy(template_tbl_xml)
-        body.append(new_tbl)
-        _fill_hanja_table(doc.tables[page_idx], pages[page_idx])
+def _write_hanja_word(words: list[dict], output):
+    _save(HANJA_TEMPLATE_PATH, words, output, _fill_hanja_table, _hanja_values)
 
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    file_id = job_id or str(uuid.uuid4())
-    output_path = os.path.join(TEMP_DIR, f"{file_id}_hanja.docx")
-    doc.save(output_path)
-    return output_path
+
+def _hanja_values(word: dict) -> dict:
+    return {"hanja": word.get("hanja", ""), "hun": word.get("hun", ""), "eum": word.get("eum", "")}
 
 
 def _fill_hanja_table(table, words: list[dict]):
     """Fill a table's rows with hanja word data."""
     for i, word in enumerate(words):
-        if i >= len(table.rows):
-            break
-        cells = table.rows[i].cells
         hanja = word.get("hanja", "")
-        _set_cell_text(cells[0], hanja, "Microsoft YaHei", 15)
-        _set_cell_gray_text(cells[1], hanja, "Microsoft YaHei", 15)
-        _set_cell_hanja_hun_eum(cells[2], word.get("hun", ""), word.get("eum", ""), "맑은 고딕", 13)
+        _set_cell_text(table.paragraph(i, 0), hanja, "Microsoft YaHei", 15)
+        _set_cell_gray_text(table.paragraph(i, 1), hanja, "Microsoft YaHei", 15)
+        _set_cell_hanja_hun_eum(table.paragraph(i, 2), word.get("hun", ""), word.get("eum", ""), "맑은 고딕", 13)
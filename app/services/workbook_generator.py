@@ -1,10 +1,24 @@
+import io
 import os
 import uuid
+from dataclasses import dataclass
+from functools import lru_cache
 
 from docx import Document
 from docx.shared import Pt, Cm, Emu, RGBColor
 from docx.oxml.ns import qn
 
+from app.services.ooxml_writer import (
+    DOCX_STREAM_MIN_ENTRIES,
+    Fragment,
+    cut_after,
+    cut_before,
+    mark,
+    package_members,
+    split_part,
+    write_docx,
+)
+
 TEMP_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "temp")
 
 GRAY_COLOR = RGBColor(0xEA, 0xEA, 0xEA)
@@ -33,12 +47,15 @@ def _set_cell_width(cell, width_emu: int):
     if tcW is None:
         tcW = cell._tc.makeelement(qn("w:tcW"), {})
         tcPr.append(tcW)
-    # Convert EMU to twips (1 twip = 635 EMU)
-    twips = int(width_emu / 635)
-    tcW.set(qn("w:w"), str(twips))
+    tcW.set(qn("w:w"), str(_twips(width_emu)))
     tcW.set(qn("w:type"), "dxa")
 
 
+def _twips(width_emu: int) -> int:
+    # 1 twip = 635 EMU
+    return int(width_emu / 635)
+
+
 def _set_cell_no_wrap(cell):
     """Prevent text wrapping in a cell."""
     tcPr = cell._tc.get_or_add_tcPr()
@@ -63,21 +80,12 @@ def _calc_chinese_text_width_pt(text: str, font_size_pt: int) -> float:
     return width
 
 
-def generate_workbook_type1(entries: list[dict], job_id: str | None = None) -> str:
-    """Generate Type 1 workbook: table with gray Chinese characters for tracing.
+def _type1_column_widths(entries: list[dict]) -> tuple[int, int, int, int]:
+    """Column widths (EMU) of 한자, 병음, 의미 and 예문.
 
     Column widths are adjusted so 한자 and 예문 columns fit in one line.
     병음 and 의미 columns may wrap to 2 lines.
     """
-    doc = Document()
-
-    # Page margins
-    section = doc.sections[0]
-    section.top_margin = Cm(1.5)
-    section.bottom_margin = Cm(1.5)
-    section.left_margin = Cm(2.0)
-    section.right_margin = Cm(2.0)
-
     # Available page width = A4 width (21cm) - left margin - right margin
     page_width_cm = 21.0 - 2.0 - 2.0  # 17cm
     page_width_pt = page_width_cm / 2.54 * 72  # ~481pt
@@ -119,6 +127,21 @@ def generate_workbook_type1(entries: list[dict], job_id: str | None = None) -> s
     pinyin_col_emu = int(pinyin_col_pt * pt_to_emu)
     meaning_col_emu = int(meaning_col_pt * pt_to_emu)
     example_col_emu = int(example_col_pt * pt_to_emu)
+    return chinese_col_emu, pinyin_col_emu, meaning_col_emu, example_col_emu
+
+
+def _build_type1(entries: list[dict]):
+    """Type 1 workbook: table with gray Chinese characters for tracing."""
+    doc = Document()
+
+    # Page margins
+    section = doc.sections[0]
+    section.top_margin = Cm(1.5)
+    section.bottom_margin = Cm(1.5)
+    section.left_margin = Cm(2.0)
+    section.right_margin = Cm(2.0)
+
+    chinese_col_emu, pinyin_col_emu, meaning_col_emu, example_col_emu = _type1_column_widths(entries)
 
     # Create table
     table = doc.add_table(rows=len(entries), cols=4)
@@ -165,16 +188,11 @@ def generate_workbook_type1(entries: list[dict], job_id: str | None = None) -> s
             run = p.add_run(example_text)
             _set_run_font(run, "Microsoft YaHei", 16, color=GRAY_COLOR)
 
-    # Save
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    file_id = job_id or str(uuid.uuid4())
-    output_path = os.path.join(TEMP_DIR, f"{file_id}.docx")
-    doc.save(output_path)
-    return output_path
+    return doc
 
 
-def generate_workbook_type2(entries: list[dict], job_id: str | None = None) -> str:
-    """Generate Type 2 workbook: Korean interpretation then Chinese text (gray) for tracing."""
+def _build_type2(entries: list[dict]):
+    """Type 2 workbook: Korean interpretation then Chinese text (gray) for tracing."""
     doc = Document()
 
     # Page margins
@@ -205,16 +223,11 @@ def generate_workbook_type2(entries: list[dict], job_id: str | None = None) -> s
         run = p.add_run(prefix + chinese_text)
         _set_run_font(run, "Microsoft YaHei", 16, color=GRAY_COLOR)
 
-    # Save
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    file_id = job_id or str(uuid.uuid4())
-    output_path = os.path.join(TEMP_DIR, f"{file_id}.docx")
-    doc.save(output_path)
-    return output_path
+    return doc
 
 
-def generate_workbook_type3(entries: list[dict], job_id: str | None = None) -> str:
-    """Generate Type 3 workbook: phrase explanation examples only.
+def _build_type3(entries: list[dict]):
+    """Type 3 workbook: phrase explanation examples only.
 
     Each entry: Korean line + gray Chinese line for tracing (same as Type 2).
     """
@@ -242,18 +255,163 @@ def generate_workbook_type3(entries: list[dict], job_id: str | None = None) -> s
         run = p.add_run(chinese_text)
         _set_run_font(run, "Microsoft YaHei", 16, color=GRAY_COLOR)
 
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    file_id = job_id or str(uuid.uuid4())
-    output_path = os.path.join(TEMP_DIR, f"{file_id}.docx")
-    doc.save(output_path)
-    return output_path
+    return doc
 
 
-def generate_workbook(entries: list[dict], workbook_type: str, job_id: str | None = None) -> str:
+# ===== Streaming writer (see ooxml_writer) =====
+
+@dataclass(frozen=True)
+class _StreamLayout:
+    """A workbook's document.xml as ``head``, one fragment per entry and ``tail``.
+
+    ``variants`` holds one fragment per probe entry; entries whose optional text
+    is empty produce different XML (no run, no prefix) and use their own variant.
+    """
+
+    members: list
+    head: str
+    variants: tuple
+    tail: str
+
+
+_PROBE_TYPE1 = [
+    {"chinese": mark("chinese"), "pinyin": mark("pinyin"), "meaning": mark("meaning"), "example": mark("example")},
+    {"chinese": mark("chinese"), "pinyin": mark("pinyin"), "meaning": mark("meaning"), "example": ""},
+]
+_PROBE_TYPE2 = [
+    {"speaker": mark("speaker"), "korean": mark("korean"), "chinese_text": mark("chinese_text")},
+    {"speaker": "", "korean": mark("korean"), "chinese_text": mark("chinese_text")},
+]
+_PROBE_TYPE3 = [{"korean": mark("korean"), "chinese_text": mark("chinese_text")}]
+
+
+def _split_layout(doc, units: list[list]) -> _StreamLayout:
+    """Split a probe document; ``units`` are the body-level elements written for each probe entry."""
+    members = package_members(doc)
+    for unit in units:
+        cut_before(unit[0])
+    cut_after(units[-1][-1])
+    head, *variants, tail = split_part(doc.element)
+    return _StreamLayout(members, head, tuple(Fragment(v) for v in variants), tail)
+
+
+@lru_cache(maxsize=None)
+def _type1_layout() -> _StreamLayout:
+    doc = _build_type1(_PROBE_TYPE1)
+    trs = doc.tables[0]._tbl.findall(qn("w:tr"))
+    # Column widths depend on every entry, so they are values too
+    for tr in trs:
+        for i, tc in enumerate(tr.findall(qn("w:tc"))):
+            tc.tcPr.find(qn("w:tcW")).set(qn("w:w"), mark(f"width{i}"))
+    return _split_layout(doc, [[tr] for tr in trs])
+
+
+def _paragraph_pairs(doc) -> list[list]:
+    paragraphs = doc.element.body.findall(qn("w:p"))
+    return [paragraphs[i : i + 2] for i in range(0, len(paragraphs), 2)]
+
+
+@lru_cache(maxsize=None)
+def _type2_layout() -> _StreamLayout:
+    doc = _build_type2(_PROBE_TYPE2)
+    return _split_layout(doc, _paragraph_pairs(doc))
+
+
+@lru_cache(maxsize=None)
+def _type3_layout() -> _StreamLayout:
+    doc = _build_type3(_PROBE_TYPE3)
+    return _split_layout(doc, _paragraph_pairs(doc))
+
+
+def _stream_document(layout: _StreamLayout, entries: list[dict], variant, values):
+    yield layout.head
+    for entry in entries:
+        yield layout.variants[variant(entry)].render(values(entry))
+    yield layout.tail
+
+
+def _output_path(job_id: str | None) -> str:
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    file_id = job_id or str(uuid.uuid4())
+    return os.path.join(TEMP_DIR, f"{file_id}.docx")
+
+
+def _write_type1(entries: list[dict], output):
+    """Type 1 workbook: table with gray Chinese characters for tracing."""
+    if len(entries) < DOCX_STREAM_MIN_ENTRIES:
+        _build_type1(entries).save(output)
+        return
+
+    layout = _type1_layout()
+    widths = {f"width{i}": str(_twips(width)) for i, width in enumerate(_type1_column_widths(entries))}
+    write_docx(output, layout.members, _stream_document(
+        layout, entries,
+        lambda entry: 0 if entry.get("example", "") else 1,
+        lambda entry: {
+            **widths,
+            "chinese": entry.get("chinese", ""),
+            "pinyin": entry.get("pinyin", ""),
+            "meaning": entry.get("meaning", ""),
+            "example": entry.get("example", ""),
+        },
+    ))
+
+
+def _write_type2(entries: list[dict], output):
+    """Type 2 workbook: Korean interpretation then Chinese text (gray) for tracing."""
+    if len(entries) < DOCX_STREAM_MIN_ENTRIES:
+        _build_type2(entries).save(output)
+        return
+
+    write_docx(output, _type2_layout().members, _stream_document(
+        _type2_layout(), entries,
+        lambda entry: 0 if entry.get("speaker", "") else 1,
+        lambda entry: {
+            "speaker": entry.get("speaker", ""),
+            "korean": entry.get("korean", ""),
+            "chinese_text": entry.get("chinese_text", ""),
+        },
+    ))
+
+
+def _write_type3(entries: list[dict], output):
+    """Type 3 workbook: phrase explanation examples only."""
+    if len(entries) < DOCX_STREAM_MIN_ENTRIES:
+        _build_type3(entries).save(output)
+        return
+
+    write_docx(output, _type3_layout().members, _stream_document(
+        _type3_layout(), entries,
+        lambda entry: 0,
+        lambda entry: {"korean": entry.get("korean", ""), "chinese_text": entry.get("chinese_text", "")},
+    ))
+
+
+def preload_layouts():
+    """Build the streaming layouts now rather than on the first large generate request."""
+    _type1_layout()
+    _type2_layout()
+    _type3_layout()
+
+
+def _writer(workbook_type: str):
     if workbook_type == "type1":
-        return generate_workbook_type1(entries, job_id)
+        return _write_type1
     if workbook_type == "type3":
-        return generate_workbook_type3(entries, job_id)
+        return _write_type3
     if workbook_type == "type4":
-        return generate_workbook_type3(entries, job_id)
-    return generate_workbook_type2(entries, job_id)
+        return _write_type3
+    return _write_type2
+
+
+def generate_workbook(entries: list[dict], workbook_type: str, job_id: str | None = None) -> str:
+    output_path = _output_path(job_id)
+    _writer(workbook_type)(entries, output_path)
+    return output_path
+
+
+def render_workbook(entries: list[dict], workbook_type: str) -> bytes:
+    """The same document as generate_workbook, returned as bytes instead of written to temp/."""
+    buffer = io.BytesIO()
+    _writer(workbook_type)(entries, buffer)
+    return buffer.getvalue()
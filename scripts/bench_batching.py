@@ -0,0 +1,84 @@
+"""Compare one-call-per-page extraction with multi-image batching.
+
+Runs the same pages through the batched extraction path at each batch size
+and prints wall time, provider requests and token totals. The extraction
+cache is disabled so every run really calls the provider configured in .env
+(AI_PROVIDER, API keys, optional *_BASE_URL).
+
+    python scripts/bench_batching.py page1.jpg page2.jpg ... --kind workbook --sizes 1,2,4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["EXTRACTION_CACHE_ENABLED"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import ai_extractor  # noqa: E402
+from app.services.provider_clients import clients  # noqa: E402
+from app.services.usage_stats import usage_stats  # noqa: E402
+
+BATCH_FUNCTIONS = {
+    "words": ai_extractor.extract_words_batch,
+    "hanja": ai_extractor.extract_hanja_batch,
+    "workbook": ai_extractor.detect_and_extract_workbook_batch,
+}
+
+
+def _count(result) -> int:
+    if isinstance(result, Exception):
+        return 0
+    return len(result["entries"]) if isinstance(result, dict) else len(result)
+
+
+async def run(paths: list[str], kind: str, size: int) -> dict:
+    ai_extractor.EXTRACT_BATCH_SIZE = size
+    usage_stats.reset()
+    extract = BATCH_FUNCTIONS[kind]
+    groups = [paths[i:i + size] for i in range(0, len(paths), size)]
+
+    start = time.perf_counter()
+    results = []
+    for group in await asyncio.gather(*[extract(group) for group in groups]):
+        results.extend(group)
+    elapsed = time.perf_counter() - start
+
+    usage = usage_stats.stats().get(ai_extractor.current_provider(), {})
+    return {
+        "size": size,
+        "seconds": elapsed,
+        "requests": usage.get("requests", 0),
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_input_tokens": usage.get("cached_input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "rows": sum(_count(r) for r in results),
+        "failed_pages": sum(1 for r in results if isinstance(r, Exception)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="page images to extract")
+    parser.add_argument("--kind", choices=sorted(BATCH_FUNCTIONS), default="words")
+    parser.add_argument("--sizes", default="1,2,4", help="comma-separated batch sizes (1 = one call per page)")
+    args = parser.parse_args()
+
+    clients.startup()
+    try:
+        rows = [await run(args.images, args.kind, int(size)) for size in args.sizes.split(",")]
+    finally:
+        await clients.aclose()
+
+    print(f"{len(args.images)} pages, kind={args.kind}, provider={ai_extractor.current_provider()}")
+    print(f"{'K':>3} {'seconds':>8} {'requests':>8} {'input':>8} {'cached':>8} {'output':>8} {'rows':>6} {'failed':>6}")
+    for row in rows:
+        print(
+            f"{row['size']:>3} {row['seconds']:>8.2f} {row['requests']:>8} {row['input_tokens']:>8} "
+            f"{row['cached_input_tokens']:>8} {row['output_tokens']:>8} {row['rows']:>6} {row['failed_pages']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""Compare the JSON and compact (tab-separated) extraction reply formats.
+
+Runs the same pages once per format through the single-page extraction path
+and prints wall time, provider requests, output tokens and extracted rows.
+The extraction cache is disabled so every run really calls the provider
+configured in .env (AI_PROVIDER, API keys, optional *_BASE_URL). Pages run
+one after another so the per-page latency is not skewed by rate limits.
+
+    python scripts/bench_output_format.py page1.jpg page2.jpg ... --kind workbook
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["EXTRACTION_CACHE_ENABLED"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import ai_extractor  # noqa: E402
+from app.services.provider_clients import clients  # noqa: E402
+from app.services.usage_stats import usage_stats  # noqa: E402
+
+EXTRACT_FUNCTIONS = {
+    "words": ai_extractor.extract_words,
+    "workbook": ai_extractor.detect_and_extract_workbook,
+}
+
+PROMPTS = {
+    "json": (ai_extractor.EXTRACT_JSON_PROMPT, ai_extractor.WORKBOOK_COMBINED_JSON_PROMPT),
+    "tsv": (ai_extractor.EXTRACT_TSV_PROMPT, ai_extractor.WORKBOOK_COMBINED_TSV_PROMPT),
+}
+
+
+def _count(result) -> int:
+    if isinstance(result, Exception):
+        return 0
+    return len(result["entries"]) if isinstance(result, dict) else len(result)
+
+
+async def run(paths: list[str], kind: str, output_format: str) -> dict:
+    ai_extractor.EXTRACT_PROMPT, ai_extractor.WORKBOOK_COMBINED_PROMPT = PROMPTS[output_format]
+    usage_stats.reset()
+    extract = EXTRACT_FUNCTIONS[kind]
+
+    latencies = []
+    results = []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            results.append(await extract(path))
+        except Exception as e:
+            results.append(e)
+        latencies.append(time.perf_counter() - start)
+
+    usage = usage_stats.stats().get(ai_extractor.current_provider(), {})
+    return {
+        "format": output_format,
+        "seconds": sum(latencies),
+        "max_seconds": max(latencies),
+        "requests": usage.get("requests", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "rows": sum(_count(r) for r in results),
+        "failed_pages": sum(1 for r in results if isinstance(r, Exception)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="page images to extract")
+    parser.add_argument("--kind", choices=sorted(EXTRACT_FUNCTIONS), default="words")
+    parser.add_argument("--formats", default="json,tsv", help="comma-separated reply formats to compare")
+    args = parser.parse_args()
+
+    clients.startup()
+    try:
+        rows = [await run(args.images, args.kind, name) for name in args.formats.split(",")]
+    finally:
+        await clients.aclose()
+
+    print(f"{len(args.images)} pages, kind={args.kind}, provider={ai_extractor.current_provider()}")
+    print(f"{'format':>6} {'seconds':>8} {'max':>6} {'requests':>8} {'output':>8} {'out/row':>7} {'rows':>6} {'failed':>6}")
+    for row in rows:
+        per_row = row["output_tokens"] / row["rows"] if row["rows"] else 0
+        print(
+            f"{row['format']:>6} {row['seconds']:>8.2f} {row['max_seconds']:>6.2f} {row['requests']:>8} "
+            f"{row['output_tokens']:>8} {per_row:>7.1f} {row['rows']:>6} {row['failed_pages']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
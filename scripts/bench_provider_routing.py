@@ -0,0 +1,79 @@
+"""Compare page latency with and without hedged requests across the two providers.
+
+Extracts the same pages several times per mode, all pages of a round at once
+like a multi-page upload, and prints p50/p90/p99 page latency, the hedges
+sent and how many of them won. Hedging needs both ANTHROPIC_API_KEY and
+OPENAI_API_KEY (optionally *_BASE_URL); AI_PROVIDER is the primary. The
+extraction cache is disabled so every page really calls a provider. The
+"single" mode runs first, so the "hedge" mode starts with the primary's
+latencies already observed.
+
+    python scripts/bench_provider_routing.py page1.jpg page2.jpg ... --rounds 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["EXTRACTION_CACHE_ENABLED"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import ai_extractor, provider_router  # noqa: E402
+from app.services.provider_clients import clients  # noqa: E402
+
+
+async def run(paths: list[str], rounds: int, hedge: bool) -> dict:
+    provider_router.PROVIDER_HEDGE = hedge
+    router = ai_extractor.provider_router
+    before = router.stats()
+
+    async def page(path):
+        start = time.perf_counter()
+        try:
+            await ai_extractor.extract_words(path)
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    results = []
+    for _ in range(rounds):
+        results += await asyncio.gather(*[page(path) for path in paths])
+
+    latencies = sorted(latency for latency, _ in results)
+    after = router.stats()
+    return {
+        "mode": "hedge" if hedge else "single",
+        "p50": provider_router._percentile(latencies, 50),
+        "p90": provider_router._percentile(latencies, 90),
+        "p99": provider_router._percentile(latencies, 99),
+        "hedges": sum(after[name]["hedges"] - before[name]["hedges"] for name in after),
+        "hedge_wins": sum(after[name]["hedge_wins"] - before[name]["hedge_wins"] for name in after),
+        "failed": sum(1 for _, ok in results if not ok),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="page images to extract")
+    parser.add_argument("--rounds", type=int, default=10, help="times every page is extracted per mode")
+    args = parser.parse_args()
+
+    clients.startup()
+    try:
+        rows = [await run(args.images, args.rounds, hedge) for hedge in (False, True)]
+    finally:
+        await clients.aclose()
+
+    print(f"{len(args.images)} pages x {args.rounds} rounds, route={ai_extractor.provider_router.route()}")
+    print(f"{'mode':>6} {'p50':>6} {'p90':>6} {'p99':>6} {'hedges':>6} {'won':>5} {'failed':>6}")
+    for row in rows:
+        print(
+            f"{row['mode']:>6} {row['p50']:>6.2f} {row['p90']:>6.2f} {row['p99']:>6.2f} "
+            f"{row['hedges']:>6} {row['hedge_wins']:>5} {row['failed']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Measure per-request latency of the word list and hanja Word generators.
+
+Times generate_word / generate_hanja_word on synthetic lists. With --baseline
+the generator module at that git revision is timed too, so a change can be
+compared with the code it replaced (e.g. the per-request template parsing
+before the template cache).
+
+    python scripts/bench_word_generator.py --words 100 --runs 30 --baseline HEAD~1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services import word_generator  # noqa: E402
+
+MODULE_PATH = "app/services/word_generator.py"
+
+
+def _load_revision(rev: str) -> types.ModuleType:
+    source = subprocess.run(
+        ["git", "show", f"{rev}:{MODULE_PATH}"], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    module = types.ModuleType(f"word_generator_{rev}")
+    module.__file__ = os.path.join(ROOT, MODULE_PATH)
+    exec(compile(source, module.__file__, "exec"), module.__dict__)
+    return module
+
+
+def _sample(count: int) -> tuple[list[dict], list[dict]]:
+    words = [
+        {"chinese": f"打扫{i}", "pinyin": f"dǎsǎo {i}", "korean": "청소하다, 깨끗이 정리하다 " * (1 + i % 3)}
+        for i in range(count)
+    ]
+    hanja = [{"hanja": "山", "hun": "메", "eum": f"산{i}"} for i in range(count)]
+    return words, hanja
+
+
+def _time(fn, data: list[dict], runs: int) -> float:
+    """Median milliseconds per call; the generated files are deleted as they are made."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        path = fn(data, "bench_word_generator")
+        samples.append((time.perf_counter() - start) * 1000)
+        os.remove(path)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=100, help="entries per document")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--baseline", metavar="REV", help="also time the generator at this git revision")
+    args = parser.parse_args()
+
+    words, hanja = _sample(args.words)
+    modules = [("current", word_generator)]
+    if args.baseline:
+        modules.insert(0, (args.baseline, _load_revision(args.baseline)))
+
+    # First call per module parses templates where they are cached; keep it out of the timings
+    for _, module in modules:
+        os.remove(module.generate_word(words, "bench_word_generator"))
+        os.remove(module.generate_hanja_word(hanja, "bench_word_generator"))
+
+    print(f"{args.words} entries, median of {args.runs} runs (ms per request)")
+    print(f"{'version':>12} {'generate_word':>14} {'generate_hanja_word':>20}")
+    for name, module in modules:
+        print(f"{name:>12} {_time(module.generate_word, words, args.runs):>14.1f} {_time(module.generate_hanja_word, hanja, args.runs):>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Pre-extract whole textbooks through the providers' asynchronous batch APIs.
+
+Every page is preprocessed and keyed exactly like an interactive upload, sent
+in one Message Batch (Anthropic) or Batch job (OpenAI) at batch pricing, and
+the parsed results are written to the extraction cache. Later uploads of the
+same pages are answered from the cache without a provider call.
+
+    python scripts/bulk_extract.py textbook/ --kind workbook
+    python scripts/bulk_extract.py --resume msgbatch_...   # keep polling after a restart
+
+Pages already in the cache are skipped. Use scripts/fake_batch_server.py to
+try the flow offline.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import bulk_extractor  # noqa: E402
+from app.services.extraction_cache import CACHE_ENABLED, extraction_cache  # noqa: E402
+from app.services.provider_clients import clients  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif")
+
+
+def _expand(paths: list[str]) -> list[str]:
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            images.append(path)
+    return images
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", help="page images or directories of page images")
+    parser.add_argument("--kind", choices=sorted(bulk_extractor.BULK_KINDS), default="words")
+    parser.add_argument("--provider", choices=("anthropic", "openai"), help="defaults to AI_PROVIDER")
+    parser.add_argument("--poll", type=float, default=bulk_extractor.BULK_POLL_INTERVAL, help="seconds between status checks")
+    parser.add_argument("--resume", metavar="BATCH", help="batch id or manifest path of an already submitted batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not CACHE_ENABLED:
+        parser.error("EXTRACTION_CACHE_ENABLED=0: results would not be stored")
+    clients.startup()
+    try:
+        if args.resume:
+            manifest = bulk_extractor.load_manifest(args.resume)
+        else:
+            images = _expand(args.images)
+            if not images:
+                parser.error("no images given")
+            manifest = await bulk_extractor.submit(images, args.kind, args.provider)
+            if manifest is None:
+                print(json.dumps({"pages": 0, "detail": "all pages already stored"}))
+                return
+        await bulk_extractor.wait(manifest, args.poll)
+        summary = await bulk_extractor.collect(manifest)
+    finally:
+        await clients.aclose()
+        extraction_cache.close()
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""Check that jobs and downloads work from any worker of a multi-process server.
+
+Starts ``uvicorn app.main:app --workers N`` on a free port, then:
+
+* generates a few documents and downloads each of them many times, every
+  request on a new connection so they are spread over the workers;
+* uploads a small generated page and polls its job the same way until it has
+  finished. Without provider keys the job simply fails, which is enough: the
+  point is that every worker can see it.
+
+    python scripts/check_multiworker.py --workers 4
+    SHARED_STORE=memory python scripts/check_multiworker.py   # job polls now 404 on other workers
+
+Exits non-zero on the first request that fails.
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(url: str, body: bytes | None = None, headers: dict | None = None) -> tuple[int, bytes]:
+    # A new connection per request, so the kernel may hand it to any worker
+    request = urllib.request.Request(url, body, headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _request_ok(url: str) -> bool:
+    try:
+        return _request(url)[0] == 200
+    except OSError:
+        return False
+
+
+def _post_json(url: str, payload: dict) -> dict:
+    status, body = _request(url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+    if status != 200:
+        sys.exit(f"POST {url} -> {status}: {body[:200]!r}")
+    return json.loads(body)
+
+
+def _page_image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _upload(base: str) -> str:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="files"; filename="page.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + _page_image() + f"\r\n--{boundary}--\r\n".encode()
+    status, response = _request(f"{base}/api/upload", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    if status != 202:
+        sys.exit(f"upload -> {status}: {response[:200]!r}")
+    return json.loads(response)["job_id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=20, help="downloads per document and job polls")
+    args = parser.parse_args()
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "GENERATE_WORKERS": os.environ.get("GENERATE_WORKERS", "0")}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(args.workers)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 60
+        while _request_ok(f"{base}/health") is False:
+            if time.time() > deadline or server.poll() is not None:
+                sys.exit("server did not start")
+            time.sleep(0.5)
+        # Give every worker time to finish its start-up
+        time.sleep(2)
+
+        downloads = 0
+        for i in range(args.documents):
+            words = [{"chinese": f"字{i}-{n}", "pinyin": "zì", "korean": "글자"} for n in range(50)]
+            download_id = _post_json(f"{base}/api/generate", {"job_id": str(uuid.uuid4()), "words": words})["download_id"]
+            for _ in range(args.requests):
+                status, body = _request(f"{base}/api/download/{download_id}")
+                if status != 200 or not body.startswith(b"PK"):
+                    sys.exit(f"download {download_id} -> {status}")
+                downloads += 1
+        print(f"downloads: {downloads} ok across {args.workers} workers")
+
+        job_id = _upload(base)
+        polls = 0
+        status_text = None
+        for _ in range(args.requests * 10):
+            status, body = _request(f"{base}/api/jobs/{job_id}")
+            if status != 200:
+                sys.exit(f"job poll {job_id} -> {status} after {polls} ok")
+            polls += 1
+            status_text = json.loads(body)["status"]
+            if polls >= args.requests and status_text in ("done", "partial", "failed"):
+                break
+            time.sleep(0.1)
+        print(f"job polls: {polls} ok, final status {status_text}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Local stand-in for the Anthropic Message Batches and OpenAI Batch APIs.
+
+Implements just enough of both APIs for scripts/bulk_extract.py to run end to
+end without network access. Batches finish FAKE_BATCH_SECONDS after they are
+created, and every request gets a canned, well-formed reply for its prompt
+(words, hanja or workbook; tab-separated rows for the compact prompts).
+Nothing is extracted from the images.
+
+    uvicorn scripts.fake_batch_server:app --port 8766
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8766 ANTHROPIC_API_KEY=test \
+        python scripts/bulk_extract.py pages/ --kind workbook --poll 1
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=test AI_PROVIDER=openai \
+        python scripts/bulk_extract.py pages/ --kind words --poll 1
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+FAKE_BATCH_SECONDS = float(os.getenv("FAKE_BATCH_SECONDS", "2"))
+
+app = FastAPI(title="Fake batch API")
+
+_batches: dict[str, dict] = {}
+_files: dict[str, dict] = {}
+
+SAMPLE_REPLIES = {
+    "words": {"words": [
+        {"chinese": "打扫", "pinyin": "dǎsǎo", "korean": "청소하다"},
+        {"chinese": "检查", "pinyin": "jiǎnchá", "korean": "검사하다"},
+    ]},
+    "hanja": {"words": [
+        {"hanja": "山", "hun": "산", "eum": "산"},
+        {"hanja": "水", "hun": "물", "eum": "수"},
+    ]},
+    "workbook": {"type": "type1", "entries": [
+        {"chinese": "向", "pinyin": "xiàng", "meaning": "~을 향하여", "example": "我向他借了一本书。"},
+    ]},
+}
+
+
+def _reply_for(prompt: str) -> str:
+    if "유형을 판별하고" in prompt:
+        kind = "workbook"
+    elif "한문(한자)" in prompt:
+        kind = "hanja"
+    else:
+        kind = "words"
+    if "#end" in prompt:
+        # Compact prompt (EXTRACT_OUTPUT_FORMAT=tsv): header line, tab-separated rows, #end
+        reply = SAMPLE_REPLIES[kind]
+        rows = reply.get("words") or reply.get("entries")
+        header = reply.get("type", "words")
+        return "\n".join([f"#{header}", *("\t".join(row.values()) for row in rows), "#end"])
+    return json.dumps(SAMPLE_REPLIES[kind], ensure_ascii=False)
+
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+def _finished(batch: dict) -> bool:
+    return time.time() - batch["created_at"] >= FAKE_BATCH_SECONDS
+
+
+# ===== Anthropic Message Batches =====
+
+def _anthropic_prompt(params: dict) -> str:
+    system = params.get("system") or []
+    return "\n".join(block.get("text", "") for block in system) if isinstance(system, list) else system
+
+
+def _anthropic_batch(batch: dict, base_url: str) -> dict:
+    done = _finished(batch)
+    count = len(batch["requests"])
+    return {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if done else "in_progress",
+        "request_counts": {
+            "processing": 0 if done else count,
+            "succeeded": count if done else 0,
+            "errored": 0,
+            "canceled": 0,
+            "expired": 0,
+        },
+        "created_at": _iso(batch["created_at"]),
+        "expires_at": _iso(batch["created_at"] + 86400),
+        "ended_at": _iso(batch["created_at"] + FAKE_BATCH_SECONDS) if done else None,
+        "archived_at": None,
+        "cancel_initiated_at": None,
+        "results_url": f"{base_url}v1/messages/batches/{batch['id']}/results" if done else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def anthropic_create_batch(request: Request):
+    body = await request.json()
+    batch = {"id": f"msgbatch_{uuid.uuid4().hex}", "created_at": time.time(), "requests": body["requests"]}
+    _batches[batch["id"]] = batch
+    return _anthropic_batch(batch, str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def anthropic_retrieve_batch(batch_id: str, request: Request):
+    if batch_id not in _batches:
+        raise HTTPException(status_code=404, detail="batch not found")
+    return _anthropic_batch(_batches[batch_id], str(request.base_url))
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def anthropic_batch_results(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None or not _finished(batch):
+        raise HTTPException(status_code=404, detail="results not ready")
+    lines = []
+    for item in batch["requests"]:
+        params = item["params"]
+        lines.append(json.dumps({
+            "custom_id": item["custom_id"],
+            "result": {
+                "type": "succeeded",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": params["model"],
+                    "content": [{"type": "text", "text": _reply_for(_anthropic_prompt(params))}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 1500, "output_tokens": 120},
+                },
+            },
+        }, ensure_ascii=False))
+    return Response("\n".join(lines) + "\n", media_type="application/binary")
+
+
+# ===== OpenAI Files + Batch =====
+
+def _file_object(file: dict) -> dict:
+    return {
+        "id": file["id"],
+        "object": "file",
+        "bytes": len(file["content"]),
+        "created_at": int(file["created_at"]),
+        "filename": file["filename"],
+        "purpose": file["purpose"],
+        "status": "processed",
+    }
+
+
+def _store_file(content: bytes, filename: str, purpose: str) -> dict:
+    file = {"id": f"file-{uuid.uuid4().hex}", "content": content, "filename": filename, "purpose": purpose, "created_at": time.time()}
+    _files[file["id"]] = file
+    return file
+
+
+def _openai_output(batch: dict) -> str:
+    """Build the output file for a finished batch once and remember its id."""
+    if batch.get("output_file_id"):
+        return batch["output_file_id"]
+    lines = []
+    for line in _files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        messages = item["body"]["messages"]
+        prompt = "\n".join(m["content"] for m in messages if m["role"] == "system" and isinstance(m["content"], str))
+        lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": item["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": item["body"]["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": _reply_for(prompt)}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 1500, "completion_tokens": 120, "total_tokens": 1620, "prompt_tokens_details": {"cached_tokens": 0}},
+                },
+            },
+            "error": None,
+        }, ensure_ascii=False))
+    batch["output_file_id"] = _store_file(("\n".join(lines) + "\n").encode("utf-8"), "output.jsonl", "batch_output")["id"]
+    batch["count"] = len(lines)
+    return batch["output_file_id"]
+
+
+def _openai_batch(batch: dict) -> dict:
+    done = _finished(batch)
+    output_file_id = _openai_output(batch) if done else None
+    count = batch.get("count", 0)
+    return {
+        "id": batch["id"],
+        "object": "batch",
+        "endpoint": batch["endpoint"],
+        "input_file_id": batch["input_file_id"],
+        "completion_window": batch["completion_window"],
+        "status": "completed" if done else "in_progress",
+        "created_at": int(batch["created_at"]),
+        "completed_at": int(batch["created_at"] + FAKE_BATCH_SECONDS) if done else None,
+        "output_file_id": output_file_id,
+        "error_file_id": None,
+        "request_counts": {"total": count, "completed": count if done else 0, "failed": 0},
+    }
+
+
+@app.post("/v1/files")
+async def openai_create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    return _file_object(_store_file(await file.read(), file.filename or "upload.jsonl", purpose))
+
+
+@app.get("/v1/files/{file_id}/content")
+async def openai_file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail="file not found")
+    return Response(_files[file_id]["content"], media_type="application/octet-stream")
+
+
+@app.post("/v1/batches")
+async def openai_create_batch(request: Request):
+    body = await request.json()
+    if body["input_file_id"] not in _files:
+        raise HTTPException(status_code=400, detail="unknown input_file_id")
+    batch = {
+        "id": f"batch_{uuid.uuid4().hex}",
+        "created_at": time.time(),
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+    }
+    _batches[batch["id"]] = batch
+    return _openai_batch(batch)
+
+
+@app.get("/v1/batches/{batch_id}")
+async def openai_retrieve_batch(batch_id: str):
+    if batch_id not in _batches:
+        raise HTTPException(status_code=404, detail="batch not found")
+    return _openai_batch(_batches[batch_id])
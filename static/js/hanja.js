@@ -65,7 +65,7 @@
         selectedFiles.forEach(f => formData.append('files', f));
 
         try {
-            const res = await fetch('/api/hanja/upload', { method: 'POST', body: formData });
+            const res = await fetch('/api/hanja/upload/pipelined', { method: 'POST', body: formData });
             const text = await res.text();
             if (!res.ok) {
                 let msg = '추출에 실패했습니다.';
@@ -74,11 +74,24 @@
             }
             const data = JSON.parse(text);
             currentJobId = data.job_id;
-            renderResult(data.words);
+
+            const loadingText = loadingSection.querySelector('p');
+            const job = await waitForJob(data.job_id, (j) => {
+                loadingText.textContent = `AI가 이미지를 분석 중입니다... (${j.completed_pages + j.failed_pages}/${j.total_pages})`;
+            });
+            loadingText.textContent = 'AI가 이미지를 분석 중입니다...';
+            renderResult(job.result.words);
             loadingSection.style.display = 'none';
             resultSection.style.display = 'block';
+            if (job.status === 'partial') {
+                const failed = job.pages
+                    .map((p, i) => p.status === 'failed' ? `${selectedFiles[i] ? selectedFiles[i].name : i + 1}: ${p.error}` : null)
+                    .filter(Boolean);
+                alert('일부 이미지 추출에 실패했습니다:\n' + failed.join('\n'));
+            }
         } catch (err) {
             alert('오류: ' + err.message);
+            loadingSection.querySelector('p').textContent = 'AI가 이미지를 분석 중입니다...';
             loadingSection.style.display = 'none';
             uploadSection.style.display = 'block';
         }
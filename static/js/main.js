@@ -8,6 +8,48 @@ document.querySelectorAll('.tab-btn').forEach(btn => {
     });
 });
 
+// ===== Server-Sent Events reader (fetch POST, used by upload streams) =====
+async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
+
+// ===== Background job long-poll (upload endpoints answer 202 + job_id) =====
+async function waitForJob(jobId, onProgress) {
+    let version = -1;
+    while (true) {
+        const res = await fetch(`/api/jobs/${jobId}?since=${version}&wait=25`);
+        if (!res.ok) {
+            let msg = '작업 상태를 가져오지 못했습니다.';
+            try { msg = (await res.json()).detail || msg; } catch {}
+            throw new Error(msg);
+        }
+        const job = await res.json();
+        version = job.version;
+        if (onProgress) onProgress(job);
+        if (job.status === 'failed') throw new Error(job.error || '추출에 실패했습니다.');
+        if (job.status === 'done' || job.status === 'partial') return job;
+    }
+}
+
 // ===== 단어장 (Vocab) Tab =====
 (function () {
     const dropZone = document.getElementById('vocab-drop-zone');
@@ -76,23 +118,50 @@ document.querySelectorAll('.tab-btn').forEach(btn => {
         const formData = new FormData();
         selectedFiles.forEach(f => formData.append('files', f));
 
+        // Rows are streamed (SSE) and rendered as soon as each word is extracted
+        let shown = false;
+        const showResult = () => {
+            if (shown) return;
+            shown = true;
+            loadingSection.style.display = 'none';
+            resultSection.style.display = 'block';
+        };
+        const pageErrors = [];
+
         try {
-            const res = await fetch('/api/upload', { method: 'POST', body: formData });
+            const res = await fetch('/api/upload/stream', { method: 'POST', body: formData });
             if (!res.ok) {
                 const text = await res.text();
                 let msg = '추출에 실패했습니다.';
                 try { const err = JSON.parse(text); msg = err.detail || msg; } catch { msg = text || msg; }
                 throw new Error(msg);
             }
-            const data = await res.json();
-            currentJobId = data.job_id;
-            renderResult(data.words);
-            loadingSection.style.display = 'none';
-            resultSection.style.display = 'block';
+            renderResult([]);
+            generateBtn.disabled = true;
+            await readEventStream(res, (event, data) => {
+                if (event === 'word') {
+                    showResult();
+                    addTableRow(data.word, resultBody.querySelectorAll('tr').length + 1);
+                    updateWordCount(true);
+                } else if (event === 'page_error') {
+                    pageErrors.push(`${selectedFiles[data.page] ? selectedFiles[data.page].name : data.page + 1}: ${data.detail}`);
+                } else if (event === 'done') {
+                    currentJobId = data.job_id;
+                }
+            });
+            showResult();
+            updateWordCount();
+            if (pageErrors.length) alert('일부 이미지 추출에 실패했습니다:\n' + pageErrors.join('\n'));
         } catch (err) {
             alert('오류: ' + err.message);
             loadingSection.style.display = 'none';
-            uploadSection.style.display = 'block';
+            if (shown) {
+                updateWordCount();
+            } else {
+                uploadSection.style.display = 'block';
+            }
+        } finally {
+            generateBtn.disabled = false;
         }
     });
 
@@ -126,9 +195,9 @@ document.querySelectorAll('.tab-btn').forEach(btn => {
         });
     }
 
-    function updateWordCount() {
+    function updateWordCount(streaming = false) {
         const count = resultBody.querySelectorAll('tr').length;
-        wordCount.textContent = `(${count}개)`;
+        wordCount.textContent = streaming ? `(${count}개 · 추출 중...)` : `(${count}개)`;
     }
 
     function escapeHtml(text) {
@@ -76,41 +76,38 @@
         const formData = new FormData();
         selectedFiles.forEach(f => formData.append('files', f));
 
+        // Entries are streamed (SSE); each type's table appears with its first entry
+        hasType1Data = false;
+        hasType2Data = false;
+        hasType3Data = false;
+        hasType4Data = false;
+        resultBodyType1.innerHTML = '';
+        resultBodyType2.innerHTML = '';
+        resultBodyType3.innerHTML = '';
+        resultBodyType4.innerHTML = '';
+        const pageErrors = [];
+
         try {
-            const res = await fetch('/api/workbook/upload', { method: 'POST', body: formData });
+            const res = await fetch('/api/workbook/upload/stream', { method: 'POST', body: formData });
             if (!res.ok) {
                 const text = await res.text();
                 let msg = '추출에 실패했습니다.';
                 try { const err = JSON.parse(text); msg = err.detail || msg; } catch { msg = text || msg; }
                 throw new Error(msg);
             }
-            const data = await res.json();
-            currentJobId = data.job_id;
+            await readEventStream(res, (event, data) => {
+                if (event === 'entry') {
+                    loadingSection.style.display = 'none';
+                    addStreamedEntry(data.type, data.entry);
+                } else if (event === 'page_error') {
+                    pageErrors.push(`${selectedFiles[data.page] ? selectedFiles[data.page].name : data.page + 1}: ${data.detail}`);
+                } else if (event === 'done') {
+                    currentJobId = data.job_id;
+                }
+            });
 
             loadingSection.style.display = 'none';
-
-            // Show results based on what was detected
-            hasType1Data = data.type1_entries && data.type1_entries.length > 0;
-            hasType2Data = data.type2_entries && data.type2_entries.length > 0;
-            hasType3Data = data.type3_entries && data.type3_entries.length > 0;
-            hasType4Data = data.type4_entries && data.type4_entries.length > 0;
-
-            if (hasType1Data) {
-                renderType1Result(data.type1_entries);
-                resultSectionType1.style.display = 'block';
-            }
-            if (hasType2Data) {
-                renderType2Result(data.type2_entries);
-                resultSectionType2.style.display = 'block';
-            }
-            if (hasType3Data) {
-                renderType3Result(data.type3_entries);
-                resultSectionType3.style.display = 'block';
-            }
-            if (hasType4Data) {
-                renderType4Result(data.type4_entries);
-                resultSectionType4.style.display = 'block';
-            }
+            if (pageErrors.length) alert('일부 이미지 추출에 실패했습니다:\n' + pageErrors.join('\n'));
             if (!hasType1Data && !hasType2Data && !hasType3Data && !hasType4Data) {
                 alert('이미지에서 워크북 데이터를 추출하지 못했습니다.');
                 uploadSection.style.display = 'block';
@@ -118,10 +115,36 @@
         } catch (err) {
             alert('오류: ' + err.message);
             loadingSection.style.display = 'none';
-            uploadSection.style.display = 'block';
+            if (!hasType1Data && !hasType2Data && !hasType3Data && !hasType4Data) {
+                uploadSection.style.display = 'block';
+            }
         }
     });
 
+    function addStreamedEntry(wbType, entry) {
+        if (wbType === 'type1') {
+            hasType1Data = true;
+            addType1Row(entry, resultBodyType1.querySelectorAll('tr').length + 1);
+            updateType1Count();
+            resultSectionType1.style.display = 'block';
+        } else if (wbType === 'type3') {
+            hasType3Data = true;
+            addType3Row(entry, resultBodyType3.querySelectorAll('tr').length + 1);
+            updateType3Count();
+            resultSectionType3.style.display = 'block';
+        } else if (wbType === 'type4') {
+            hasType4Data = true;
+            addType4Row(entry, resultBodyType4.querySelectorAll('tr').length + 1);
+            updateType4Count();
+            resultSectionType4.style.display = 'block';
+        } else {
+            hasType2Data = true;
+            addType2Row(entry, resultBodyType2.querySelectorAll('tr').length + 1);
+            updateType2Count();
+            resultSectionType2.style.display = 'block';
+        }
+    }
+
     // ===== Type 1: 세로 테이블 =====
     const resultBodyType1 = document.getElementById('wb-result-body-type1');
     const entryCountType1 = document.getElementById('wb-entry-count-type1');